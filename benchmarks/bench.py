@@ -0,0 +1,357 @@
+"""
+Offline micro-benchmarks for the compute and serialization hot paths.
+
+Inputs are the regression fixtures in tnc/tests/regression_data tiled out to
+`--years`, and a synthetic PET climatology, so no bucket access is needed.
+Every case runs in its own subprocess so that peak memory and numba's JIT
+state are measured per case: `*_cold` cases point NUMBA_CACHE_DIR at an empty
+directory and time the first call, compile included; the others run once to
+warm up and then time `--repeats` calls.
+
+EXAMPLES:
+>>> python benchmarks/bench.py --output bench.json
+
+>>> python benchmarks/bench.py --years 10 --case run_hspf_pervious_warm
+
+>>> python benchmarks/bench.py --output new.json --compare old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import numpy
+import pandas
+
+ROOT = Path(__file__).resolve().parent.parent
+REGRESSION_DATA = ROOT / "tnc" / "tests" / "regression_data"
+
+GRIDCELL = "R18C42"
+PERVIOUS, IMPERVIOUS = "hru010", "hru250"
+N_HRUS = 16
+
+# name -> (setup(years) -> (fn, work, unit), cold)
+Case = tuple[Callable[[int], tuple[Callable[[], object], float, str]], bool]
+CASES: dict[str, Case] = {}
+
+
+def case(name: str, cold: bool = False):
+    def register(setup):
+        CASES[name] = (setup, cold)
+        return setup
+
+    return register
+
+
+def synthetic_evap() -> pandas.DataFrame:
+    """a smooth seasonal PET climatology (mm/day) keyed like `pet.load_evap`."""
+    from tnc import pet
+
+    dates = pandas.date_range("2000-01-01", "2000-12-31", freq="D")
+    keys = pet.month_day_key(dates.month.to_numpy(), dates.day.to_numpy())
+    mm_per_day = 2.5 - 2.0 * numpy.cos(2 * numpy.pi * (dates.dayofyear - 15) / 366)
+    return (
+        pandas.DataFrame({GRIDCELL: mm_per_day}, index=keys)
+        .reindex(numpy.arange(pet.month_day_key(12, 31) + 1))
+        .astype(numpy.float64)
+    )
+
+
+def inputs(years: int):
+    """input document, siminfo, and model inputs for `years` of hourly data."""
+    from tnc import main
+    from tnc.hspf_runner import get_TNC_siminfo
+
+    siminfo = get_TNC_siminfo(
+        datetime(1980, 1, 1), datetime(1980 + years, 1, 1), "bench", GRIDCELL
+    )
+    prec = pandas.read_csv(REGRESSION_DATA / "test_inputs.csv")["PREC"].to_numpy()
+    prec = numpy.resize(prec / main.convert.MM_TO_INCH, siminfo["steps"])
+    data = {"prec": {"data": prec.tolist()}}
+
+    return data, siminfo, main.build_ts(data, siminfo)
+
+
+def hru_years(siminfo, nhrus: int = 1) -> float:
+    return nhrus * siminfo["steps"] / (24 * 365.25)
+
+
+def hru_results(years: int, hrus: list[str]):
+    from tnc.hspf_runner import run_hrus
+
+    _, siminfo, input_ts = inputs(years)
+    return run_hrus(input_ts, siminfo, hrus), siminfo
+
+
+@case("build_ts")
+def _build_ts(years):
+    from tnc import main, pet
+
+    data, siminfo, _ = inputs(years)
+
+    def fn():
+        pet._evap_array.cache_clear()
+        return main.build_ts(data, siminfo)
+
+    return fn, hru_years(siminfo), "gridcell-years"
+
+
+@case("build_evap_ts")
+def _build_evap_ts(years):
+    from tnc import pet
+
+    _, siminfo, _ = inputs(years)
+
+    def fn():
+        pet._evap_array.cache_clear()
+        return pet.build_evap_ts(siminfo)
+
+    return fn, hru_years(siminfo), "gridcell-years"
+
+
+def _run_hspf(years, hru):
+    from tnc.hspf_runner import build_numba_ts, run_hru
+
+    _, siminfo, input_ts = inputs(years)
+
+    def fn():
+        return run_hru(build_numba_ts(input_ts), siminfo, hru)
+
+    return fn, hru_years(siminfo), "hru-years"
+
+
+for _kind, _hru in (("pervious", PERVIOUS), ("impervious", IMPERVIOUS)):
+    for _cold in (False, True):
+        case(
+            f"run_hspf_{_kind}_{'cold' if _cold else 'warm'}",
+            cold=_cold,
+        )(lambda years, hru=_hru: _run_hspf(years, hru))
+
+
+@case("run_hrus_batched")
+def _run_hrus_batched(years):
+    from tnc import wwhm
+    from tnc.hspf_runner import run_hrus_batched
+
+    _, siminfo, input_ts = inputs(years)
+    hrus = list(wwhm.wwhm_hru_params())[:N_HRUS]
+
+    def fn():
+        return run_hrus_batched(input_ts, siminfo, hrus)
+
+    return fn, hru_years(siminfo, len(hrus)), "hru-years"
+
+
+@case("build_results_arrow_table")
+def _build_results_table(years):
+    from tnc import main
+
+    results, siminfo = hru_results(years, [PERVIOUS])
+    res = results[PERVIOUS]["results"]
+
+    def fn():
+        return main.build_results_arrow_table(res, {"id": "bench/results/hru"})
+
+    return fn, hru_years(siminfo), "hru-years"
+
+
+@case("serialize_parquet_hru_layout")
+def _serialize_hru(years):
+    from tnc import main, wwhm
+
+    hrus = list(wwhm.wwhm_hru_params())[:N_HRUS]
+    results, siminfo = hru_results(years, hrus)
+
+    def fn():
+        return main.serialize_results(
+            results=results, siminfo=siminfo, layout=main.Layout.hru
+        )
+
+    return fn, hru_years(siminfo, len(hrus)), "hru-years"
+
+
+@case("serialize_parquet_gridcell_layout")
+def _serialize_gridcell(years):
+    from tnc import main, wwhm
+
+    hrus = list(wwhm.wwhm_hru_params())[:N_HRUS]
+    results, siminfo = hru_results(years, hrus)
+
+    def fn():
+        return main.serialize_results(
+            results=results, siminfo=siminfo, layout=main.Layout.gridcell
+        )
+
+    return fn, hru_years(siminfo, len(hrus)), "hru-years"
+
+
+def _import(module: str):
+    """interpreter startup plus importing `module`, e.g., per `tnc` command."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (str(ROOT), env.get("PYTHONPATH")) if p
+    )
+
+    def fn():
+        subprocess.run([sys.executable, "-c", f"import {module}"], env=env, check=True)
+
+    return fn, 1, "imports"
+
+
+# the cli, for discovery commands and --help, and the worker entry point
+case("import_cli")(lambda years: _import("tnc.cli"))
+case("import_main")(lambda years: _import("tnc.main"))
+
+
+def run_case(name: str, years: int, repeats: int) -> dict:
+    """run one case in this process."""
+    from tnc import shared
+
+    setup, cold = CASES[name]
+
+    with shared.publish_tables({"evap": synthetic_evap()}) as handles:
+        shared.attach_tables(handles)
+        fn, work, unit = setup(years)
+        if not cold:
+            fn()
+        tracemalloc.start()
+        times = []
+        for _ in range(1 if cold else repeats):
+            start = perf_counter()
+            fn()
+            times.append(perf_counter() - start)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    median = statistics.median(times)
+    return {
+        "name": name,
+        "cold": cold,
+        "years": years,
+        "repeats": len(times),
+        "min_seconds": min(times),
+        "median_seconds": median,
+        "work": work,
+        "unit": unit,
+        "throughput": work / median,
+        "peak_traced_bytes": peak,
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def spawn_case(name: str, years: int, repeats: int) -> dict:
+    """run one case in a fresh interpreter, with an empty numba cache if cold."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (str(ROOT), env.get("PYTHONPATH")) if p
+    )
+    with tempfile.TemporaryDirectory() as numba_cache:
+        if CASES[name][1]:
+            env["NUMBA_CACHE_DIR"] = numba_cache
+        proc = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--case",
+                name,
+                "--years",
+                str(years),
+                "--repeats",
+                str(repeats),
+                "--in-process",
+            ],
+            env=env,
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(new: dict, old: dict) -> None:
+    """print the throughput of each case relative to an earlier report."""
+    before = {c["name"]: c for c in old["cases"]}
+    print(f"\n{'case':<36}{'old':>12}{'new':>12}{'ratio':>8}")
+    for c in new["cases"]:
+        prev = before.get(c["name"])
+        if prev is None:
+            continue
+        ratio = c["throughput"] / prev["throughput"]
+        print(
+            f"{c['name']:<36}{prev['throughput']:>12.2f}"
+            f"{c['throughput']:>12.2f}{ratio:>8.2f}"
+        )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--case", action="append", choices=sorted(CASES))
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="write the report as json.")
+    parser.add_argument("--compare", type=Path, help="earlier report to compare to.")
+    parser.add_argument("--in-process", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    names = args.case or list(CASES)
+
+    if args.in_process:
+        for name in names:
+            print(json.dumps(run_case(name, args.years, args.repeats)))
+        return
+
+    cases = []
+    for name in names:
+        result = spawn_case(name, args.years, args.repeats)
+        cases.append(result)
+        print(
+            f"{name:<36}{result['median_seconds']:>10.4f} s"
+            f"{result['throughput']:>12.2f} {result['unit']}/s"
+            f"{result['max_rss_bytes'] / 2**20:>10.1f} MiB rss"
+        )
+
+    report = {
+        "revision": revision(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "cases": cases,
+    }
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,63 @@
 import base64
+import hashlib
 import json
+import os
+from collections import OrderedDict
+from collections.abc import Iterator
 from functools import cached_property
+from pathlib import Path
 from typing import Callable
 
+import google_crc32c
 import orjson
+from google.api_core.exceptions import PreconditionFailed
 from google.cloud import storage
+from requests.adapters import HTTPAdapter
 
+from . import governor, inputs, metrics
+from .cache import DiskCache
 from .config import settings
 
 
+def _chunks(data: bytes | Path, size: int = 2**20) -> Iterator[bytes]:
+    if not isinstance(data, Path):
+        yield data
+        return
+    with open(data, "rb") as f:
+        while chunk := f.read(size):
+            yield chunk
+
+
+def crc32c(data: bytes | Path) -> str:
+    """base64 crc32c of bytes or a file, as the store reports it."""
+    checksum = google_crc32c.Checksum()
+    for chunk in _chunks(data):
+        checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode()
+
+
+def md5(data: bytes | Path) -> str:
+    """base64 md5 of bytes or a file, as the store reports it."""
+    digest = hashlib.md5()
+    for chunk in _chunks(data):
+        digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode()
+
+
+def same_content(blob, data: bytes | Path, nbytes: int) -> bool:
+    """
+    whether an existing `blob` (or None) already holds `data`, by its size and
+    then its crc32c, or md5 if it has none, so only one digest is computed.
+    """
+    if blob is None or blob.size != nbytes:
+        return False
+    if blob.crc32c:
+        return blob.crc32c == crc32c(data)
+    if blob.md5_hash:
+        return blob.md5_hash == md5(data)
+    return False
+
+
 class ClimateTSBucket(storage.Client):
     _bucket_name = "climate_ts"
 
@@ -26,9 +75,19 @@ class ClimateTSBucket(storage.Client):
             if "inputs/" in f.name
         ]
 
-    @property
-    def bucket(self):
-        return self.get_bucket(self._bucket_name)
+    @cached_property
+    def cache(self) -> DiskCache | None:
+        return DiskCache.from_settings()
+
+    @cached_property
+    def bucket(self) -> storage.Bucket:
+        # a local handle; unlike `get_bucket` this costs no metadata request
+        return storage.Bucket(self, name=self._bucket_name)
+
+    def set_pool_size(self, maxsize: int) -> None:
+        """keep up to `maxsize` https connections open for concurrent requests."""
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(maxsize, 1))
+        self._http.mount("https://", adapter)
 
     @staticmethod
     def _process_list_arg(arg: str | list[str]):
@@ -42,6 +101,10 @@ class ClimateTSBucket(storage.Client):
         model: str | list[str] | None = None,
         gridcell: str | list[str] | None = None,
     ):
+        """
+        input files of the models and gridcells, plus every shard of the
+        models; see `listing.expand_shards` for selecting gridcells of shards.
+        """
         model = model or "*"
         gridcell = gridcell or "*"
 
@@ -49,9 +112,12 @@ class ClimateTSBucket(storage.Client):
         gridcellq = self._process_list_arg(gridcell)
 
         precips = self.bucket.list_blobs(
-            match_glob=f"*{modelq}*/inputs/*{gridcellq}*input.json"
+            match_glob=f"*{modelq}*/inputs/*{gridcellq}*input.{{json,npz,parquet}}"
+        )
+        shards = self.bucket.list_blobs(
+            match_glob=f"*{modelq}*/inputs/*{inputs.SHARD_SUFFIX}"
         )
-        return [file.name for file in precips]
+        return [file.name for file in precips] + [file.name for file in shards]
 
     def get_error_files(
         self,
@@ -67,14 +133,99 @@ class ClimateTSBucket(storage.Client):
         errs = self.bucket.list_blobs(match_glob=f"*{modelq}**{gridcellq}*.error")
         return [file.name for file in errs]
 
+    @cached_property
+    def _recent(self) -> OrderedDict[tuple[str, int | None], inputs.Documents]:
+        return OrderedDict()
+
+    def _remember(self, key: tuple[str, int | None], docs: inputs.Documents):
+        """
+        keep `docs` in memory, dropping the least recently used blobs while
+        the total exceeds INPUT_MEMORY_CACHE_BYTES, but never the newest.
+        """
+        for stale in [k for k in self._recent if k[0] == key[0]]:
+            del self._recent[stale]
+        self._recent[key] = docs
+        total = sum(inputs.documents_nbytes(d) for d in self._recent.values())
+        while len(self._recent) > 1 and total > settings.INPUT_MEMORY_CACHE_BYTES:
+            _, dropped = self._recent.popitem(last=False)
+            total -= inputs.documents_nbytes(dropped)
+
+    def get_documents(self, path: str) -> inputs.Documents:
+        """
+        Decode an input blob by its extension into documents by gridcell.
+
+        Blobs are cached locally by generation, if configured, and the most
+        recently used are also kept in memory, up to INPUT_MEMORY_CACHE_BYTES,
+        so that each worker downloads and decodes a shard once even when its
+        jobs interleave gridcells of several shards.
+        """
+        blob = self.bucket.get_blob(path)
+        if blob is None:
+            raise ValueError(f"No blob at path {path}")
+
+        key = (path, blob.generation)
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            return self._recent[key]
+
+        docs = None if self.cache is None else self.cache.get(path, blob.generation)
+        if docs is None:  # pragma: no branch
+            with governor.io_slot(), metrics.timer("download") as fields:
+                raw = blob.download_as_bytes()
+                fields["bytes"] = len(raw)
+            with metrics.timer("decode"):
+                docs = inputs.loads(path, raw)
+            if self.cache is not None:
+                docs = self.cache.put(path, blob.generation, docs)
+
+        self._remember(key, docs)
+        return docs
+
+    def get_input(self, input_file: str) -> dict:
+        """the input document of an address like 'name' or 'name#gridcell'."""
+        path, gridcell = inputs.split_address(input_file)
+        return inputs.select(self.get_documents(path), gridcell)
+
     def get_json(self, path: str):
         if not path.endswith("json"):
             raise ValueError("not a json file.")
+        return self.get_input(path)
+
+    def get_meta(self, path: str) -> dict | None:  # pragma: no cover
+        """a meta document written by `send_json`, or None if there is none."""
+        with governor.io_slot(), metrics.timer("download") as fields:
+            blob = self.bucket.get_blob(path)
+            if blob is None:
+                return None
+            raw = blob.download_as_bytes()
+            fields["bytes"] = len(raw)
+        return orjson.loads(raw)
+
+    def input_version(self, input_file: str) -> str:  # pragma: no cover
+        """
+        the address of an input file with its blob's content hash, or its
+        generation if the blob has none, so unchanged re-uploads keep it.
+        """
+        path, _ = inputs.split_address(input_file)
+        with governor.io_slot():
+            blob = self.bucket.get_blob(path)
+        if blob is None:
+            raise ValueError(f"No blob at path {path}")
+        return f"{input_file}@{blob.md5_hash or blob.crc32c or blob.generation}"
+
+    def object_metadata(self, prefix: str) -> dict[str, dict]:  # pragma: no cover
+        """the custom metadata of each object under `prefix`, by name."""
+        with governor.io_slot():
+            return {
+                b.name: b.metadata or {} for b in self.bucket.list_blobs(prefix=prefix)
+            }
+
+    def open_blob(self, path: str):  # pragma: no cover
+        """seekable reader that fetches byte ranges on demand."""
         blob = self.bucket.get_blob(path)
         if blob is None:
             raise ValueError(f"No blob at path {path}")
-        blob_data = blob.download_as_bytes()
-        return orjson.loads(blob_data)
+        return blob.open("rb")
 
     def rm_blob(self, path: str):  # pragma: no cover
         blob = self.bucket.get_blob(path)
@@ -88,14 +239,59 @@ class ClimateTSBucket(storage.Client):
 
         blob.delete(if_generation_match=generation_match_precondition)
 
-    def send_parquet(self, destination_filename, data):  # pragma: no cover
-        blob = self.bucket.blob(destination_filename)
-        blob.upload_from_string(data, content_type="application/vnd.apache.parquet")
+    def upload(
+        self, name: str, data: bytes | Path, content_type: str, metadata=None
+    ) -> bool:  # pragma: no cover
+        """
+        Upload bytes, or the file at a `Path`, unless the object already holds
+        them; returns whether they were sent. Unchanged objects only have new
+        `metadata` patched. Writes are conditioned on the generation that was
+        compared, so a concurrent writer is compared again, not overwritten.
+        """
+        try:
+            return self._upload_once(name, data, content_type, metadata)
+        except PreconditionFailed:
+            # replaced since it was compared
+            return self._upload_once(name, data, content_type, metadata)
+
+    def _upload_once(
+        self, name: str, data: bytes | Path, content_type: str, metadata=None
+    ) -> bool:  # pragma: no cover
+        nbytes = data.stat().st_size if isinstance(data, Path) else len(data)
+        existing = self.bucket.get_blob(name)
+        if same_content(existing, data, nbytes):
+            if metadata and not (existing.metadata or {}).items() >= metadata.items():
+                existing.metadata = metadata
+                existing.patch(if_generation_match=existing.generation)
+            metrics.emit(metrics.transfer("upload", nbytes, skipped=True))
+            return False
+
+        blob = self.bucket.blob(name)
+        blob.metadata = metadata
+        generation = existing.generation if existing else 0
+        if isinstance(data, Path):
+            blob.upload_from_filename(
+                data, content_type=content_type, if_generation_match=generation
+            )
+        else:
+            blob.upload_from_string(
+                data, content_type=content_type, if_generation_match=generation
+            )
+        metrics.emit(metrics.transfer("upload", nbytes))
+        return True
+
+    def send_parquet(
+        self, destination_filename, data, metadata=None
+    ):  # pragma: no cover
+        """upload parquet bytes, or the file at a `Path`, with object `metadata`."""
+        self.upload(
+            destination_filename, data, "application/vnd.apache.parquet", metadata
+        )
         return destination_filename
 
     def send_json(self, destination_filename, data):  # pragma: no cover
-        blob = self.bucket.blob(destination_filename)
-        blob.upload_from_string(
+        self.upload(
+            destination_filename,
             orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY).replace(
                 b"0.0,", b"0,"
             ),
@@ -114,3 +310,34 @@ def get_client():
     )
 
     return ClimateTSBucket.from_service_account_info(sa_info)
+
+
+# long-lived clients of this process, by (pid, factory). The pid keeps a
+# forked worker from reusing its parent's connections.
+_clients: dict[tuple[int, ClientFactory], ClimateTSBucket] = {}
+
+
+def get_worker_client(
+    client_factory: ClientFactory | None = None, concurrency: int | None = None
+) -> ClimateTSBucket:
+    """
+    The one client this process uses for every input file from `client_factory`.
+
+    The first call creates the client and sizes its connection pool to
+    HTTP_POOL_SIZE, or else to `concurrency`, e.g., the number of upload
+    threads, defaulting to that of a `ThreadPoolExecutor`.
+    """
+    if client_factory is None:  # pragma: no cover
+        client_factory = get_client
+
+    key = (os.getpid(), client_factory)
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = client_factory()
+        if isinstance(client, ClimateTSBucket):
+            client.set_pool_size(
+                settings.HTTP_POOL_SIZE
+                or concurrency
+                or min(32, (os.cpu_count() or 1) + 4)
+            )
+    return client
@@ -0,0 +1,156 @@
+import hashlib
+import re
+from datetime import datetime, timezone
+from functools import cache
+from pathlib import Path
+
+import numpy
+import orjson
+import pandas
+
+from . import __version__
+from .config import settings
+
+# bumped whenever the layout of the arrays or the manifest changes
+VERSION = 1
+MANIFEST = "manifest.json"
+
+# dtype each table is stored as; PET climatology is only known to a few digits
+DTYPES = {"perlnd": "float64", "implnd": "float64", "evap": "float32"}
+
+_HRU = re.compile(r"hru\d{3}")
+
+
+def _sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def read_sources(
+    perlnd: Path | None = None, implnd: Path | None = None, evap: Path | None = None
+) -> dict[str, pandas.DataFrame]:
+    """parse the source csvs of the static tables; evap only if it exists."""
+    from . import pet, wwhm
+
+    evap = evap or settings.PET_MM_DAILY
+    tables = {
+        "perlnd": wwhm.read_wwhm_params_per(perlnd or settings.PERLND),
+        "implnd": wwhm.read_wwhm_params_imp(implnd or settings.IMPLND),
+    }
+    if evap.exists():
+        tables["evap"] = pet.read_evap(evap)
+    return tables
+
+
+def validate(tables: dict[str, pandas.DataFrame]) -> None:
+    """raise ValueError if the static tables can't be run as they are."""
+    for key in ("perlnd", "implnd"):
+        df = tables[key]
+        if df.empty or not df.index.is_unique:
+            raise ValueError(f"{key}: expected unique hrus, got {list(df.index)}.")
+        if bad := [h for h in df.index if not _HRU.fullmatch(h)]:
+            raise ValueError(f"{key}: invalid hru codes {bad}.")
+        if not numpy.isfinite(df.to_numpy(dtype=numpy.float64)).all():
+            raise ValueError(f"{key}: parameters must be finite.")
+    if bad := [h for h in tables["perlnd"].index if h[-2] == "5"]:
+        raise ValueError(f"perlnd: impervious hrus {bad}.")
+    if bad := [h for h in tables["implnd"].index if h[-2] != "5"]:
+        raise ValueError(f"implnd: pervious hrus {bad}.")
+
+    if (evap := tables.get("evap")) is not None:
+        values = evap.to_numpy(dtype=numpy.float64)
+        days = numpy.isfinite(values).sum(axis=0)
+        if (days < 365).any():
+            short = list(evap.columns[days < 365])
+            raise ValueError(f"evap: gridcells missing days of the year {short}.")
+        if (values < 0).any():
+            raise ValueError("evap: PET must not be negative.")
+
+
+def build(
+    path: Path,
+    tables: dict[str, pandas.DataFrame] | None = None,
+    sources: list[Path] | None = None,
+) -> dict:
+    """
+    Validate the static tables and write them to the directory `path` as
+    `.npy` arrays and a manifest of their index, columns, and digests.
+    Returns the manifest.
+
+    Parameters are stored hrus x params, and PET climatology gridcells x
+    `pet.month_day_key`, so each gridcell's days are contiguous on disk.
+    """
+    if tables is None:
+        tables = read_sources()
+        sources = [settings.PERLND, settings.IMPLND, settings.PET_MM_DAILY]
+    validate(tables)
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    arrays = {}
+    for key, df in tables.items():
+        evap = key == "evap"
+        values = df.to_numpy(dtype=DTYPES[key])
+        values = numpy.ascontiguousarray(values.T if evap else values)
+        numpy.save(path / f"{key}.npy", values, allow_pickle=False)
+        arrays[key] = {
+            "file": f"{key}.npy",
+            "dtype": values.dtype.str,
+            "shape": list(values.shape),
+            "index": [str(c) for c in df.columns] if evap else df.index.tolist(),
+            "columns": df.index.tolist() if evap else [str(c) for c in df.columns],
+            "names": [df.index.name, df.columns.name],
+            "sha256": _sha256(path / f"{key}.npy"),
+        }
+
+    manifest = {
+        "version": VERSION,
+        "tnc": __version__,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "sources": {p.name: _sha256(p) for p in sources or [] if p.exists()},
+        "arrays": arrays,
+    }
+    (path / MANIFEST).write_bytes(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+    return manifest
+
+
+def read_manifest(path: Path) -> dict:
+    manifest = orjson.loads((Path(path) / MANIFEST).read_bytes())
+    if manifest.get("version") != VERSION:
+        raise ValueError(
+            f"{path}: bundle version {manifest.get('version')}, expected {VERSION}; "
+            "rebuild it with `tnc bundle build`."
+        )
+    return manifest
+
+
+@cache
+def load(path: Path) -> dict[str, pandas.DataFrame]:
+    """
+    the tables of a bundle written by `build`, as read-only views onto
+    memory-mapped arrays, laid out as the csv loaders return them.
+    """
+    path = Path(path)
+    tables = {}
+    for key, spec in read_manifest(path)["arrays"].items():
+        values = numpy.load(path / spec["file"], mmap_mode="r", allow_pickle=False)
+        if list(values.shape) != spec["shape"] or values.dtype.str != spec["dtype"]:
+            raise ValueError(f"{path / spec['file']} does not match the manifest.")
+        index, columns = spec["index"], spec["columns"]
+        if key == "evap":
+            # stored transposed: one row per gridcell
+            values, index, columns = values.T, columns, index
+        # a single block, so pandas wraps the mapping rather than copying it
+        tables[key] = pandas.DataFrame(
+            values,
+            index=pandas.Index(index, name=spec["names"][0]),
+            columns=pandas.Index(columns, name=spec["names"][1]),
+            copy=False,
+        )
+    return tables
+
+
+def get_table(key: str) -> pandas.DataFrame | None:
+    """the `key` table of the bundle at `settings.STATIC_BUNDLE`, if set."""
+    if settings.STATIC_BUNDLE is None:
+        return None
+    return load(Path(settings.STATIC_BUNDLE)).get(key)
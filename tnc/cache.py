@@ -0,0 +1,182 @@
+import hashlib
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+import numpy
+import orjson
+
+from .config import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+
+_DOC_KEY = "__doc__"
+_SEP = "/"
+# part of every key; bump when the layout of cached documents changes
+_FORMAT = 3
+
+
+def _is_numeric_list(value: Any) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) > 0
+        and all(isinstance(v, int | float) and not isinstance(v, bool) for v in value)
+    )
+
+
+def _escape(key: str) -> str:
+    # as in a json pointer (RFC 6901), so keys holding the separator round-trip
+    return key.replace("~", "~0").replace(_SEP, "~1")
+
+
+def _unescape(part: str) -> str:
+    return part.replace("~1", _SEP).replace("~0", "~")
+
+
+def split_arrays(doc: dict, prefix: str = "") -> tuple[dict, dict[str, numpy.ndarray]]:
+    """
+    Pull every numeric list out of a decoded json document.
+
+    Returns the document with those lists removed and a flat mapping of
+    '/'-joined key paths to float64 arrays, with '~' and '/' in keys escaped
+    as '~0' and '~1'.
+    """
+    skeleton: dict = {}
+    arrays: dict[str, numpy.ndarray] = {}
+    for key, value in doc.items():
+        path = prefix + _escape(str(key))
+        if isinstance(value, dict):
+            skeleton[key], sub = split_arrays(value, path + _SEP)
+            arrays.update(sub)
+        elif isinstance(value, numpy.ndarray) or _is_numeric_list(value):
+            arrays[path] = numpy.asarray(value, dtype=numpy.float64)
+        else:
+            skeleton[key] = value
+    return skeleton, arrays
+
+
+def join_arrays(skeleton: dict, arrays: dict[str, numpy.ndarray]) -> dict:
+    """inverse of `split_arrays`"""
+    for path, arr in arrays.items():
+        *parents, leaf = map(_unescape, path.split(_SEP))
+        node = skeleton
+        for p in parents:
+            node = node.setdefault(p, {})
+        node[leaf] = arr
+    return skeleton
+
+
+class DiskCache:
+    """
+    Local cache of decoded input blobs, keyed on blob name and generation.
+
+    Entries are uncompressed .npz archives holding the document's numeric
+    arrays plus the rest of the document as json. Writes are atomic renames
+    and eviction holds an exclusive file lock, so several processes can share
+    one cache directory. Hits bump the entry's mtime, and eviction removes the
+    least recently used entries until the directory is under `max_bytes`.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = int(max_bytes)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls) -> "DiskCache | None":
+        if not settings.INPUT_CACHE_DIR:
+            return None
+        return cls(settings.INPUT_CACHE_DIR, settings.INPUT_CACHE_MAX_BYTES)
+
+    def path(self, name: str, generation: int | str | None) -> Path:
+        key = hashlib.sha256(f"{name}#{generation}#{_FORMAT}".encode()).hexdigest()
+        return self.directory / f"{key}.npz"
+
+    def get(self, name: str, generation: int | str | None) -> dict | None:
+        path = self.path(name, generation)
+        try:
+            with numpy.load(path, allow_pickle=False) as npz:
+                arrays = {k: npz[k] for k in npz.files}
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception:  # pragma: no cover
+            # unreadable entry; drop it and treat as a miss
+            path.unlink(missing_ok=True)
+            return None
+
+        skeleton = orjson.loads(arrays.pop(_DOC_KEY).tobytes())
+        return join_arrays(skeleton, arrays)
+
+    def put(self, name: str, generation: int | str | None, doc: dict) -> dict:
+        """cache `doc` and return it with its numeric lists as numpy arrays."""
+        skeleton, arrays = split_arrays(doc)
+
+        b = io.BytesIO()
+        numpy.savez(
+            b,
+            **arrays,
+            **{_DOC_KEY: numpy.frombuffer(orjson.dumps(skeleton), dtype=numpy.uint8)},
+        )
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(b.getbuffer())
+            os.replace(tmp, self.path(name, generation))
+        except BaseException:  # pragma: no cover
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+        self.evict()
+
+        return join_arrays(skeleton, arrays)
+
+    @contextmanager
+    def _lock(self):
+        with open(self.directory / ".lock", "a+") as f:
+            if fcntl is not None:  # pragma: no branch
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:  # pragma: no branch
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.directory.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # pragma: no cover
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self) -> list[Path]:
+        removed = []
+        with self._lock():
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed.append(path)
+        return removed
+
+    def clear(self) -> None:
+        with self._lock():
+            for _, _, path in self.entries():
+                path.unlink(missing_ok=True)
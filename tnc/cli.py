@@ -1,15 +1,22 @@
 import math
+import multiprocessing
 import os
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
 from time import perf_counter
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import typer
-from tqdm import tqdm
 from typing_extensions import Annotated
 
-from . import main, wwhm
-from .bucket import get_client
+# heavy modules (numba, HSP2, pandas, the cloud client) are imported by the
+# commands that use them, so `--help` and `find` start quickly
+from . import governor, memory, metrics
+from .schema import Layout
+
+if TYPE_CHECKING:  # pragma: no cover
+    from tqdm import tqdm
 
 N_WORKERS = max(math.ceil((os.cpu_count() or 1) * 0.5), 2)
 
@@ -53,6 +60,249 @@ NCores = Annotated[
     ),
 ]
 
+FilesPerJob = Annotated[
+    int,
+    typer.Option(
+        "--files-per-job",
+        help="number of input files each worker streams through its compute and "
+        "upload pipeline per job. Larger values overlap more uploads with compute.",
+    ),
+]
+
+OutputLayout = Annotated[
+    Layout,
+    typer.Option(
+        "--layout",
+        help="'hru' writes one parquet and meta document per hru; 'gridcell' "
+        "writes one parquet (a row group per hru) and one meta document per "
+        "input file.",
+    ),
+]
+
+ManifestPath = Annotated[
+    Optional[Path],
+    typer.Option(
+        "--manifest",
+        help="sqlite file recording which (model, gridcell, hru) results were "
+        "written and whether they succeeded. Required by --resume.",
+    ),
+]
+
+Resume = Annotated[
+    bool,
+    typer.Option(
+        "--resume",
+        help="skip (model, gridcell, hru) results the manifest records as written.",
+    ),
+]
+
+RetryFailed = Annotated[
+    bool,
+    typer.Option(
+        "--retry-failed",
+        help="only re-run the hrus that left an .error marker in the bucket.",
+    ),
+]
+
+IndexPath = Annotated[
+    Optional[Path],
+    typer.Option(
+        "--path",
+        help="sqlite listing index to refresh. Defaults to the LISTING_INDEX setting.",
+    ),
+]
+
+Force = Annotated[
+    bool,
+    typer.Option("--force", help="refresh even if the listing is not stale."),
+]
+
+BundlePath = Annotated[
+    Path,
+    typer.Argument(help="directory to write the bundle to."),
+]
+
+PetCsv = Annotated[
+    Optional[Path],
+    typer.Option(
+        "--pet-csv",
+        help="PET climatology csv (mm/day). Defaults to the PET_MM_DAILY setting.",
+    ),
+]
+
+Shard = Annotated[
+    Optional[str],
+    typer.Option(
+        "--shard",
+        help="run only shard i of N, e.g., '0/4', of the selected input files. "
+        "Every host computes the same partition, so N hosts can split a run.",
+    ),
+]
+
+WorkQueueSpec = Annotated[
+    Optional[str],
+    typer.Option(
+        "--queue",
+        help="shared directory or 'gs://bucket/prefix' that nodes claim input "
+        "files from, so that several nodes can pull work without overlap.",
+    ),
+]
+
+Samples = Annotated[
+    Path,
+    typer.Argument(
+        help="csv or parquet table of parameter samples, one row per sample, "
+        "with PERLND/IMPLND parameter columns and an optional 'sample' id column.",
+    ),
+]
+
+EnsembleInput = Annotated[
+    str,
+    typer.Option(
+        "-i",
+        "--input-file",
+        help="gridcell input to run every sample against: a local file or a blob "
+        "name, e.g., 'WRF-NARR_HIS/inputs/R18C42-input.json'.",
+    ),
+]
+
+BaseHRU = Annotated[
+    str,
+    typer.Option(
+        "-h",
+        "--hru",
+        help="hru whose WWHM parameters fill in the columns the samples omit.",
+    ),
+]
+
+Observed = Annotated[
+    Optional[Path],
+    typer.Option(
+        "--observed",
+        help="csv of date and observed daily runoff (mm) to score samples with "
+        "NSE, KGE, and percent bias.",
+    ),
+]
+
+MetricsPath = Annotated[
+    Path,
+    typer.Option("-o", "--output", help="csv or parquet of per-sample metrics."),
+]
+
+DailyPath = Annotated[
+    Optional[Path],
+    typer.Option("--daily", help="parquet of daily runoff (mm) per sample."),
+]
+
+ChunkSize = Annotated[
+    int,
+    typer.Option("--chunk-size", help="samples per task sent to a worker."),
+]
+
+NumbaCacheDir = Annotated[
+    Optional[Path],
+    typer.Option(
+        "--numba-cache-dir",
+        help="compile into this directory instead of numba's default cache, "
+        "e.g., to bake it into a container image and set NUMBA_CACHE_DIR there.",
+    ),
+]
+
+CacheDir = Annotated[
+    Optional[Path],
+    typer.Option(
+        "--cache-dir",
+        help="directory for the local cache of decoded input files. "
+        "Defaults to the INPUT_CACHE_DIR setting; the cache is off if neither is set.",
+    ),
+]
+
+ChunkYears = Annotated[
+    Optional[int],
+    typer.Option(
+        "--chunk-years",
+        min=1,
+        help="simulate each input file in chunks of this many calendar years, "
+        "carrying the hrus' states across, and spool results to disk. Bounds "
+        "worker memory for long series.",
+    ),
+]
+
+Incremental = Annotated[
+    bool,
+    typer.Option(
+        "--incremental",
+        help="simulate only the steps after each input file's previous run, from "
+        "the hru states saved in its meta documents, and upload them as new "
+        "parquet parts. Files that can't be extended are run in full.",
+    ),
+]
+
+Summaries = Annotated[
+    bool,
+    typer.Option(
+        "--summaries",
+        help="upload daily, monthly, and annual runoff totals and flow-duration "
+        "percentiles next to each results parquet, under '{model}/summaries/'.",
+    ),
+]
+
+MemoPath = Annotated[
+    Optional[Path],
+    typer.Option(
+        "--memo",
+        help="sqlite file recording the content key of each uploaded hru's "
+        "results. Hrus whose input, parameters, engine version, and options are "
+        "unchanged since their last upload are skipped.",
+    ),
+]
+
+ComputeSlots = Annotated[
+    Optional[int],
+    typer.Option(
+        "--compute-slots",
+        help="simulations running at once across all workers. "
+        "Defaults to the number of workers.",
+    ),
+]
+
+IOSlots = Annotated[
+    Optional[int],
+    typer.Option(
+        "--io-slots",
+        help="bucket downloads and uploads in flight at once across all workers. "
+        "Defaults to 4 per worker, at most 64.",
+    ),
+]
+
+MaxMemory = Annotated[
+    Optional[str],
+    typer.Option(
+        "--max-memory",
+        help="memory the run may use, e.g., '16G'. Caps the number of workers "
+        "and holds back jobs while resident memory is near it. "
+        "Defaults to 90% of available memory.",
+    ),
+]
+
+MetricsJsonl = Annotated[
+    Optional[Path],
+    typer.Option(
+        "--metrics-jsonl",
+        help="append every per-stage timing event of the workers to this JSONL file.",
+    ),
+]
+
+MetricsProm = Annotated[
+    Optional[Path],
+    typer.Option(
+        "--metrics-prom",
+        help="keep a Prometheus text-format snapshot of the run's counters and "
+        "per-stage latency histograms at this path, e.g., for node_exporter's "
+        "textfile collector.",
+    ),
+]
+
 DryRun = Annotated[
     bool,
     typer.Option(
@@ -62,17 +312,454 @@ DryRun = Annotated[
 ]
 
 
+def use_cache_dir(cache_dir: Path | None) -> None:
+    """point this process and any workers it spawns at `cache_dir`."""
+    if cache_dir is None:
+        return
+    from .config import settings
+
+    os.environ["INPUT_CACHE_DIR"] = str(cache_dir)
+    settings.INPUT_CACHE_DIR = cache_dir
+
+
+def select_work(
+    client,
+    input_files: list[str],
+    hrus: list[str],
+    *,
+    gridcell: list[str] | None = None,
+    manifest: Path | None = None,
+    resume: bool = False,
+    retry_failed: bool = False,
+    layout: Layout = Layout.hru,
+) -> dict[str, list[str]] | None:
+    """
+    the hrus still to run for each input file (see `main.plan_run`), or None
+    to run everything.
+    """
+    if resume and manifest is None:
+        raise typer.BadParameter("--resume requires --manifest.")
+    if not (resume or retry_failed):
+        return None
+    from . import main
+    from .manifest import RunManifest
+
+    error_files = None
+    if retry_failed:
+        # one listing for the whole run rather than a lookup per unit
+        models = sorted({main.parse_input_file(f)[0] for f in input_files})
+        error_files = client.get_error_files(models, gridcell)
+
+    completed = RunManifest(manifest).completed() if resume and manifest else None
+
+    return main.plan_run(
+        input_files, hrus, error_files=error_files, completed=completed, layout=layout
+    )
+
+
+def partition_work(input_files: list[str], shard: str | None = None) -> list[str]:
+    """this host's share of the input files: its `--shard`, if any."""
+    from . import workqueue
+
+    if shard is not None:
+        try:
+            index, count = workqueue.parse_shard(shard)
+        except ValueError as e:
+            raise typer.BadParameter(str(e)) from None
+        input_files = workqueue.select_shard(input_files, index, count)
+    return input_files
+
+
+def run_jobs(
+    jobs: list[list[str]],
+    *,
+    ncores: int,
+    hrus: list[str],
+    hrus_by_file: dict[str, list[str]] | None = None,
+    registry: metrics.Registry | None = None,
+    metrics_jsonl: Path | None = None,
+    metrics_prom: Path | None = None,
+    memory_limit: int | None = None,
+    job_bytes: int = 0,
+    compute_slots: int | None = None,
+    io_slots: int | None = None,
+    **kwargs,
+) -> list[tuple[float, float]]:
+    """
+    Stream each job's input files through `main.run_and_send_results_for_inputfiles`
+    on a pool of `ncores` workers. Returns (compute, upload) seconds per file.
+
+    The workers share global budgets of `compute_slots` simulations (default
+    `ncores`) and `io_slots` bucket requests (default
+    `governor.default_io_slots`), and each opens only enough upload threads
+    to use its share of the io slots.
+
+    Jobs are submitted in order as workers free up. With a `memory_limit`, a job is
+    held back while the resident memory of this process and its workers plus
+    `job_bytes` would exceed it; see `admit`.
+
+    Workers report per-stage timings to a `metrics.Collector` in this process,
+    which aggregates them into `registry`, optionally writes them to the
+    `metrics_jsonl` and `metrics_prom` files, and advances the progress bar
+    as each file finishes.
+    """
+    from tqdm import tqdm
+
+    from . import main, shared
+
+    registry = registry if registry is not None else metrics.Registry()
+    events: multiprocessing.Queue = multiprocessing.Queue()
+    io_slots = io_slots or governor.default_io_slots(ncores)
+    slots = governor.create_slots(compute_slots or ncores, io_slots)
+    upload_threads = governor.threads_per_worker(io_slots, ncores)
+    timings = []
+    with (
+        tqdm(total=sum(len(job) for job in jobs), unit="file") as progress,
+        metrics.Collector(
+            events,
+            registry,
+            jsonl=metrics_jsonl,
+            prometheus=metrics_prom,
+            on_file=lambda _: progress_update(progress, registry),
+        ),
+        shared.publish_tables() as tables,
+        ProcessPoolExecutor(
+            ncores,
+            initializer=main.init_worker,
+            initargs=(tables, True, events, slots),
+        ) as exe,
+    ):
+        pending, running = deque(jobs), set()
+        while pending or running:
+            while (
+                pending
+                and len(running) < ncores
+                and admit(len(running), memory_limit, job_bytes)
+            ):
+                job = pending.popleft()
+                running.add(
+                    exe.submit(
+                        main.run_and_send_results_for_inputfiles,
+                        input_files=job,
+                        hrus=hrus,
+                        max_workers=upload_threads,
+                        hrus_by_file=hrus_by_file and {f: hrus_by_file[f] for f in job},
+                        **kwargs,
+                    )
+                )
+
+            # process task results as they are available; the timeout
+            # rechecks memory for held back jobs while long jobs run
+            done, running = wait(running, timeout=5, return_when=FIRST_COMPLETED)
+            for future in done:
+                for _, seconds, send_time, _ in future.result():
+                    timings.append((seconds, send_time))
+
+    return timings
+
+
+def schedule(
+    client,
+    input_files: list[str],
+    hrus: list[str],
+    hrus_by_file: dict[str, list[str]] | None = None,
+    rotate: bool = False,
+) -> list[str]:
+    """
+    `input_files` longest first, with `--queue` rotated within each size so
+    nodes rarely contend for claims; see `main.longest_first`.
+    """
+    from . import main
+
+    sizes = main.input_sizes(input_files, client)
+    return main.longest_first(input_files, sizes, hrus, hrus_by_file, rotate)
+
+
+def admit(running: int, memory_limit: int | None, job_bytes: int) -> bool:
+    """
+    whether another job fits under `memory_limit` now. Always true if no job
+    is running, so a run over budget slows to one job at a time but finishes.
+    """
+    if memory_limit is None or running == 0:
+        return True
+    workers = [p.pid for p in multiprocessing.active_children() if p.pid]
+    return memory.tree_rss(workers) + job_bytes <= memory_limit
+
+
+def parse_max_memory(max_memory: str | None) -> int | None:
+    if max_memory is None:
+        return None
+    try:
+        return memory.parse_size(max_memory)
+    except ValueError as e:
+        raise typer.BadParameter(str(e)) from None
+
+
+def size_pool(
+    client,
+    input_file: str,
+    nhrus: int,
+    ncores: int,
+    max_memory: int | None = None,
+    chunk_years: int | None = None,
+) -> tuple[int, int, int]:
+    """
+    (ncores, memory limit, bytes per job) for a run whose input files are as
+    long as `input_file`, with no more workers than fit in the memory budget.
+    """
+    from . import hspf_runner, main
+
+    budget = memory.memory_budget(max_memory)
+    _, siminfo = main.get_data_and_siminfo(input_file, client=client)
+    chunk_steps = None
+    if chunk_years is not None:
+        bounds = hspf_runner.chunk_bounds(siminfo, chunk_years)
+        chunk_steps = max(stop - start for start, stop in bounds)
+    job_bytes = memory.estimate_job_bytes(
+        siminfo["steps"], nhrus, chunk_steps=chunk_steps
+    )
+    fits = memory.max_workers(budget - memory.rss(), job_bytes)
+    if fits < ncores:
+        typer.echo(
+            f"memory budget of {memory.format_size(budget)} fits {fits} workers "
+            f"of ~{memory.format_size(memory.WORKER_BASE_BYTES + job_bytes)} each."
+        )
+    return min(ncores, fits), budget, job_bytes
+
+
+def progress_update(progress: "tqdm", registry: metrics.Registry) -> None:
+    """advance by one finished file and show the run's hru throughput."""
+    progress.set_postfix_str(f"{registry.throughput():.1f} hru/s", refresh=False)
+    progress.update(1)
+
+
+def echo_summary(
+    timings: list[tuple[float, float]],
+    *,
+    tot_time: float,
+    nargs: int,
+    nhrus: int,
+    registry: metrics.Registry | None = None,
+) -> None:
+    if registry and registry.skipped_files:
+        typer.echo(f"skipped {registry.skipped_files} files held by other nodes")
+    if not timings:
+        # e.g., every input file was claimed by other nodes of a --queue run
+        typer.echo(f"no input files processed in {tot_time: 0.1f} seconds (wall)")
+        return
+    time_per_cell = tot_time / nargs
+    avg_time = sum([a + b for a, b in timings]) / len(timings)
+    avg_compute_time = sum([a for a, _ in timings]) / len(timings)
+    avg_send_time = sum([b for _, b in timings]) / len(timings)
+
+    typer.echo(f"full job [N={nargs}] took {tot_time: 0.1f} seconds (wall)")
+    typer.echo(f"avg gridcell took {avg_time: 0.2f} seconds (per core)")
+    typer.echo(f"each gridcell took {time_per_cell: 0.3f} seconds (wall)")
+    typer.echo(f"avg hru took {avg_time / nhrus: 0.3f} seconds (per core)")
+    typer.echo(f"each hru took {time_per_cell / nhrus: 0.3f} seconds (wall)")
+    typer.echo(f"avg gridcell compute time {avg_compute_time: 0.3f} seconds (wall)")
+    typer.echo(f"avg gridcell upload time {avg_send_time: 0.3f} seconds (wall)")
+
+    if registry and (registry.bytes.get("upload") or registry.skipped_bytes):
+        sent = memory.format_size(registry.bytes.get("upload", 0))
+        skipped = memory.format_size(registry.skipped_bytes.get("upload", 0))
+        typer.echo(f"uploaded {sent}, skipped {skipped} already in the bucket")
+
+    for stage, units, seconds in registry.summary() if registry else []:
+        typer.echo(
+            f"{stage:<10}{units:>9} calls {seconds: 10.1f} s total"
+            f"{1000 * seconds / units: 10.2f} ms avg (per core)"
+        )
+
+
+def run_warmup(numba_cache_dir: NumbaCacheDir = None) -> None:
+    """
+    Compile the HSPF PWater and IWater kernels against synthetic inputs and
+    report how long each took. Needs no network access.
+
+    EXAMPLES:
+    >>> tnc warmup
+
+    >>> tnc warmup --numba-cache-dir /opt/numba-cache
+    """
+    from . import warmup
+
+    if numba_cache_dir is not None:
+        timings = warmup.warmup_cache_dir(numba_cache_dir)
+    else:
+        timings = warmup.warmup()
+    for kernel, seconds in timings.items():
+        typer.echo(f"{kernel} ready in {seconds: 0.2f} seconds")
+
+
+def load_ensemble_input(input_file: str, client_factory):
+    """input series and siminfo of a local file or blob address."""
+    from . import inputs, main
+
+    path, gridcell = inputs.split_address(input_file)
+    if Path(path).exists():
+        data = inputs.read_local(input_file)
+        siminfo = main.get_siminfo(data, "local", gridcell or inputs.gridcell_of(path))
+    else:  # pragma: no cover
+        data, siminfo = main.get_data_and_siminfo(input_file, client_factory())
+    return main.build_ts(data, siminfo), siminfo
+
+
+def write_table(df, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".parquet":
+        df.to_parquet(path)
+    else:
+        df.to_csv(path)
+
+
+def run_ensemble(
+    samples_path: Path,
+    input_file: str,
+    hru: str,
+    *,
+    client_factory,
+    output: Path,
+    daily_path: Path | None = None,
+    observed_path: Path | None = None,
+    ncores: int = 1,
+    chunk_size: int = 32,
+) -> None:
+    from . import ensemble
+
+    samples = ensemble.load_samples(samples_path)
+    input_ts, siminfo = load_ensemble_input(input_file, client_factory)
+    observed = ensemble.load_observed(observed_path) if observed_path else None
+
+    start = perf_counter()
+    typer.echo(f"running {len(samples)} samples of {hru} on {ncores} cores...")
+    metrics, daily = ensemble.run_ensemble(
+        input_ts,
+        siminfo,
+        samples,
+        hru,
+        observed=observed,
+        ncores=ncores,
+        chunk_size=chunk_size,
+    )
+    typer.echo(f"took {perf_counter() - start: 0.1f} seconds (wall)")
+
+    write_table(metrics, output)
+    if daily_path is not None:
+        write_table(daily, daily_path)
+    failed = metrics["exception"].notna().sum()
+    if failed:
+        typer.echo(
+            f"{failed} of {len(metrics)} samples failed; their metrics are NaN "
+            "and the 'exception' column holds why."
+        )
+
+
+def refresh_index(
+    client, model: list[str] | None, *, path: Path | None = None, force: bool = False
+) -> None:  # pragma: no cover
+    from .listing import ListingIndex
+
+    index = ListingIndex(path) if path else ListingIndex.from_settings()
+    if index is None:
+        raise typer.BadParameter("pass --path or set LISTING_INDEX.")
+    models = {m for m in client.models for substr in model or [""] if substr in m}
+    stats = index.refresh(client, sorted(models), force=force)
+    for m, counts in stats.items():
+        typer.echo(f"{m}: {counts}")
+
+
+def create_index_app(client_factory) -> typer.Typer:
+    index_app = typer.Typer(
+        rich_markup_mode="rich", add_completion=False, no_args_is_help=True
+    )
+
+    @index_app.command("refresh")
+    def index_refresh(
+        model: Model = None, path: IndexPath = None, force: Force = False
+    ):  # pragma: no cover
+        """
+        Rescan the input files of each model whose listing is older than
+        LISTING_INDEX_TTL seconds, or of every model with --force.
+
+        EXAMPLES:
+        >>> tnc index refresh
+
+        >>> tnc index refresh -m HIS --force --path ~/.cache/tnc/listing.sqlite
+        """
+        refresh_index(client_factory(), model, path=path, force=force)
+
+    return index_app
+
+
+def build_bundle(path: Path, pet_csv: Path | None = None) -> None:
+    from . import bundle
+    from .config import settings
+
+    sources = [settings.PERLND, settings.IMPLND, pet_csv or settings.PET_MM_DAILY]
+    try:
+        tables = bundle.read_sources(evap=sources[-1])
+        manifest = bundle.build(path, tables, sources)
+    except ValueError as e:
+        raise typer.BadParameter(str(e)) from e
+    for key, spec in manifest["arrays"].items():
+        typer.echo(f"{key}: {spec['shape']} {spec['dtype']}")
+    typer.echo(f"set STATIC_BUNDLE={path} to use it.")
+
+
+def create_bundle_app() -> typer.Typer:
+    bundle_app = typer.Typer(
+        rich_markup_mode="rich", add_completion=False, no_args_is_help=True
+    )
+
+    @bundle_app.command("build")
+    def bundle_build(path: BundlePath, pet_csv: PetCsv = None):
+        """
+        Validate the WWHM hru parameters and PET climatology and compile them
+        into a versioned directory of arrays that workers memory-map at startup
+        instead of parsing the csvs. Used when STATIC_BUNDLE is set.
+
+        EXAMPLES:
+        >>> tnc bundle build ~/.cache/tnc/bundle
+
+        >>> tnc bundle build bundle --pet-csv pet_mm_daily.csv
+        """
+        build_bundle(path, pet_csv)
+
+    return bundle_app
+
+
+def default_client():  # pragma: no cover
+    """`bucket.get_client`, imported only once a command needs the bucket."""
+    from .bucket import get_client
+
+    return get_client()
+
+
 def create_app(client_factory=None):
     if client_factory is None:  # pragma: no cover
-        client_factory = get_client
+        client_factory = default_client
 
     app = typer.Typer(
         rich_markup_mode="rich", add_completion=False, no_args_is_help=True
     )
 
+    app.add_typer(
+        create_index_app(client_factory),
+        name="index",
+        help="manage the local listing index of input files.",
+    )
+    app.add_typer(
+        create_bundle_app(),
+        name="bundle",
+        help="compile the static parameter and PET tables.",
+    )
+
     @app.command()
     def find(model: Model = None, gridcell: GridCell = None):
-        args = main.gather_args(model, gridcell, client=client_factory())
+        from .listing import gather_args
+
+        args = gather_args(model, gridcell, client=client_factory())
         nargs = len(args)
 
         if nargs > 0:  # pragma: no cover
@@ -80,12 +767,64 @@ def create_app(client_factory=None):
         for dct in args:
             typer.echo(dct["input_file"])
 
+    app.command("warmup")(run_warmup)
+
+    @app.command("ensemble")
+    def ensemble_(
+        samples: Samples,
+        input_file: EnsembleInput,
+        hru: BaseHRU,
+        output: MetricsPath = Path("ensemble.csv"),
+        daily: DailyPath = None,
+        observed: Observed = None,
+        ncores: NCores = N_WORKERS,
+        chunk_size: ChunkSize = 32,
+    ):
+        """
+        Run one gridcell's input with every parameter sample and write summary
+        metrics per sample instead of hourly results.
+
+        EXAMPLES:
+        >>> tnc ensemble samples.csv -i WRF-NARR_HIS/inputs/R18C42-input.json -h hru010
+
+        >>> tnc ensemble samples.csv -i R18C42-input.json -h hru010 \\
+        ...     --observed gauge.csv -o metrics.parquet --daily daily.parquet
+        """
+        run_ensemble(
+            samples,
+            input_file,
+            hru,
+            client_factory=client_factory,
+            output=output,
+            daily_path=daily,
+            observed_path=observed,
+            ncores=ncores,
+            chunk_size=chunk_size,
+        )
+
     @app.command()
     def run(
         model: Model,
         gridcell: GridCell = None,
         hrus: HRUs = None,
         ncores: NCores = N_WORKERS,
+        files_per_job: FilesPerJob = 4,
+        layout: OutputLayout = Layout.hru,
+        manifest: ManifestPath = None,
+        resume: Resume = False,
+        retry_failed: RetryFailed = False,
+        cache_dir: CacheDir = None,
+        shard: Shard = None,
+        queue: WorkQueueSpec = None,
+        metrics_jsonl: MetricsJsonl = None,
+        metrics_prom: MetricsProm = None,
+        max_memory: MaxMemory = None,
+        compute_slots: ComputeSlots = None,
+        io_slots: IOSlots = None,
+        chunk_years: ChunkYears = None,
+        incremental: Incremental = False,
+        summaries: Summaries = False,
+        memo: MemoPath = None,
     ):
         """
         Run the HSPF IWater and PWater routines for the selected Precip & PET files
@@ -97,62 +836,114 @@ def create_app(client_factory=None):
         >>> tnc run -m HIS -m NARR -g R17 -g C42
 
         >>> tnc run -m HIS -g R17C42 -h hru250
-        """
-        client = client_factory()
-        args = main.gather_args(model, gridcell, client=client)
-        if hrus is None:  # pragma: no cover
-            hrus = list(wwhm.wwhm_hru_params().keys())
 
-        data, siminfo = main.get_data_and_siminfo(**args[0], client=client)
-        # fully prime the numba cache by running a perv and imp hru
-        main.run_one_datafile(data=data, siminfo=siminfo, hrus=["hru000", "hru252"])
+        >>> tnc run -m HIS --layout gridcell
 
-        nargs = len(args)
-        ncores = min(ncores, nargs)
+        >>> tnc run -m HIS --manifest run.sqlite --resume
 
-        timings = []
-        start = perf_counter()
+        >>> tnc run -m HIS --retry-failed
 
-        with ProcessPoolExecutor(ncores) as exe:
-            typer.echo(f"starting {ncores} parallel workers to do {nargs} jobs...")
+        >>> tnc run -m HIS --cache-dir ~/.cache/tnc
 
-            with tqdm(total=nargs) as progress:
-                # submit tasks and collect futures
-                futures = []
+        >>> tnc run -m HIS --shard 0/4
 
-                for kwargs in args:
-                    future = exe.submit(
-                        main.run_and_send_results_for_one_inputfile,
-                        **kwargs,
-                        hrus=hrus,
-                        max_workers=ncores,
-                        client_factory=client_factory,
-                    )
+        >>> tnc run -m HIS --queue /mnt/shared/his-queue
 
-                    future.add_done_callback(lambda p: progress.update())
-                    futures.append(future)
+        >>> tnc run -m HIS --metrics-jsonl events.jsonl --metrics-prom tnc.prom
 
-                # process task results as they are available
-                for future in as_completed(futures):
-                    _, seconds, send_time, completed = future.result()
-                    timings.append((seconds, send_time))
+        >>> tnc run -m HIS --max-memory 16G
+
+        >>> tnc run -m HIS -n 10 --compute-slots 8 --io-slots 32
+
+        >>> tnc run -m HIS --chunk-years 10
+
+        >>> tnc run -m HIS --incremental
+
+        >>> tnc run -m HIS --summaries
+
+        >>> tnc run -m HIS --memo memo.sqlite
+        """
+        from . import warmup, wwhm
+        from .listing import gather_args
+
+        use_cache_dir(cache_dir)
+        max_memory_bytes = parse_max_memory(max_memory)
+        client = client_factory()
+        args = gather_args(model, gridcell, client=client)
+        if hrus is None:  # pragma: no cover
+            hrus = list(wwhm.wwhm_hru_params().keys())
+
+        # compile once here so each worker's priming loads the on-disk cache
+        warmup.warmup()
+
+        input_files = [kwargs["input_file"] for kwargs in args]
+        hrus_by_file = select_work(
+            client,
+            input_files,
+            hrus,
+            gridcell=gridcell,
+            manifest=manifest,
+            resume=resume,
+            retry_failed=retry_failed,
+            layout=layout,
+        )
+        if hrus_by_file is not None:
+            input_files = list(hrus_by_file)
+        input_files = partition_work(input_files, shard)
+        if not input_files:
+            typer.echo("nothing to do.")
+            return
+        input_files = schedule(
+            client, input_files, hrus, hrus_by_file, rotate=queue is not None
+        )
+
+        nargs = len(input_files)
+        step = max(files_per_job, 1)
+        jobs = [input_files[i : i + step] for i in range(0, nargs, step)]
+        ncores, memory_limit, job_bytes = size_pool(
+            client,
+            input_files[0],
+            len(hrus),
+            min(ncores, len(jobs)),
+            max_memory_bytes,
+            chunk_years,
+        )
+
+        start = perf_counter()
+        registry = metrics.Registry()
+
+        typer.echo(f"starting {ncores} parallel workers to do {nargs} jobs...")
+        timings = run_jobs(
+            jobs,
+            ncores=ncores,
+            hrus=hrus,
+            hrus_by_file=hrus_by_file,
+            client_factory=client_factory,
+            layout=layout,
+            manifest_path=manifest,
+            work_queue=queue,
+            registry=registry,
+            metrics_jsonl=metrics_jsonl,
+            metrics_prom=metrics_prom,
+            memory_limit=memory_limit,
+            job_bytes=job_bytes,
+            compute_slots=compute_slots,
+            io_slots=io_slots,
+            chunk_years=chunk_years,
+            incremental=incremental,
+            summaries=summaries,
+            memo_path=memo,
+        )
 
         end_all = perf_counter()
 
-        tot_time = end_all - start
-        time_per_cell = tot_time / len(args)
-        avg_time = sum([a + b for a, b in timings]) / len(timings)
-        avg_compute_time = sum([a for a, _ in timings]) / len(timings)
-        avg_send_time = sum([b for _, b in timings]) / len(timings)
-
-        typer.echo(f"full job [N={nargs}] took {tot_time: 0.1f} seconds (wall)")
-        typer.echo(f"avg gridcell took {avg_time: 0.2f} seconds (per core)")
-        typer.echo(f"each gridcell took {time_per_cell: 0.3f} seconds (wall)")
-        typer.echo(f"avg hru took {avg_time / len(hrus): 0.3f} seconds (per core)")
-        typer.echo(f"each hru took {time_per_cell / len(hrus): 0.3f} seconds (wall)")
-        typer.echo(f"avg gridcell compute time {avg_compute_time: 0.3f} seconds (wall)")
-        typer.echo(f"avg gridcell upload time {avg_send_time: 0.3f} seconds (wall)")
-        # typer.echo([(round(a, 3), round(b, 3)) for a, b in timings])
+        echo_summary(
+            timings,
+            tot_time=end_all - start,
+            nargs=nargs,
+            nhrus=len(hrus),
+            registry=registry,
+        )
 
     return app
 
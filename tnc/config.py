@@ -8,7 +8,15 @@ class Settings(BaseSettings):
     IMPLND: Path = Path(__file__).resolve().parent / "data" / "WWHM_IMPLNDs.csv"
     TEMP_EVAP: Path = Path(__file__).resolve().parent / "data" / "_temp_evap.csv"
     PET_MM_DAILY: Path = Path(__file__).resolve().parent / "data" / "pet_mm_daily.csv"
+    STATIC_BUNDLE: Path | None = None
     GOOGLE_APPLICATION_CREDENTIALS_JSON: str = ""
+    INPUT_CACHE_DIR: Path | None = None
+    INPUT_CACHE_MAX_BYTES: int = 4 * 1024**3
+    INPUT_MEMORY_CACHE_BYTES: int = 512 * 1024**2
+    LISTING_INDEX: Path | None = None
+    LISTING_INDEX_TTL: float = 3600
+    HTTP_POOL_SIZE: int | None = None
+    WORK_QUEUE_LEASE_SECONDS: float = 900
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
 
@@ -0,0 +1,248 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy
+import pandas
+
+from . import convert, shared, wwhm
+from .hspf_runner import (
+    OUTPUTS,
+    InputTS,
+    SimInfo,
+    get_kernel,
+    hour_index,
+    is_impervious,
+    run_param_matrix,
+)
+from .main import init_worker
+
+SAMPLE = "sample"
+_INPUTS_KEY = "ensemble_inputs"
+
+# writable copies of the shared inputs made in this process, by table key,
+# with the table they were copied from
+_writable: dict[str, tuple[pandas.DataFrame, InputTS]] = {}
+
+
+def load_samples(path: str | Path) -> pandas.DataFrame:
+    """
+    Parameter samples from a csv or parquet table with one row per sample.
+
+    Columns are PERLND or IMPLND parameter names, e.g., LZSN or INFILT, plus
+    an optional `sample` id column; ids default to the row number.
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        samples = pandas.read_parquet(path)
+    else:
+        samples = pandas.read_csv(path)
+    if SAMPLE not in samples.columns:
+        samples.insert(0, SAMPLE, numpy.arange(len(samples)))
+    return samples.set_index(SAMPLE)
+
+
+def sample_matrix(
+    samples: pandas.DataFrame, base_hru: str
+) -> tuple[list[str], numpy.ndarray]:
+    """
+    Parameter matrix (samples x params) of `base_hru`'s WWHM parameters with
+    each sample's columns substituted.
+    """
+    columns, base = wwhm.wwhm_param_matrix([base_hru])
+    unknown = set(samples.columns) - set(columns)
+    if unknown:
+        kind = "IMPLND" if is_impervious(base_hru) else "PERLND"
+        raise ValueError(f"not {kind} parameters: {sorted(unknown)}")
+
+    params = numpy.repeat(base, len(samples), axis=0)
+    for col in samples.columns:
+        params[:, columns.index(col)] = samples[col].to_numpy(dtype=numpy.float64)
+    return columns, params
+
+
+def load_observed(path: str | Path) -> pandas.Series:
+    """daily observed runoff depth (mm) from a two column csv of date, value."""
+    observed = pandas.read_csv(path, index_col=0, parse_dates=True).iloc[:, 0]
+    observed.index = observed.index.normalize()
+    return observed.astype(numpy.float64)
+
+
+def simulation_days(siminfo: SimInfo) -> tuple[pandas.DatetimeIndex, numpy.ndarray]:
+    """the dates touched by the simulation and the first step of each."""
+    day = hour_index(siminfo).astype(numpy.int64) // 24
+    starts = numpy.flatnonzero(numpy.diff(day, prepend=-1))
+    dates = pandas.to_datetime(day[starts], unit="D")
+    return dates, starts
+
+
+def goodness_of_fit(sim: numpy.ndarray, obs: numpy.ndarray) -> dict[str, numpy.ndarray]:
+    """NSE, KGE, and percent bias of each row of `sim` against `obs`, skipping NaN."""
+    valid = ~numpy.isnan(obs)
+    sim, obs = sim[:, valid].astype(numpy.float64), obs[valid]
+    if obs.size < 2:
+        nan = numpy.full(len(sim), numpy.nan)
+        return {"nse": nan, "kge": nan, "pbias": nan}
+
+    err = sim - obs
+    nse = 1 - (err**2).sum(axis=1) / ((obs - obs.mean()) ** 2).sum()
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        r = numpy.array([numpy.corrcoef(s, obs)[0, 1] for s in sim])
+    alpha = sim.std(axis=1) / obs.std()
+    beta = sim.mean(axis=1) / obs.mean()
+    kge = 1 - numpy.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2)
+
+    pbias = 100 * err.sum(axis=1) / obs.sum()
+    return {"nse": nse, "kge": kge, "pbias": pbias}
+
+
+def summarize(
+    batch: dict,
+    siminfo: SimInfo,
+    precip_mm: float,
+    starts: numpy.ndarray,
+    observed: numpy.ndarray | None = None,
+) -> tuple[dict[str, numpy.ndarray], numpy.ndarray]:
+    """
+    per-sample metrics and daily total runoff (mm) as float32 (samples, days)
+    of a single gridcell batch. Both are NaN for samples whose run failed,
+    rather than the zeros their outputs are left at.
+    """
+    years = siminfo["steps"] / (24 * 365.25)
+    metrics = {
+        f"{k}_mm": batch[k][0].sum(axis=1, dtype=numpy.float64) * convert.INCH_TO_MM
+        for k in OUTPUTS
+    }
+    runoff = sum(metrics[f"{k}_mm"] for k in OUTPUTS)
+    hourly = sum(batch[k][0].astype(numpy.float64) for k in OUTPUTS) * (
+        convert.INCH_TO_MM
+    )
+    daily = numpy.add.reduceat(hourly, starts, axis=1).astype(numpy.float32)
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        metrics |= {
+            "runoff_mm": runoff,
+            "mean_annual_runoff_mm": runoff / years,
+            "peak_hourly_mm": hourly.max(axis=1),
+            "runoff_ratio": runoff / precip_mm,
+        }
+    if observed is not None:
+        metrics |= goodness_of_fit(daily, observed)
+
+    failed = numpy.array([e is not None for e in batch["exception"][0]], dtype=bool)
+    for values in metrics.values():
+        values[failed] = numpy.nan
+    daily[failed] = numpy.nan
+    return metrics, daily
+
+
+def _run_chunk(
+    columns: list[str],
+    params: numpy.ndarray,
+    siminfo: SimInfo,
+    base_hru: str,
+    observed: numpy.ndarray | None,
+):
+    """evaluate one chunk of samples against the shared inputs of this process."""
+    input_ts = _writable_inputs(_INPUTS_KEY)
+    return evaluate(input_ts, siminfo, columns, params, base_hru, observed)
+
+
+def _writable_inputs(key: str) -> InputTS:
+    """
+    writable copies of the shared input table `key`, made once per process and
+    reused by each of its chunks; the kernels only read them.
+    """
+    table = shared.get_table(key)
+    cached = _writable.get(key)
+    if cached is None or cached[0] is not table:
+        # the kernels' typed dicts cannot hold read-only arrays
+        input_ts = {k: numpy.array(table[k]) for k in ("PREC", "PETINP")}
+        cached = _writable[key] = (table, input_ts)
+    return cached[1]
+
+
+def evaluate(
+    input_ts: InputTS,
+    siminfo: SimInfo,
+    columns: list[str],
+    params: numpy.ndarray,
+    base_hru: str,
+    observed: numpy.ndarray | None = None,
+) -> tuple[dict[str, numpy.ndarray], numpy.ndarray, list[str | None]]:
+    """run and summarize a parameter matrix in this process."""
+    batch = run_param_matrix(
+        input_ts, siminfo, params, columns, func=get_kernel(base_hru)
+    )
+    _, starts = simulation_days(siminfo)
+    precip_mm = float(input_ts["PREC"][: siminfo["steps"]].sum()) * convert.INCH_TO_MM
+    metrics, daily = summarize(batch, siminfo, precip_mm, starts, observed)
+    return metrics, daily, batch["exception"][0]
+
+
+def run_ensemble(
+    input_ts: InputTS,
+    siminfo: SimInfo,
+    samples: pandas.DataFrame,
+    base_hru: str,
+    *,
+    observed: pandas.Series | None = None,
+    ncores: int = 1,
+    chunk_size: int = 32,
+) -> tuple[pandas.DataFrame, pandas.DataFrame]:
+    """
+    Run every parameter sample against one gridcell's inputs.
+
+    Samples are split into chunks of `chunk_size` and evaluated on `ncores`
+    worker processes. The input series are published once in shared memory
+    and only parameters and summaries cross process boundaries.
+
+    Returns per-sample metrics and daily runoff (mm) with one row per sample,
+    both indexed like `samples`. With `observed` daily runoff, the metrics
+    also include NSE, KGE, and percent bias. Samples that failed have NaN
+    metrics and runoff and their traceback in the `exception` column.
+    """
+    columns, params = sample_matrix(samples, base_hru)
+    dates, _ = simulation_days(siminfo)
+    obs = None
+    if observed is not None:
+        obs = observed.reindex(dates).to_numpy(dtype=numpy.float64)
+
+    chunks = [params[i : i + chunk_size] for i in range(0, len(params), chunk_size)]
+    if ncores <= 1:
+        parts = [
+            evaluate(input_ts, siminfo, columns, chunk, base_hru, obs)
+            for chunk in chunks
+        ]
+    else:
+        parts = _run_parallel(input_ts, siminfo, columns, chunks, base_hru, obs, ncores)
+
+    metrics = pandas.DataFrame(
+        {k: numpy.concatenate([m[k] for m, _, _ in parts]) for k in parts[0][0]},
+        index=samples.index,
+    )
+    metrics["exception"] = [e for _, _, exc in parts for e in exc]
+    daily = pandas.DataFrame(
+        numpy.concatenate([d for _, d, _ in parts]),
+        index=samples.index,
+        columns=dates.strftime("%Y-%m-%d"),
+    )
+    return metrics, daily
+
+
+def _run_parallel(input_ts, siminfo, columns, chunks, base_hru, obs, ncores):
+    steps = siminfo["steps"]
+    frame = pandas.DataFrame({k: input_ts[k][:steps] for k in ("PREC", "PETINP")})
+    tables = shared.load_static_tables() | {_INPUTS_KEY: frame}
+
+    with (
+        shared.publish_tables(tables) as handles,
+        ProcessPoolExecutor(
+            ncores, initializer=init_worker, initargs=(handles, True)
+        ) as exe,
+    ):
+        futures = [
+            exe.submit(_run_chunk, columns, chunk, siminfo, base_hru, obs)
+            for chunk in chunks
+        ]
+        return [f.result() for f in futures]
@@ -0,0 +1,81 @@
+import math
+import multiprocessing
+from collections.abc import Iterator
+from contextlib import contextmanager
+from multiprocessing.synchronize import Semaphore
+from typing import NamedTuple
+
+from . import metrics
+
+
+class Slots(NamedTuple):
+    """semaphores shared by every worker of a run; see `create_slots`."""
+
+    compute: Semaphore
+    io: Semaphore
+
+
+# the slots of this process, installed by `main.init_worker`; none means
+# unlimited, e.g., in the parent or when a function is called directly
+_slots: Slots | None = None
+
+
+def create_slots(compute: int, io: int) -> Slots:
+    """
+    Global budgets of `compute` simulations and `io` bucket requests running
+    at once, across every process they are passed to at startup.
+    """
+    return Slots(
+        multiprocessing.BoundedSemaphore(max(compute, 1)),
+        multiprocessing.BoundedSemaphore(max(io, 1)),
+    )
+
+
+def default_io_slots(ncores: int) -> int:
+    # uploads are small, latency-bound requests; this is what each worker
+    # used to open on its own, capped well below ncores**2
+    return min(4 * ncores, 64)
+
+
+def threads_per_worker(io_slots: int, workers: int) -> int:
+    """
+    upload threads for each worker: enough to use twice its share of the io
+    slots while other workers are computing. Threads beyond the free slots
+    just wait.
+    """
+    return max(2 * math.ceil(io_slots / max(workers, 1)), 1)
+
+
+def install(slots: Slots | None) -> None:
+    global _slots
+    _slots = slots
+
+
+@contextmanager
+def _hold(semaphore: Semaphore, wait_stage: str) -> Iterator[None]:
+    with metrics.timer(wait_stage):
+        semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+@contextmanager
+def compute_slot() -> Iterator[None]:
+    """hold one of the run's compute slots, if any, for the block."""
+    if _slots is None:
+        yield
+        return
+    with _hold(_slots.compute, "compute_wait"):
+        yield
+
+
+@contextmanager
+def io_slot() -> Iterator[None]:
+    """hold one of the run's io slots, if any, for the block."""
+    if _slots is None:
+        yield
+        return
+    with _hold(_slots.io, "io_wait"):
+        yield
@@ -1,30 +1,80 @@
 import traceback as tb
+from collections.abc import Iterator
 from datetime import datetime
-from typing import Any, cast
+from typing import Any, NamedTuple, cast
 
 import numpy
 import pandas
-from HSP2.IWATER import iwater
-from HSP2.PWATER import pwater
-from numba import types
-from numba.typed import Dict
+from HSP2.IWATER import ERRMSGS as IWATER_ERRMSGS
+from HSP2.IWATER import _iwater_, iwater
+from HSP2.PWATER import ERRMSGS as PWATER_ERRMSGS
+from HSP2.PWATER import _pwater_, pwater
+from numba import njit, types
+from numba.typed import Dict, List
 from pydantic import TypeAdapter
-from typing_extensions import TypedDict
 
-from . import wwhm
+from . import metrics, wwhm
+from .schema import SimInfo
 
+InputTS = dict[str, numpy.ndarray]
 
-class SimInfo(TypedDict):
-    start: datetime
-    stop: datetime
-    delt: int
-    steps: int
-    units: int
-    model: str
-    gridcell: str
 
+OUTPUTS = ("SURO", "AGWO", "IFWO")
 
-InputTS = dict[str, numpy.ndarray]
+# storages each kernel carries from one step to the next, which are also the
+# names of their initial conditions among the hru parameters
+STATES = {
+    pwater: ("CEPS", "SURS", "UZS", "IFWS", "LZS", "AGWS", "GWVS"),
+    iwater: ("RETS", "SURS"),
+}
+
+# hour of the day at which each kernel can start from saved states. HSP2
+# refreshes some routing factors on a run's first step only at these hours
+# (or on January 1 00:00) and leaves them undefined until the next otherwise.
+RESUME_HOUR = {pwater: 0, iwater: 1}
+
+
+class Core(NamedTuple):
+    """
+    How a kernel's public wrapper sets up a run of its njit core, for ucis of
+    `PARAMETERS` only (see `build_uci`) and hourly steps: the series it fills
+    with zeros, with nans, and with constant parameters, the hour of each of
+    its flag series (None for every hour), and its error messages.
+    """
+
+    code: int
+    zeros: tuple[str, ...]
+    nans: tuple[str, ...]
+    constants: tuple[str, ...]
+    flags: dict[str, int | None]
+    messages: tuple[str, ...]
+    ui: dict[str, float]
+
+
+CORES = {
+    pwater: Core(
+        code=0,
+        zeros=("AGWLI", "IFWLI", "LGTMP", "LZLI", "SURLI", "UZLI"),
+        nans=("AIRTMP", "PACKI", "RAINF", "SNOCOV", "WYIELD"),
+        constants=(
+            *("AGWRC", "DEEPFR", "INFILT", "KVARY", "LZSN", "PETMIN", "PETMAX"),
+            *("LZETP", "CEPSC", "INTFW", "IRC", "NSUR", "UZSN"),
+        ),
+        flags={"DAYFG": 0, "HRFG": None},
+        messages=PWATER_ERRMSGS,
+        ui={"ICEFG": 0.0},
+    ),
+    iwater: Core(
+        code=1,
+        zeros=("SURLI",),
+        nans=("AIRTMP", "RAINF", "SNOCOV", "WYIELD"),
+        constants=("PETMAX", "PETMIN", "RETSC", "NSUR"),
+        flags={"HR1FG": 1, "HRFG": None},
+        messages=IWATER_ERRMSGS,
+        ui={},
+    ),
+}
+EPOCH = pandas.Timestamp("1970-01-01 00:00:00")
 
 
 siminfo_validator = TypeAdapter(SimInfo)
@@ -60,25 +110,42 @@ def build_uci(params: dict) -> dict:
     return {"PARAMETERS": params}
 
 
+def is_impervious(hru: str) -> bool:
+    return hru[-2:-1] == "5"
+
+
+def get_kernel(hru: str):
+    return iwater if is_impervious(hru) else pwater
+
+
+def hour_index(siminfo: SimInfo) -> numpy.ndarray:
+    """hours since the unix epoch for each simulation step."""
+    ixi = cast(
+        int, (pandas.Timestamp(siminfo["start"]) - EPOCH) // pandas.Timedelta("1h")
+    )
+    ixe = ixi + siminfo["steps"]
+    return numpy.arange(ixi, ixe, dtype=numpy.uint32)
+
+
+@njit(cache=True)
+def round_into(src, precision, out):
+    """out[:] = numpy.round(src[:len(out)], precision), cast to out's dtype."""
+    factor = 10.0**precision
+    for i in range(out.shape[0]):
+        out[i] = numpy.rint(src[i] * factor) / factor
+
+
 def run_hspf(*, siminfo: SimInfo, uci, ts, func=iwater, precision=4):
     """
     ts: mutable numba.typed.Dict
     """
     errors, msgs = func(None, siminfo=siminfo, uci=uci, ts=ts)
-    zeros = numpy.zeros(siminfo["steps"])
-    dix = pandas.date_range(
-        start=pandas.Timestamp("1970-01-01 00:00:00"),
-        end=siminfo["stop"],
-        freq="1h",
-    )
-    ixi = cast(int, dix.get_loc(siminfo["start"]))
-    ixe = ixi + siminfo["steps"]
-    results = {
-        "ix": numpy.arange(ixi, ixe, dtype=numpy.uint32),
-        "SURO": (zeros + ts.get("SURO", zeros).round(precision)).astype(numpy.float32),
-        "AGWO": (zeros + ts.get("AGWO", zeros).round(precision)).astype(numpy.float32),
-        "IFWO": (zeros + ts.get("IFWO", zeros).round(precision)).astype(numpy.float32),
-    }
+    results: dict[str, numpy.ndarray] = {"ix": hour_index(siminfo)}
+    for k in OUTPUTS:
+        # outputs a kernel does not produce, e.g., AGWO of iwater, are zeros
+        results[k] = numpy.zeros(siminfo["steps"], dtype=numpy.float32)
+        if k in ts:
+            round_into(ts[k], precision, results[k])
 
     return results, errors, msgs
 
@@ -87,10 +154,11 @@ def run_hru(ts, siminfo: SimInfo, hru: str) -> dict:
     """
     ts: mutable numba.typed.Dict
     """
-    params = wwhm.wwhm_hru_params()[hru]
+    # copied because the kernels may write flags back into the uci
+    params = dict(wwhm.wwhm_hru_params()[hru])
 
     uci = build_uci(params)
-    func = pwater if hru[-2:-1] != "5" else iwater
+    func = get_kernel(hru)
     try:
         results, errors, msgs = run_hspf(siminfo=siminfo, uci=uci, ts=ts, func=func)
         exception = None
@@ -120,3 +188,395 @@ def run_hrus(
         ts = build_numba_ts(input_ts)  # this must be built for each hru; it's mutable
         all_hru_results[hru] = run_hru(ts, siminfo, hru)
     return all_hru_results
+
+
+def core_setup(
+    func, siminfo: SimInfo, rows: list[dict[str, float]]
+) -> tuple[List, List]:
+    """
+    The ui dict and the series other than PREC and PETINP that `func`'s
+    wrapper would pass its njit core for each row of parameters; the series
+    are shared by every gridcell, since the cores don't write to their inputs.
+    """
+    core = CORES[func]
+    steps = siminfo["steps"]
+    hours = hour_index(siminfo) % 24
+    shared = {k: numpy.zeros(steps) for k in core.zeros}
+    shared |= {k: numpy.full(steps, numpy.nan) for k in core.nans}
+    for name, hour in core.flags.items():
+        flag = numpy.ones(steps) if hour is None else (hours == hour).astype(float)
+        flag[0] = 1.0
+        shared[name] = flag
+
+    uis, templates = List(), List()
+    for row in rows:
+        ui = Dict.empty(key_type=types.unicode_type, value_type=types.float64)
+        for k, v in {**row, **core.ui}.items():
+            ui[k] = float(v)
+        ui["steps"] = steps
+        ui["delt"] = siminfo["delt"]
+        ui["errlen"] = len(core.messages)
+        ui["uunits"] = siminfo["units"]
+        uis.append(ui)
+
+        ts = Dict.empty(key_type=types.unicode_type, value_type=types.float64[:])
+        ts.update(shared)
+        for k in core.constants:
+            if k in row:
+                ts[k] = numpy.full(steps, row[k])
+        templates.append(ts)
+    return uis, templates
+
+
+@njit(cache=True)
+def _run_cores(
+    code, uis, templates, prec, petinp, names, initial, state_step, precision, out
+):
+    """
+    Run the njit core `code` (see `Core`) for each gridcell of `prec` and
+    `petinp` and each row of `uis` and `templates`, starting from the
+    `initial` storages `names` if given, and fill the arrays of `out`.
+    """
+    outputs, end_states, errors, failed = out
+    for g in range(prec.shape[0]):
+        for i in range(len(uis)):
+            ui = uis[i]
+            for s in range(initial.shape[0]):
+                ui[names[s]] = initial[s, g, i]
+            # the cores add their outputs to ts, so each run needs a fresh
+            # dict, but the arrays are shared by reference, not copied.
+            ts = Dict.empty(key_type=types.unicode_type, value_type=types.float64[:])
+            for k, v in templates[i].items():
+                ts[k] = v
+            ts["PREC"] = prec[g]
+            ts["PETINP"] = petinp[g]
+            try:
+                counts = _pwater_(ui, ts) if code == 0 else _iwater_(ui, ts)
+            except Exception:  # noqa: BLE001
+                failed[g, i] = True
+                continue
+            if counts is not None:
+                errors[g, i, : counts.shape[0]] = counts
+            for o in range(len(OUTPUTS)):
+                if OUTPUTS[o] in ts:
+                    round_into(ts[OUTPUTS[o]], precision, outputs[o, g, i])
+            for s in range(len(names)):
+                end_states[s, g, i] = ts[names[s]][state_step - 1]
+
+
+def run_param_matrix(
+    input_ts: InputTS,
+    siminfo: SimInfo,
+    params: numpy.ndarray,
+    columns: list[str],
+    func=pwater,
+    precision=4,
+    states: dict[str, numpy.ndarray] | None = None,
+    state_step: int | None = None,
+) -> dict[str, Any]:
+    """
+    Run one kernel for every row of a parameter matrix and every gridcell.
+
+    The ui dicts and constant series of each row are built once, by
+    `core_setup`, and the kernel's njit core is driven over gridcells x rows
+    from a single njit loop rather than through its public wrapper.
+
+    input_ts: PREC and PETINP as 1-D (steps,) or 2-D (gridcells, steps) arrays.
+    params: 2-D (rows, len(columns)) array of UCI parameters.
+    states: initial conditions by name as (gridcells, rows) arrays, replacing
+        those among `params`, e.g., the `states` of a previous run.
+    state_step: return `states` as of this step rather than after the last.
+
+    Returns SURO/AGWO/IFWO stacked as float32 (gridcells, rows, steps) arrays,
+    nested (gridcell, row) lists of errors, messages, and exceptions, and the
+    kernel's `STATES` after the last step as (gridcells, rows) arrays.
+    """
+    steps = siminfo["steps"]
+    state_step = steps if state_step is None else state_step
+    prec = numpy.atleast_2d(numpy.asarray(input_ts["PREC"], dtype=numpy.float64))
+    petinp = numpy.atleast_2d(numpy.asarray(input_ts["PETINP"], dtype=numpy.float64))
+    params = numpy.atleast_2d(params)
+    ncells, nrows = prec.shape[0], params.shape[0]
+
+    core = CORES[func]
+    rows = [dict(zip(columns, row, strict=True)) for row in params.tolist()]
+    uis, templates = core_setup(func, siminfo, rows)
+    names = STATES[func]
+    initial = (
+        numpy.zeros((0, ncells, nrows))
+        if states is None
+        else numpy.stack(
+            [numpy.broadcast_to(states[k], (ncells, nrows)) for k in names]
+        )
+    )
+    out = (
+        numpy.zeros((len(OUTPUTS), ncells, nrows, steps), dtype=numpy.float32),
+        numpy.zeros((len(names), ncells, nrows)),
+        numpy.zeros((ncells, nrows, len(core.messages)), dtype=numpy.int64),
+        numpy.zeros((ncells, nrows), dtype=numpy.bool_),
+    )
+    _run_cores(
+        core.code,
+        uis,
+        templates,
+        prec,
+        petinp,
+        List(names),
+        initial,
+        state_step,
+        precision,
+        out,
+    )
+    outputs, end_states, errors, failed = out
+
+    exceptions: list[list[str | None]] = [[None] * nrows for _ in range(ncells)]
+    for g, i in zip(*numpy.nonzero(failed), strict=True):  # pragma: no cover
+        exceptions[g][i] = _exception(func, siminfo, rows[i], prec[g], petinp[g])
+
+    return {
+        "ix": hour_index(siminfo),
+        **dict(zip(OUTPUTS, outputs, strict=True)),
+        "errors": [list(e) for e in errors],
+        "messages": [[core.messages] * nrows for _ in range(ncells)],
+        "exception": exceptions,
+        "states": dict(zip(names, end_states, strict=True)),
+    }
+
+
+def _exception(
+    func, siminfo: SimInfo, row: dict, prec, petinp
+) -> str:  # pragma: no cover
+    """the traceback of a run that failed in `_run_cores`, rerun through its wrapper."""
+    ts = build_numba_ts({"PREC": prec, "PETINP": petinp})
+    try:
+        func(None, siminfo=siminfo, uci=build_uci(dict(row)), ts=ts)
+    except Exception as e:
+        return "".join(tb.format_exception(None, e, e.__traceback__))
+    return f"{func.__name__} failed"
+
+
+def run_hrus_batched(
+    input_ts: InputTS, siminfo: SimInfo, hrus: list[str] | None = None
+) -> list[dict[str, dict[str, Any]]]:
+    """
+    Batched equivalent of `run_hrus`.
+
+    Builds one parameter matrix per kernel (pwater, iwater) and runs each
+    against every gridcell in `input_ts`. Returns one `run_hrus`-style dict
+    of per-hru results for each gridcell row of the inputs.
+    """
+    return _run_batches(input_ts, siminfo, hrus)
+
+
+def _run_batches(
+    input_ts: InputTS,
+    siminfo: SimInfo,
+    hrus: list[str] | None = None,
+    carry: dict | None = None,
+    final: bool = True,
+) -> list[dict[str, dict[str, Any]]]:
+    """
+    `run_hrus_batched`, starting each kernel from the states in `carry`, if
+    any, and leaving its end states there. Hrus that failed in an earlier
+    run with the same `carry` are reported with that run's exception.
+
+    If `final`, each hru's results include the `state` from which a later run
+    can extend it; see `saved_state`.
+    """
+    if hrus is None:  # pragma: no cover
+        hrus = list(wwhm.wwhm_hru_params().keys())
+
+    ncells = numpy.atleast_2d(input_ts["PREC"]).shape[0]
+    all_results: list[dict[str, dict[str, Any]]] = [{} for _ in range(ncells)]
+    failed = {} if carry is None else carry.setdefault("failed", {})
+
+    for func, group in kernel_groups(hrus):
+        if not group:
+            continue
+
+        columns, params = wwhm.wwhm_param_matrix(group)
+        states = None if carry is None else carry.get(func)
+        state_step = resume_step(siminfo, func) if final else None
+        with metrics.timer("hspf", count=ncells * len(group)):
+            batch = run_param_matrix(
+                input_ts,
+                siminfo,
+                params,
+                columns,
+                func=func,
+                states=states,
+                state_step=state_step,
+            )
+        if carry is not None:
+            carry[func] = batch["states"]
+
+        for g in range(ncells):
+            for i, hru in enumerate(group):
+                exception = failed.get((g, hru)) or batch["exception"][g][i]
+                results = None
+                if exception is None:
+                    results = {"ix": batch["ix"]} | {k: batch[k][g, i] for k in OUTPUTS}
+                else:
+                    failed[(g, hru)] = exception
+                all_results[g][hru] = {
+                    "hru": hru,
+                    "results": results,
+                    "errors": batch["errors"][g][i],
+                    "messages": batch["messages"][g][i],
+                    "exception": exception,
+                    "state": None
+                    if results is None or state_step is None
+                    else saved_state(siminfo, state_step, batch["states"], g, i),
+                }
+
+    # preserve the requested hru order
+    return [{hru: res[hru] for hru in hrus} for res in all_results]
+
+
+def kernel_groups(hrus: list[str]) -> list[tuple[Any, list[str]]]:
+    """the hrus run by each kernel, pwater then iwater, in their given order."""
+    return [
+        (pwater, [h for h in hrus if not is_impervious(h)]),
+        (iwater, [h for h in hrus if is_impervious(h)]),
+    ]
+
+
+def resume_step(siminfo: SimInfo, func) -> int | None:
+    """
+    The last step, counting the one after the run, at which the kernel can be
+    restarted from saved states (see `RESUME_HOUR`), or None if there is none.
+    """
+    steps = siminfo["steps"]
+    after = pandas.Timestamp(siminfo["start"]) + pandas.Timedelta(hours=steps)
+    step = steps - (after.hour - RESUME_HOUR[func]) % 24
+    return step if step > 0 else None
+
+
+def saved_state(
+    siminfo: SimInfo, step: int, states: dict[str, numpy.ndarray], g: int, i: int
+) -> dict[str, Any]:
+    """
+    The json-able state of one hru (row `i` of gridcell `g`) of a run: its
+    `storages` as of `step`, which is at `time`, and the time of the run's
+    last step, `end_time`.
+    """
+    start = pandas.Timestamp(siminfo["start"])
+    time = start + pandas.Timedelta(hours=step)
+    end = start + pandas.Timedelta(hours=siminfo["steps"] - 1)
+    return {
+        "time": time.isoformat(),
+        "end_time": end.isoformat(),
+        "storages": {k: float(v[g, i]) for k, v in states.items()},
+    }
+
+
+def run_hrus_from_states(
+    input_ts: InputTS,
+    siminfo: SimInfo,
+    hrus: list[str],
+    storages: dict[str, dict[str, float]],
+) -> list[dict[str, dict[str, Any]]]:
+    """`run_hrus_batched`, starting each hru from its saved `storages`."""
+    ncells = numpy.atleast_2d(input_ts["PREC"]).shape[0]
+    carry: dict = {}
+    for func, group in kernel_groups(hrus):
+        if group:
+            carry[func] = {
+                k: numpy.tile([storages[h][k] for h in group], (ncells, 1))
+                for k in STATES[func]
+            }
+    return _run_batches(input_ts, siminfo, hrus, carry)
+
+
+def run_hrus_extension(
+    input_ts: InputTS,
+    siminfo: SimInfo,
+    hrus: list[str],
+    states: dict[str, dict[str, Any]],
+    first: int,
+) -> tuple[SimInfo, dict[str, dict[str, Any]]]:
+    """
+    Extend one gridcell's hrus from the `saved_state` of each at the end of an
+    earlier run, whose last step was `first - 1`. Inputs span the whole
+    series, as in the earlier run.
+
+    Each hru restarts from its state's time, at most a day before `first`,
+    and the overlap is dropped. Returns the siminfo of the new steps and
+    `run_hrus_batched`-style results for them.
+    """
+    start, steps = pandas.Timestamp(siminfo["start"]), siminfo["steps"]
+    by_step: dict[int, list[str]] = {}
+    for hru in hrus:
+        step = (pandas.Timestamp(states[hru]["time"]) - start) // pandas.Timedelta("1h")
+        if not 0 <= step <= first < steps:
+            raise ValueError(f"{hru} was saved at step {step}, not before {first}")
+        by_step.setdefault(step, []).append(hru)
+
+    results: dict[str, dict[str, Any]] = {}
+    for step, group in by_step.items():
+        chunk = chunk_siminfo(siminfo, step, steps)
+        chunk_ts = {k: numpy.asarray(v)[..., step:] for k, v in input_ts.items()}
+        storages = {h: states[h]["storages"] for h in group}
+        (res,) = run_hrus_from_states(chunk_ts, chunk, group, storages)
+        for data in res.values():
+            if data["results"] is not None:
+                data["results"] = {
+                    k: v[first - step :] for k, v in data["results"].items()
+                }
+        results |= res
+
+    return chunk_siminfo(siminfo, first, steps), {h: results[h] for h in hrus}
+
+
+def chunk_bounds(siminfo: SimInfo, years: int = 1) -> list[tuple[int, int]]:
+    """
+    (start, stop) steps of chunks that split the simulation at January 1,
+    every `years` years.
+
+    HSP2 recomputes the kernels' daily routing factors on a run's first step
+    only if it falls on January 1 00:00, so a run may only resume from carried
+    states there; see `run_hrus_chunked`.
+    """
+    if years < 1:
+        raise ValueError(f"chunks must span at least one year, got {years}")
+    start = pandas.Timestamp(siminfo["start"])
+    steps = siminfo["steps"]
+    last = start + pandas.Timedelta(hours=steps)
+    edges = [0] + [
+        h
+        for year in range(start.year + years, last.year + 1, years)
+        if 0 < (h := (pandas.Timestamp(year, 1, 1) - start) // pandas.Timedelta("1h"))
+        and h < steps
+    ]
+    return list(zip(edges, [*edges[1:], steps], strict=True))
+
+
+def chunk_siminfo(siminfo: SimInfo, start: int, stop: int) -> SimInfo:
+    """siminfo of steps [start, stop) of a simulation."""
+    first = pandas.Timestamp(siminfo["start"]) + pandas.Timedelta(hours=start)
+    return siminfo | {
+        "start": first.to_pydatetime(),
+        "stop": (first + pandas.Timedelta(hours=stop - start - 1)).to_pydatetime(),
+        "steps": stop - start,
+    }  # type: ignore[return-value]
+
+
+def run_hrus_chunked(
+    input_ts: InputTS, siminfo: SimInfo, hrus: list[str] | None = None, years=1
+) -> Iterator[tuple[SimInfo, list[dict[str, dict[str, Any]]]]]:
+    """
+    Streaming equivalent of `run_hrus_batched` for long series.
+
+    Yields (siminfo, results) for each chunk of `chunk_bounds`, with results
+    like those of `run_hrus_batched`. Each hru's storages (`STATES`) at the
+    end of one chunk are its initial conditions in the next, so only one
+    chunk of outputs is in memory at a time. Results match a single run to
+    within rounding, except that the kernels refresh some rate factors at
+    each chunk boundary. An hru that fails stays failed in later chunks.
+    """
+    carry: dict = {}
+    steps = siminfo["steps"]
+    for start, stop in chunk_bounds(siminfo, years):
+        chunk = chunk_siminfo(siminfo, start, stop)
+        chunk_ts = {k: numpy.asarray(v)[..., start:stop] for k, v in input_ts.items()}
+        yield chunk, _run_batches(chunk_ts, chunk, hrus, carry, stop == steps)
@@ -0,0 +1,239 @@
+import io
+import re
+from collections.abc import Iterable
+from typing import Any
+
+import numpy
+import orjson
+import pyarrow
+import pyarrow.parquet as pq
+
+JSON_SUFFIX = "input.json"
+NPZ_SUFFIX = "input.npz"
+PARQUET_SUFFIX = "input.parquet"
+SHARD_SUFFIX = "shard.parquet"
+INPUT_SUFFIXES = (JSON_SUFFIX, NPZ_SUFFIX, PARQUET_SUFFIX, SHARD_SUFFIX)
+
+# the "data" list of numbers of a series, e.g., of "prec". The quote after
+# `data` can't be escaped, so a match is never inside a json string.
+_DATA_LIST = re.compile(rb'("data"\s*:\s*)(\[\s*-?\d[\d.eE+\-,\s]*\])')
+_ARRAY_KEY = "__tnc_array_{}__"
+
+Documents = dict[str, dict[str, Any]]  # gridcell -> input document
+
+
+def split_address(input_file: str) -> tuple[str, str | None]:
+    """(blob name, gridcell) of an input address like 'm/inputs/x-shard.parquet#R1C1'"""
+    name, _, gridcell = input_file.partition("#")
+    return name, gridcell or None
+
+
+def is_shard(name: str) -> bool:
+    return name.endswith(SHARD_SUFFIX)
+
+
+def gridcell_of(name: str) -> str:
+    return name.rsplit("/", 1)[-1].split("-")[0]
+
+
+def _restore_arrays(node, arrays: list[numpy.ndarray] | None):
+    """
+    `node` with the "data" of each series restored from `arrays` by its
+    placeholder, or if `arrays` is None, converted to a float64 array.
+    """
+    if isinstance(node, list):
+        return [_restore_arrays(v, arrays) for v in node]
+    if not isinstance(node, dict):
+        return node
+    restored = {k: _restore_arrays(v, arrays) for k, v in node.items()}
+    data = restored.get("data")
+    if arrays is None and isinstance(data, list):
+        try:
+            restored["data"] = numpy.asarray(data, dtype=numpy.float64)
+        except (TypeError, ValueError):
+            pass
+    elif arrays is not None and isinstance(data, str) and data.startswith("__tnc_"):
+        restored["data"] = arrays[int(data[len("__tnc_array_") : -2])]
+    return restored
+
+
+def loads_json(raw: bytes) -> dict[str, Any]:
+    """
+    Decode an input json document, parsing the "data" list of numbers of each
+    series straight into a float64 array rather than a list of python floats.
+    Documents the fast path can't handle are parsed in full, then converted.
+    """
+    arrays: list[numpy.ndarray] = []
+
+    def extract(match: re.Match) -> bytes:
+        text = match[2][1:-1]
+        arr = numpy.fromstring(text, dtype=numpy.float64, sep=",")
+        if len(arr) != text.count(b",") + 1:  # pragma: no cover
+            arr = numpy.asarray(orjson.loads(match[2]), dtype=numpy.float64)
+        arrays.append(arr)
+        return match[1] + b'"' + _ARRAY_KEY.format(len(arrays) - 1).encode() + b'"'
+
+    try:
+        skeleton = orjson.loads(_DATA_LIST.sub(extract, raw))
+    except orjson.JSONDecodeError:  # pragma: no cover
+        return _restore_arrays(orjson.loads(raw), None)
+    return _restore_arrays(skeleton, arrays)
+
+
+def documents_nbytes(docs: Documents) -> int:
+    """bytes of the series arrays of `docs`."""
+    return sum(
+        v["data"].nbytes
+        for doc in docs.values()
+        for v in doc.values()
+        if isinstance(v, dict) and isinstance(v.get("data"), numpy.ndarray)
+    )
+
+
+def _series(values) -> dict[str, numpy.ndarray]:
+    return {"data": numpy.asarray(values)}
+
+
+def loads_npz(raw: bytes) -> dict[str, Any]:
+    """
+    Decode a single gridcell .npz input: float32 `prec` (mm/hr), optional
+    daily `petinp` (mm/day), and `start_time`/`end_time` as iso strings.
+    """
+    with numpy.load(io.BytesIO(raw), allow_pickle=False) as npz:
+        doc: dict[str, Any] = {
+            "start_time": str(npz["start_time"]),
+            "end_time": str(npz["end_time"]),
+            "prec": _series(npz["prec"]),
+        }
+        if "petinp" in npz.files:
+            doc["petinp"] = _series(npz["petinp"])
+    return doc
+
+
+def dumps_npz(doc: dict[str, Any]) -> bytes:
+    """encode an input document as .npz; see `loads_npz`."""
+    arrays = {
+        "start_time": numpy.array(str(doc["start_time"])),
+        "end_time": numpy.array(str(doc["end_time"])),
+        "prec": numpy.asarray(doc["prec"]["data"], dtype=numpy.float32),
+    }
+    if "petinp" in doc:
+        arrays["petinp"] = numpy.asarray(doc["petinp"]["data"], dtype=numpy.float32)
+    b = io.BytesIO()
+    numpy.savez(b, **arrays)
+    return b.getvalue()
+
+
+def _list_values(column: pyarrow.ChunkedArray, row: int) -> numpy.ndarray | None:
+    scalar = column[row]
+    if not scalar.is_valid:
+        return None
+    return scalar.values.to_numpy(zero_copy_only=False)
+
+
+def loads_parquet(raw: bytes) -> Documents:
+    """
+    Decode a parquet input with one row per gridcell and columns `gridcell`,
+    `start_time`, `end_time`, `prec` (list<float32>), and optionally `petinp`.
+    """
+    table = pq.read_table(pyarrow.BufferReader(raw))
+    has_petinp = "petinp" in table.column_names
+
+    docs: Documents = {}
+    for row, gridcell in enumerate(table.column("gridcell").to_pylist()):
+        doc: dict[str, Any] = {
+            "start_time": table.column("start_time")[row].as_py(),
+            "end_time": table.column("end_time")[row].as_py(),
+            "prec": _series(_list_values(table.column("prec"), row)),
+        }
+        petinp = _list_values(table.column("petinp"), row) if has_petinp else None
+        if petinp is not None:
+            doc["petinp"] = _series(petinp)
+        docs[gridcell] = doc
+    return docs
+
+
+def dumps_parquet(docs: Documents) -> bytes:
+    """
+    Encode input documents by gridcell as a parquet shard with one row group
+    per gridcell; see `loads_parquet`.
+    """
+    float_list = pyarrow.list_(pyarrow.float32())
+    schema = pyarrow.schema(
+        [
+            ("gridcell", pyarrow.string()),
+            ("start_time", pyarrow.string()),
+            ("end_time", pyarrow.string()),
+            ("prec", float_list),
+            ("petinp", float_list),
+        ]
+    )
+    b = io.BytesIO()
+    with pq.ParquetWriter(b, schema, compression="none") as writer:
+        for gridcell, doc in docs.items():
+            petinp = doc.get("petinp", {}).get("data")
+            row = {
+                "gridcell": [gridcell],
+                "start_time": [str(doc["start_time"])],
+                "end_time": [str(doc["end_time"])],
+                "prec": [numpy.asarray(doc["prec"]["data"], dtype=numpy.float32)],
+                "petinp": [
+                    None
+                    if petinp is None
+                    else numpy.asarray(petinp, dtype=numpy.float32)
+                ],
+            }
+            writer.write_table(pyarrow.table(row, schema=schema))
+    return b.getvalue()
+
+
+def shard_gridcells(source) -> list[str]:
+    """
+    the gridcells of a parquet shard, reading only its `gridcell` column.
+
+    source: path, bytes, or seekable file-like object, e.g.,
+        `ClimateTSBucket.open_blob(...)`.
+    """
+    if isinstance(source, bytes | bytearray | memoryview):
+        source = pyarrow.BufferReader(source)
+    return pq.read_table(source, columns=["gridcell"]).column(0).to_pylist()
+
+
+def loads(name: str, raw: bytes) -> Documents:
+    """decode an input blob by its file extension into documents by gridcell."""
+    if name.endswith(".json"):
+        return {gridcell_of(name): loads_json(raw)}
+    if name.endswith(".npz"):
+        return {gridcell_of(name): loads_npz(raw)}
+    if name.endswith(".parquet"):
+        return loads_parquet(raw)
+    raise ValueError(f"unsupported input format: {name}")
+
+
+def read_local(input_file: str) -> dict[str, Any]:
+    """the input document of a local file address like 'path' or 'path#gridcell'."""
+    path, gridcell = split_address(input_file)
+    with open(path, "rb") as f:
+        return select(loads(path, f.read()), gridcell)
+
+
+def select(docs: Documents, gridcell: str | None) -> dict[str, Any]:
+    """the document of `gridcell`, or the only document if no gridcell is given."""
+    if gridcell is not None:
+        try:
+            return docs[gridcell]
+        except KeyError:
+            raise ValueError(f"no input for gridcell {gridcell}") from None
+    if len(docs) != 1:
+        raise ValueError(
+            f"input holds {len(docs)} gridcells; address one as 'name#gridcell'"
+        )
+    return next(iter(docs.values()))
+
+
+def matches(gridcell: str, substrings: str | Iterable[str] | None) -> bool:
+    if substrings is None:
+        return True
+    if isinstance(substrings, str):
+        substrings = [substrings]
+    return any(s in gridcell for s in substrings)
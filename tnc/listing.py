@@ -0,0 +1,229 @@
+import sqlite3
+import time
+from collections.abc import Iterable
+from contextlib import closing
+from pathlib import Path
+
+from .config import settings
+from .inputs import (
+    INPUT_SUFFIXES,
+    SHARD_SUFFIX,
+    gridcell_of,
+    is_shard,
+    matches,
+    shard_gridcells,
+)
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS blobs (
+        name TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        gridcell TEXT NOT NULL,
+        generation INTEGER,
+        size INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS blobs_model_gridcell ON blobs (model, gridcell)",
+    """
+    CREATE TABLE IF NOT EXISTS refreshed (
+        model TEXT PRIMARY KEY,
+        refreshed_at REAL NOT NULL
+    )
+    """,
+)
+
+
+def is_input_file(name: str) -> bool:
+    return "/inputs/" in name and name.endswith(INPUT_SUFFIXES)
+
+
+class ListingIndex:
+    """
+    Local sqlite index of the input blobs in the bucket: model, gridcell,
+    blob name, generation, and size.
+
+    Each model's listing is refreshed with one prefix scan once it is older
+    than `ttl` seconds (or on demand), and only rows whose generation changed
+    are rewritten. Queries for `find` and `run` are then answered locally.
+    """
+
+    def __init__(self, path: str | Path, ttl: float = 3600):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as con, con:
+            con.execute("PRAGMA journal_mode=WAL")
+            for stmt in _SCHEMA:
+                con.execute(stmt)
+
+    @classmethod
+    def from_settings(cls) -> "ListingIndex | None":
+        if not settings.LISTING_INDEX:
+            return None
+        return cls(settings.LISTING_INDEX, ttl=settings.LISTING_INDEX_TTL)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def refreshed_at(self, model: str) -> float | None:
+        with closing(self._connect()) as con:
+            row = con.execute(
+                "SELECT refreshed_at FROM refreshed WHERE model = ?", (model,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def is_stale(self, model: str, now: float | None = None) -> bool:
+        refreshed_at = self.refreshed_at(model)
+        now = time.time() if now is None else now
+        return refreshed_at is None or now - refreshed_at > self.ttl
+
+    def update_model(
+        self, model: str, blobs: Iterable[tuple[str, int | None, int | None]]
+    ) -> dict[str, int]:
+        """
+        Replace the index rows of one model with a fresh listing of
+        (name, generation, size), writing only what changed.
+        """
+        listed = {
+            name: (generation, size)
+            for name, generation, size in blobs
+            if is_input_file(name)
+        }
+
+        with closing(self._connect()) as con, con:
+            known = {
+                name: (generation, size)
+                for name, generation, size in con.execute(
+                    "SELECT name, generation, size FROM blobs WHERE model = ?",
+                    (model,),
+                )
+            }
+            changed = [
+                (name, model, gridcell_of(name), *listed[name])
+                for name in listed
+                if known.get(name) != listed[name]
+            ]
+            removed = [(name,) for name in known.keys() - listed.keys()]
+
+            con.executemany(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?)", changed
+            )
+            con.executemany("DELETE FROM blobs WHERE name = ?", removed)
+            con.execute(
+                "INSERT OR REPLACE INTO refreshed VALUES (?, ?)", (model, time.time())
+            )
+
+        return {"changed": len(changed), "removed": len(removed), "total": len(listed)}
+
+    def refresh(
+        self, client, models: list[str] | None = None, force: bool = False
+    ) -> dict[str, dict[str, int]]:
+        """rescan the stale (or, with `force`, all) `models` in the bucket."""
+        if models is None:
+            models = client.models
+
+        stats = {}
+        for model in models:
+            if not force and not self.is_stale(model):
+                continue
+            blobs = client.bucket.list_blobs(prefix=f"{model}/inputs/")
+            stats[model] = self.update_model(
+                model, ((b.name, b.generation, b.size) for b in blobs)
+            )
+        return stats
+
+    def query(
+        self,
+        models: list[str] | None = None,
+        gridcell: str | list[str] | None = None,
+    ) -> list[tuple[str, int | None, int | None]]:
+        """
+        (name, generation, size) of input blobs of any of `models` whose
+        gridcell contains any of the `gridcell` substrings, sorted by name.
+        Shards hold many gridcells and always match `gridcell`.
+        """
+        clauses, params = [], []
+        if models is not None:
+            clauses.append(f"model IN ({', '.join('?' for _ in models)})")
+            params.extend(models)
+        if gridcell is not None:
+            if isinstance(gridcell, str):
+                gridcell = [gridcell]
+            matches = ["instr(gridcell, ?) > 0" for _ in gridcell] + ["name LIKE ?"]
+            clauses.append("(" + " OR ".join(matches) + ")")
+            params.extend([*gridcell, f"%{SHARD_SUFFIX}"])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with closing(self._connect()) as con:
+            return con.execute(
+                f"SELECT name, generation, size FROM blobs {where} ORDER BY name",
+                params,
+            ).fetchall()
+
+
+def gather_args(
+    model: str | list[str] | None = None,
+    gridcell: str | list[str] | None = None,
+    client=None,
+    index: ListingIndex | None = None,
+) -> list[dict[str, str]]:
+    """
+    Select the input files of the models and gridcells matching any of the
+    given substrings. Answered from the local `ListingIndex` (refreshing stale
+    models first) when one is passed or configured with LISTING_INDEX, and
+    from a bucket listing otherwise.
+    """
+    if client is None:  # pragma: no cover
+        from .bucket import get_client
+
+        client = get_client()
+    if index is None:
+        index = ListingIndex.from_settings()
+    if model is None:
+        model = client.models
+    if isinstance(model, str):
+        model = [model]
+
+    valid_models = {m for m in client.models for substr in model if substr in m}
+    if not valid_models:
+        return []
+
+    if index is not None:
+        index.refresh(client, sorted(valid_models))
+        input_files = [
+            name for name, *_ in index.query(sorted(valid_models), gridcell=gridcell)
+        ]
+    else:
+        input_files = client.get_precip_files(
+            model=list(valid_models), gridcell=gridcell
+        )
+
+    args: list[dict[str, str]] = [
+        {"input_file": input_file}
+        for input_file in sorted(expand_shards(input_files, gridcell, client))
+    ]
+
+    return args
+
+
+def expand_shards(
+    input_files: list[str], gridcell: str | list[str] | None, client
+) -> list[str]:
+    """
+    Replace each shard among `input_files` with a 'name#gridcell' address for
+    every gridcell in it that matches `gridcell`. Only the shard's gridcell
+    column is fetched.
+    """
+    expanded = []
+    for input_file in input_files:
+        if not is_shard(input_file):
+            expanded.append(input_file)
+            continue
+        with client.open_blob(input_file) as source:
+            expanded.extend(
+                f"{input_file}#{g}"
+                for g in shard_gridcells(source)
+                if matches(g, gridcell)
+            )
+    return expanded
@@ -1,50 +1,79 @@
 import io
+import math
+import os
+import random
+import tempfile
+from collections import Counter
+from collections.abc import Iterable
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from copy import deepcopy
+from itertools import groupby
+from pathlib import Path
+from queue import Queue
+from threading import Thread
 from time import perf_counter
 
 import numpy
 import orjson
 import pandas
-from tqdm import tqdm
+import pyarrow
+import pyarrow.parquet as pq
+from typing_extensions import TypedDict
 
-from . import convert, pet, wwhm
-from .bucket import ClientFactory, ClimateTSBucket, get_client
-from .hspf_runner import InputTS, SimInfo, get_TNC_siminfo, run_hrus
+from . import (
+    convert,
+    governor,
+    inputs,
+    memo,
+    metrics,
+    pet,
+    shared,
+    summary,
+    warmup,
+    wwhm,
+)
+from .bucket import ClientFactory, ClimateTSBucket, get_client, get_worker_client
+from .hspf_runner import (
+    OUTPUTS,
+    InputTS,
+    chunk_bounds,
+    get_TNC_siminfo,
+    hour_index,
+    run_hrus_batched,
+    run_hrus_chunked,
+    run_hrus_extension,
+)
+from .listing import ListingIndex, expand_shards, gather_args  # noqa: F401
+from .manifest import RunManifest, Unit
+from .schema import Layout, SimInfo
+from .workqueue import Heartbeat, open_queue
 
 
 def build_petinp(siminfo, data):  # pragma: no cover
-    start = siminfo["start"]
-    end = siminfo["stop"]
-
-    daterange = pandas.date_range(start=start, end=end, freq="1D")
-    petinp = (
-        pandas.DataFrame({"petinp": data["petinp"].get("data", [])[: len(daterange)]})
-        .assign(datetime=daterange)
-        .set_index("datetime")
-        .reindex(
-            pandas.date_range(
-                start=start,
-                end=end,
-                freq="1h",
-            ),
-            method="ffill",
-        )  # aah! this result is hourly freq but in mm/day!
-        .div(24)  # aah! this result is mm/hr
-        .to_numpy()
-        .flatten()
-        * convert.MM_TO_INCH  # phew, this result is in/hr
-    )
+    """expand daily PET (mm/day) to hourly (in/hr) from start to stop."""
+    start = pandas.Timestamp(siminfo["start"]).value
+    end = pandas.Timestamp(siminfo["stop"]).value
+    ndays = (end - start) // pandas.Timedelta("1D").value + 1
+    nhours = (end - start) // pandas.Timedelta("1h").value + 1
+
+    daily = numpy.asarray(data["petinp"].get("data", []), dtype=numpy.float64)
+    if len(daily) < ndays:
+        raise ValueError(f"expected {ndays} days of petinp, found {len(daily)}")
 
-    return petinp
+    # mm/day -> mm/hr, held constant through each day, then in/hr
+    return numpy.repeat(daily[:ndays] / 24, 24)[:nhours] * convert.MM_TO_INCH
 
 
 def build_ts(data, siminfo):
-    precip = numpy.array(data["prec"].get("data")) * convert.MM_TO_INCH
-    if "petinp" in data:  # pragma: no cover
-        petinp = build_petinp(siminfo, data)
-    else:
-        petinp = pet.build_evap_ts(siminfo).to_numpy()
+    precip = (
+        numpy.asarray(data["prec"].get("data"), dtype=numpy.float64)
+        * convert.MM_TO_INCH
+    )
+    with metrics.timer("pet"):
+        if "petinp" in data:  # pragma: no cover
+            petinp = build_petinp(siminfo, data)
+        else:
+            petinp = pet.build_evap_array(siminfo)
 
     input_ts: InputTS = {"PREC": precip, "PETINP": petinp}
 
@@ -53,82 +82,743 @@ def build_ts(data, siminfo):
 
 def run_one_datafile(data, siminfo, hrus: list[str] | None = None):
     input_ts: InputTS = build_ts(data, siminfo)
-    return run_hrus(input_ts, siminfo, hrus)
+    return run_hrus_batched(input_ts, siminfo, hrus)[0]
 
 
-def build_results_table_for_one_hru(res, run_id, siminfo, metadata) -> pandas.DataFrame:
-    table = pandas.DataFrame(res)
-    table[["SURO", "AGWO", "IFWO"]] *= convert.INCH_TO_MM
-    runoff_units = "depth (mm)"
+class SerializedResults(TypedDict):
+    name: str
+    hrus: dict[str, bool]
+    parquet_path: str | None
+    # a Path is a spooled file, removed once sent; see `serialize_chunks`
+    parquet: bytes | Path | None
+    # companion `summary` tables of the parquet, if requested
+    summary_path: str | None
+    summary: bytes | None
+    # `memo.result_key` of each hru in the parquet, recorded with it if set
+    keys: dict[str, str] | None
+    meta_path: str
+    meta: dict
+    stale_error_path: str | None
 
-    zeros = numpy.zeros(siminfo["steps"])
-    table["id"] = pandas.Series(zeros, dtype="category").cat.rename_categories(
-        {0: run_id}
-    )
-
-    table["start_time"] = pandas.Series(zeros, dtype="category").cat.rename_categories(
-        {0: siminfo["start"].isoformat()}
-    )
 
-    table["end_time"] = pandas.Series(zeros, dtype="category").cat.rename_categories(
-        {0: siminfo["stop"].isoformat()}
-    )
+def build_results_arrow_table(
+    res: dict[str, numpy.ndarray], metadata: dict | None = None
+) -> pyarrow.Table:
+    """
+    Results of one hru as an Arrow table of `ix` and float32 runoff depths (mm).
 
-    metadata.update(
+    Columns wrap the result buffers, or for the runoff, the single scaled copy
+    of each, without going through pandas. Fields that are constant for the
+    whole table are stored once as json under the schema's `tnc` metadata key
+    rather than as per-row columns.
+    """
+    scale = numpy.float32(convert.INCH_TO_MM)
+    table = pyarrow.table(
         {
-            "start_time": siminfo["start"].isoformat(),
-            "end_time": siminfo["stop"].isoformat(),
-            "steps": str(siminfo["steps"]),
-            "runoff_units": runoff_units,
+            "ix": res["ix"],
+            **{k: numpy.multiply(res[k], scale, dtype=numpy.float32) for k in OUTPUTS},
         }
     )
+    if metadata is not None:
+        table = table.replace_schema_metadata({"tnc": orjson.dumps(metadata)})
+    return table
+
+
+def read_results_metadata(source) -> dict:
+    """the `tnc` metadata of a results parquet; see `read_hru_results` for source."""
+    if isinstance(source, bytes | bytearray | memoryview):
+        source = pyarrow.BufferReader(source)
+    return orjson.loads(pq.read_schema(source).metadata[b"tnc"])
+
+
+def hru_metadata(siminfo: SimInfo, hru: str) -> dict[str, str]:
+    """the `tnc` metadata of the results parquet of one hru."""
+    model, gridcell = siminfo["model"], siminfo["gridcell"]
+    return {
+        "id": f"{model}/results/{gridcell}/{hru}",
+        "model": str(model),
+        "rc": str(gridcell),
+        "hru": str(hru),
+        "start_time": siminfo["start"].isoformat(),
+        "end_time": siminfo["stop"].isoformat(),
+        "steps": str(siminfo["steps"]),
+        "runoff_units": "depth (mm)",
+    }
 
-    meta_str = orjson.dumps(metadata).decode()
-    table["meta"] = pandas.Series(
-        numpy.zeros(siminfo["steps"]), dtype="category"
-    ).cat.rename_categories({0: meta_str})
 
+def summary_path(parquet_path: str) -> str:
+    """
+    where the summary of a results parquet goes, e.g.,
+    'm/summaries/R1C1/hru010.parquet' for 'm/results/R1C1/hru010.parquet'.
+    """
+    model, _, name = parquet_path.partition("/results/")
+    return f"{model}/summaries/{name}"
+
+
+def summarize_results(
+    table: pyarrow.Table,
+    hru_index: int | None = None,
+    hru_dictionary: pyarrow.Array | None = None,
+) -> pyarrow.Table:
+    """`summary.summarize` a results table, with an `hru` column if indexed."""
+    with metrics.timer("summary"):
+        table = summary.summarize(table)
+    if hru_index is not None and hru_dictionary is not None:
+        table = add_hru_column(table, hru_index, hru_dictionary)
     return table
 
 
+def hru_unit(
+    siminfo: SimInfo,
+    hru: str,
+    meta: dict,
+    parquet: bytes | Path | None,
+    summary_table: pyarrow.Table | None = None,
+) -> SerializedResults:
+    """
+    the upload unit of one hru's meta document and, unless it failed, parquet
+    and summary.
+    """
+    model, gridcell = siminfo["model"], siminfo["gridcell"]
+    fname = f"{gridcell}-{hru}"
+    ext = "meta" if not meta["exception"] else "error"
+    parquet_path = f"{model}/results/{gridcell}/{hru}.parquet"
+    summary_bytes = None
+    if parquet is not None and summary_table is not None:
+        summary_bytes = summary.to_parquet(summary_table, hru_metadata(siminfo, hru))
+    return {
+        "name": hru,
+        "hrus": {hru: ext == "meta"},
+        "parquet_path": None if parquet is None else parquet_path,
+        "parquet": parquet,
+        "summary_path": None if summary_bytes is None else summary_path(parquet_path),
+        "summary": summary_bytes,
+        "keys": None,
+        "meta_path": model + f"/meta/{fname}.{ext}",
+        "meta": meta,
+        "stale_error_path": model + f"/meta/{fname}.error" if ext == "meta" else None,
+    }
+
+
+def serialize_results_for_one_hru(
+    *, hru: str, data: dict, siminfo: SimInfo, summaries: bool = False
+) -> SerializedResults:
+    res = data.pop("results", None)
+
+    parquet, summary_table = None, None
+    if res:  # pragma: no branch
+        with metrics.timer("table"):
+            table = build_results_arrow_table(res, hru_metadata(siminfo, hru))
+        if summaries:
+            summary_table = summarize_results(table)
+
+        with metrics.timer("serialize"):
+            b = pyarrow.BufferOutputStream()
+            # compression makes no difference on uploaded size,
+            # but measurably slows down the process
+            pq.write_table(table, b, compression="none")
+
+        parquet = b.getvalue().to_pybytes()
+
+    return hru_unit(siminfo, hru, data, parquet, summary_table)
+
+
+def send_serialized(
+    serialized: SerializedResults, client: ClimateTSBucket
+) -> tuple[str, str]:
+    """upload one serialized unit while holding one of the run's io slots."""
+    with governor.io_slot():
+        if serialized["stale_error_path"]:  # pragma: no cover
+            with metrics.timer("rm_blob"):
+                client.rm_blob(serialized["stale_error_path"])
+
+        resname = ""
+        parquet = serialized["parquet"]
+        try:
+            # the client reports the bytes it sent or skipped as unchanged
+            if serialized["parquet_path"]:  # pragma: no branch
+                kwargs = {}
+                if serialized["keys"]:
+                    kwargs["metadata"] = memo.object_metadata(serialized["keys"])
+                with metrics.timer("upload"):
+                    resname = client.send_parquet(
+                        serialized["parquet_path"], parquet, **kwargs
+                    )
+            if serialized["summary_path"]:
+                with metrics.timer("upload"):
+                    client.send_parquet(
+                        serialized["summary_path"], serialized["summary"]
+                    )
+        finally:
+            if isinstance(parquet, Path):
+                parquet.unlink(missing_ok=True)
+
+        with metrics.timer("upload"):
+            meta_name = client.send_json(serialized["meta_path"], serialized["meta"])
+
+    return resname, meta_name
+
+
 def send_results_for_one_hru(
     *, hru: str, data: dict, siminfo: SimInfo, client=None
 ) -> tuple[str, str]:
     if client is None:  # pragma: no cover
         client = get_client()
-    model, gridcell = siminfo["model"], siminfo["gridcell"]
-    fname = f"{gridcell}-{hru}"
-    id_ = model + f"/results/{fname.replace('-', '/')}"
-    ext = "meta" if not data["exception"] else "error"
-    if ext == "meta":  # pragma: no cover
-        client.rm_blob(model + f"/meta/{fname}.error")
+    serialized = serialize_results_for_one_hru(hru=hru, data=data, siminfo=siminfo)
+    return send_serialized(serialized, client)
 
-    res = data.pop("results", None)
 
-    resname = ""
-    if res:  # pragma: no branch
-        metadata = {
-            "model": str(model),
-            "rc": str(gridcell),
-            "hru": str(hru),
-        }
-        table = build_results_table_for_one_hru(
-            res, id_, siminfo=siminfo, metadata=metadata
+def serialize_results_for_one_inputfile(
+    *, results: dict[str, dict], siminfo: SimInfo, summaries: bool = False
+) -> list[SerializedResults]:
+    return [
+        serialize_results_for_one_hru(
+            hru=hru, data=dict(data), siminfo=siminfo, summaries=summaries
         )
+        for hru, data in results.items()
+    ]
+
 
+def build_results_arrow_table_for_one_hru(
+    res: dict[str, numpy.ndarray], hru_index: int, hru_dictionary: pyarrow.Array
+) -> pyarrow.Table:
+    return add_hru_column(build_results_arrow_table(res), hru_index, hru_dictionary)
+
+
+def add_hru_column(
+    table: pyarrow.Table, hru_index: int, hru_dictionary: pyarrow.Array
+) -> pyarrow.Table:
+    """prepend a dictionary-encoded `hru` column of `hru_dictionary[hru_index]`."""
+    hru = pyarrow.DictionaryArray.from_arrays(
+        numpy.full(table.num_rows, hru_index, dtype=numpy.int32), hru_dictionary
+    )
+    return table.add_column(0, "hru", hru)
+
+
+def serialize_results_for_one_gridcell(
+    *, results: dict[str, dict], siminfo: SimInfo, summaries: bool = False
+) -> SerializedResults:
+    """
+    Serialize every hru of an input file into one parquet and one meta document.
+
+    The parquet holds one row group per hru with a dictionary-encoded `hru`
+    column. Its `tnc` key/value metadata maps each hru to its row group so
+    readers can fetch a single hru with `read_hru_results`.
+    """
+    with_results = [hru for hru, data in results.items() if data.get("results")]
+    hru_dictionary = pyarrow.array(with_results, type=pyarrow.string())
+
+    metadata = gridcell_metadata(
+        siminfo, {hru: i for i, hru in enumerate(with_results)}
+    )
+
+    parquet, summary_tables = None, []
+    if with_results:  # pragma: no branch
         b = io.BytesIO()
-        # compression makes no difference on uploaded size,
-        # but measurably slows down the process
-        table.to_parquet(b, index=False, compression=None)
-        b.seek(0)
+        writer = None
+        for i, hru in enumerate(with_results):
+            with metrics.timer("table"):
+                table = build_results_arrow_table_for_one_hru(
+                    results[hru]["results"], i, hru_dictionary
+                )
+            if summaries:
+                summary_tables.append(summarize_results(table, i, hru_dictionary))
+            if writer is None:
+                schema = table.schema.with_metadata({"tnc": orjson.dumps(metadata)})
+                # compression makes no difference on uploaded size,
+                # but measurably slows down the process
+                writer = pq.ParquetWriter(b, schema, compression="none")
+            with metrics.timer("serialize"):
+                writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        if writer is not None:  # pragma: no branch
+            writer.close()
+        parquet = b.getvalue()
 
-        parquet_path = id_ + ".parquet"
-        resname = client.send_parquet(parquet_path, b.read())
+    meta = {
+        hru: {k: v for k, v in data.items() if k != "results"}
+        for hru, data in results.items()
+    }
+    summary_table = pyarrow.concat_tables(summary_tables) if summary_tables else None
+    return gridcell_unit(siminfo, meta, parquet, summary_table)
 
-    meta_path = model + f"/meta/{fname}.{ext}"
-    meta_name = client.send_json(meta_path, data)
 
-    return resname, meta_name
+def gridcell_metadata(siminfo: SimInfo, row_groups: dict | None) -> dict:
+    """
+    the `tnc` metadata of a gridcell results parquet (see `read_hru_results`),
+    or without `row_groups`, of its summary.
+    """
+    metadata = {
+        "model": str(siminfo["model"]),
+        "rc": str(siminfo["gridcell"]),
+        "start_time": siminfo["start"].isoformat(),
+        "end_time": siminfo["stop"].isoformat(),
+        "steps": str(siminfo["steps"]),
+        "runoff_units": "depth (mm)",
+    }
+    if row_groups is not None:
+        metadata["row_groups"] = row_groups
+    return metadata
+
+
+def gridcell_unit(
+    siminfo: SimInfo,
+    meta: dict[str, dict],
+    parquet: bytes | Path | None,
+    summary_table: pyarrow.Table | None = None,
+) -> SerializedResults:
+    """
+    the upload unit of a gridcell's parquet and summary, with one row per hru
+    for each statistic, and the meta of all its hrus.
+    """
+    model, gridcell = siminfo["model"], siminfo["gridcell"]
+    ext = "error" if any(data["exception"] for data in meta.values()) else "meta"
+    parquet_path = f"{model}/results/{gridcell}.parquet"
+    summary_bytes = None
+    if parquet is not None and summary_table is not None:
+        metadata = gridcell_metadata(siminfo, None)
+        summary_bytes = summary.to_parquet(summary_table, metadata)
+    return {
+        "name": gridcell,
+        "hrus": {hru: not data["exception"] for hru, data in meta.items()},
+        "parquet_path": None if parquet is None else parquet_path,
+        "parquet": parquet,
+        "summary_path": None if summary_bytes is None else summary_path(parquet_path),
+        "summary": summary_bytes,
+        "keys": None,
+        "meta_path": f"{model}/meta/{gridcell}.{ext}",
+        "meta": meta,
+        "stale_error_path": f"{model}/meta/{gridcell}.error" if ext == "meta" else None,
+    }
+
+
+def read_hru_results(source, hru: str) -> pyarrow.Table:
+    """
+    Read one hru from a gridcell results parquet written with `Layout.gridcell`,
+    concatenating its row groups if it was written in chunks.
+
+    source: path, bytes, or seekable file-like object, e.g.,
+        `ClimateTSBucket.open_blob(...)`, so that only the footer and the
+        hru's row group are fetched.
+    """
+    if isinstance(source, bytes | bytearray | memoryview):
+        source = pyarrow.BufferReader(source)
+    pfile = pq.ParquetFile(source)
+    metadata = orjson.loads(pfile.schema_arrow.metadata[b"tnc"])
+    row_group = metadata["row_groups"].get(hru)
+    if row_group is None:
+        raise KeyError(f"no results for {hru}")
+    if isinstance(row_group, list):
+        return pfile.read_row_groups(row_group)
+    return pfile.read_row_group(row_group)
+
+
+def serialize_results(
+    *,
+    results: dict[str, dict],
+    siminfo: SimInfo,
+    layout: Layout = Layout.hru,
+    summaries: bool = False,
+) -> list[SerializedResults]:
+    """
+    the upload units of an input file's results. With `summaries`, each parquet
+    gets a companion table of `summary.summarize` statistics.
+    """
+    if layout == Layout.gridcell:
+        return [
+            serialize_results_for_one_gridcell(
+                results=results, siminfo=siminfo, summaries=summaries
+            )
+        ]
+    return serialize_results_for_one_inputfile(
+        results=results, siminfo=siminfo, summaries=summaries
+    )
+
+
+def _spool() -> Path:
+    fd, name = tempfile.mkstemp(prefix="tnc-", suffix=".parquet")
+    os.close(fd)
+    return Path(name)
+
+
+def _merge_meta(previous: dict | None, data: dict) -> dict:
+    """
+    an hru's meta across chunks: errors add up, the first exception sticks, and
+    the state is that of the last chunk.
+    """
+    if previous is None:
+        return data
+    merged = dict(data)
+    if previous["errors"] is not None and data["errors"] is not None:
+        merged["errors"] = numpy.add(previous["errors"], data["errors"])
+    merged["exception"] = previous["exception"] or data["exception"]
+    return merged
+
+
+def _missing_results(chunk: SimInfo) -> dict[str, numpy.ndarray]:
+    missing = numpy.full(chunk["steps"], numpy.nan, dtype=numpy.float32)
+    return {"ix": hour_index(chunk)} | {k: missing for k in OUTPUTS}
+
+
+class _ChunkWriter:
+    """appends each chunk of a parquet as row groups of a spooled file."""
+
+    def __init__(self, metadata: dict):
+        self.metadata = metadata
+        self.path = _spool()
+        self.writer: pq.ParquetWriter | None = None
+
+    def write(self, table: pyarrow.Table):
+        if self.writer is None:
+            schema = table.schema.with_metadata({"tnc": orjson.dumps(self.metadata)})
+            self.writer = pq.ParquetWriter(self.path, schema, compression="none")
+        with metrics.timer("serialize"):
+            self.writer.write_table(table, row_group_size=max(table.num_rows, 1))
+
+    def close(self) -> Path | None:
+        if self.writer is not None:
+            self.writer.close()
+            return self.path
+        self.path.unlink(missing_ok=True)
+        return None
+
+    def discard(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.path.unlink(missing_ok=True)
+
+
+class _ChunkSummaries:
+    """`summary.summarize` tables of results written in chunks, by hru."""
+
+    def __init__(self):
+        self.totals: dict[str, list[pyarrow.Table]] = {}
+
+    def add(self, hru: str, table: pyarrow.Table):
+        # periods never span the january 1 boundaries of chunks
+        with metrics.timer("summary"):
+            self.totals.setdefault(hru, []).append(summary.period_totals(table))
+
+    def finish(self, hru: str, hourly: pyarrow.Table) -> pyarrow.Table:
+        """the hru's summary, with the flow duration of its whole `hourly` series."""
+        with metrics.timer("summary"):
+            fdc = summary.flow_duration(hourly)
+        totals = summary.concat_totals(self.totals.pop(hru, []))
+        return pyarrow.concat_tables([totals, fdc])
+
+
+def _serialize_chunks_per_hru(
+    chunks: Iterable[tuple[SimInfo, dict[str, dict]]],
+    siminfo: SimInfo,
+    summaries: _ChunkSummaries | None = None,
+) -> list[SerializedResults]:
+    meta: dict[str, dict] = {}
+    writers: dict[str, _ChunkWriter] = {}
+    try:
+        for _, results in chunks:
+            for hru, data in results.items():
+                data = dict(data)
+                res = data.pop("results")
+                meta[hru] = _merge_meta(meta.get(hru), data)
+                if res is None:
+                    continue
+                if hru not in writers:
+                    writers[hru] = _ChunkWriter(hru_metadata(siminfo, hru))
+                with metrics.timer("table"):
+                    table = build_results_arrow_table(res)
+                writers[hru].write(table)
+                if summaries is not None:
+                    summaries.add(hru, table)
+    except BaseException:
+        for writer in writers.values():
+            writer.discard()
+        raise
+
+    return [
+        _close_hru_chunks(siminfo, hru, data, writers.get(hru), summaries)
+        for hru, data in meta.items()
+    ]
+
+
+def _close_hru_chunks(
+    siminfo: SimInfo,
+    hru: str,
+    meta: dict,
+    writer: _ChunkWriter | None,
+    summaries: _ChunkSummaries | None,
+) -> SerializedResults:
+    if writer is not None and meta["exception"]:
+        writer.discard()  # failed in a later chunk
+        writer = None
+    parquet = writer.close() if writer is not None else None
+    summary_table = None
+    if parquet is not None and summaries is not None:
+        hourly = pq.read_table(parquet, columns=list(OUTPUTS))
+        summary_table = summaries.finish(hru, hourly)
+    return hru_unit(siminfo, hru, meta, parquet, summary_table)
+
+
+def _serialize_chunks_per_gridcell(
+    chunks: Iterable[tuple[SimInfo, dict[str, dict]]],
+    siminfo: SimInfo,
+    nchunks: int,
+    summaries: _ChunkSummaries | None = None,
+) -> SerializedResults:
+    meta: dict[str, dict] = {}
+    writer = None
+    try:
+        for chunk, results in chunks:
+            hrus = list(results)
+            if writer is None:
+                hru_dictionary = pyarrow.array(hrus, type=pyarrow.string())
+                row_groups = {
+                    hru: [i * len(hrus) + j for i in range(nchunks)]
+                    for j, hru in enumerate(hrus)
+                }
+                writer = _ChunkWriter(gridcell_metadata(siminfo, row_groups))
+            for j, hru in enumerate(hrus):
+                data = dict(results[hru])
+                res = data.pop("results") or _missing_results(chunk)
+                meta[hru] = _merge_meta(meta.get(hru), data)
+                with metrics.timer("table"):
+                    table = build_results_arrow_table_for_one_hru(
+                        res, j, hru_dictionary
+                    )
+                writer.write(table)
+                if summaries is not None:
+                    summaries.add(hru, table)
+    except BaseException:
+        if writer is not None:
+            writer.discard()
+        raise
+
+    parquet = writer.close() if writer else None
+    summary_table = None
+    if parquet is not None and summaries is not None:
+        pfile = pq.ParquetFile(parquet)
+        summary_table = pyarrow.concat_tables(
+            add_hru_column(
+                summaries.finish(
+                    hru, pfile.read_row_groups(groups, columns=list(OUTPUTS))
+                ),
+                j,
+                hru_dictionary,
+            )
+            for j, (hru, groups) in enumerate(row_groups.items())
+        )
+    return gridcell_unit(siminfo, meta, parquet, summary_table)
+
+
+def serialize_chunks(
+    chunks: Iterable[tuple[SimInfo, dict[str, dict]]],
+    *,
+    siminfo: SimInfo,
+    layout: Layout = Layout.hru,
+    nchunks: int,
+    summaries: bool = False,
+) -> list[SerializedResults]:
+    """
+    `serialize_results` for the `nchunks` (siminfo, results) chunks of one
+    gridcell's `hspf_runner.run_hrus_chunked`, consuming them as they come.
+
+    Each chunk is appended as row groups of parquets spooled to temporary
+    files, which `send_serialized` uploads and removes, so only one chunk of
+    results is in memory at a time. Layouts are as in `serialize_results`,
+    except that each hru of a gridcell parquet has a row group per chunk and
+    the chunks an hru ran before failing are kept, with NaN runoff after; the
+    meta document records the failure. Summaries add up the period totals of
+    each chunk and read the flow duration back from the spooled parquet.
+    """
+    chunk_summaries = _ChunkSummaries() if summaries else None
+    if layout == Layout.gridcell:
+        return [
+            _serialize_chunks_per_gridcell(chunks, siminfo, nchunks, chunk_summaries)
+        ]
+    return _serialize_chunks_per_hru(chunks, siminfo, chunk_summaries)
+
+
+def run_and_serialize(
+    data: dict,
+    siminfo: SimInfo,
+    hrus: list[str] | None = None,
+    layout: Layout = Layout.hru,
+    chunk_years: int | None = None,
+    saved: dict[str, dict] | None = None,
+    summaries: bool = False,
+) -> list[SerializedResults]:
+    """
+    Simulate and serialize one input document, in one run, or with
+    `chunk_years`, in chunks of that many calendar years; see `serialize_chunks`.
+    With the `saved` meta of earlier runs, only the steps after them are
+    simulated if they can be extended; see `extend_and_serialize`. With
+    `summaries`, each parquet gets a companion summary; see `serialize_results`.
+    """
+    if saved is not None and hrus is not None:
+        serialized = extend_and_serialize(
+            data, siminfo, hrus, layout, saved, summaries=summaries
+        )
+        if serialized is not None:
+            return serialized
+
+    if chunk_years is None:
+        results = run_one_datafile(data, siminfo, hrus=hrus)
+        return serialize_results(
+            results=results, siminfo=siminfo, layout=layout, summaries=summaries
+        )
+
+    input_ts = build_ts(data, siminfo)
+    chunks = (
+        (chunk, results[0])
+        for chunk, results in run_hrus_chunked(input_ts, siminfo, hrus, chunk_years)
+    )
+    nchunks = len(chunk_bounds(siminfo, chunk_years))
+    return serialize_chunks(
+        chunks, siminfo=siminfo, layout=layout, nchunks=nchunks, summaries=summaries
+    )
+
+
+def load_saved_meta(
+    client: ClimateTSBucket, siminfo: SimInfo, hrus: list[str], layout: Layout
+) -> dict[str, dict] | None:
+    """
+    The meta each of `hrus` saved at the end of its last run, or None unless
+    every one saved a `state` to extend; see `hspf_runner.saved_state`.
+    """
+    model, gridcell = siminfo["model"], siminfo["gridcell"]
+    if layout == Layout.gridcell:
+        meta = client.get_meta(f"{model}/meta/{gridcell}.meta") or {}
+    else:
+        meta = {h: client.get_meta(f"{model}/meta/{gridcell}-{h}.meta") for h in hrus}
+    saved = {hru: meta.get(hru) or {} for hru in hrus}
+    if not all(m.get("state") for m in saved.values()):
+        return None
+    return saved
+
+
+def extension_start(siminfo: SimInfo, saved: dict[str, dict]) -> int | None:
+    """
+    The first step of `siminfo` after the earlier runs of the `saved` meta, or
+    None if they can't be extended: they ended at different times, or not
+    within the series from which they were saved.
+    """
+    start = pandas.Timestamp(siminfo["start"])
+    states = [m["state"] for m in saved.values()]
+    (end, *others) = {s["end_time"] for s in states}
+    first = (pandas.Timestamp(end) - start) // pandas.Timedelta("1h") + 1
+    if others or not 0 < first <= siminfo["steps"]:
+        return None
+    steps = [
+        (pandas.Timestamp(s["time"]) - start) // pandas.Timedelta("1h") for s in states
+    ]
+    if not all(0 <= step <= first for step in steps):
+        return None
+    return first
+
+
+def _add_part(
+    unit: SerializedResults, saved: dict[str, dict], layout: Layout, stamp: str
+):
+    """upload `unit`'s parquet as a new part and list it in its hrus' meta."""
+    if unit["parquet_path"] is None:
+        return
+    unit["parquet_path"] = (
+        unit["parquet_path"].removesuffix(".parquet") + f".{stamp}.parquet"
+    )
+    if unit["summary_path"] is not None:
+        unit["summary_path"] = summary_path(unit["parquet_path"])
+    metas = unit["meta"] if layout == Layout.gridcell else {unit["name"]: unit["meta"]}
+    for hru, meta in metas.items():
+        meta["parts"] = [*saved[hru].get("parts", []), unit["parquet_path"]]
+
+
+def extend_and_serialize(
+    data: dict,
+    siminfo: SimInfo,
+    hrus: list[str],
+    layout: Layout,
+    saved: dict[str, dict],
+    summaries: bool = False,
+) -> list[SerializedResults] | None:
+    """
+    Simulate the steps of an input document after those of the earlier runs
+    that left the `saved` meta (see `load_saved_meta`), starting each hru from
+    its saved state, and serialize them as new parquet parts. Each hru's meta
+    document lists its `parts` in order and the state to extend it from next.
+    A part's summary covers its own steps. Returns None if the earlier runs
+    can't be extended, and no units if there are no new steps.
+    """
+    first = extension_start(siminfo, saved)
+    if first is None:
+        return None
+    if first == siminfo["steps"]:
+        return []
+
+    states = {hru: saved[hru]["state"] for hru in hrus}
+    extension, results = run_hrus_extension(
+        build_ts(data, siminfo), siminfo, hrus, states, first
+    )
+    serialized = serialize_results(
+        results=results, siminfo=extension, layout=layout, summaries=summaries
+    )
+    # parts are named for their first hour, e.g., 'R1C1/hru010.1981010100.parquet'
+    stamp = extension["start"].strftime("%Y%m%d%H")
+    for unit in serialized:
+        _add_part(unit, saved, layout, stamp)
+    return serialized
+
+
+def memo_options(
+    layout: Layout, chunk_years: int | None = None, summaries: bool = False
+) -> str:
+    """the run options that change what is written, for `memo.result_key`."""
+    return f"layout={layout.value};chunk_years={chunk_years};summaries={summaries}"
+
+
+def uploaded_keys(
+    client: ClimateTSBucket, model: str, gridcell: str, layout: Layout
+) -> dict[str, set[str]]:
+    """the keys of each hru's uploaded results, from their object metadata."""
+    sep = "." if layout == Layout.gridcell else "/"
+    found: dict[str, set[str]] = {}
+    for metadata in client.object_metadata(f"{model}/results/{gridcell}{sep}").values():
+        for hru, key in memo.keys_from_metadata(metadata).items():
+            found.setdefault(hru, set()).add(key)
+    return found
+
+
+def plan_memo(
+    client: ClimateTSBucket,
+    memo_index: memo.MemoIndex,
+    input_file: str,
+    hrus: list[str],
+    layout: Layout,
+    options: str = "",
+) -> tuple[list[str], dict[str, str]]:
+    """
+    (hrus to run, `memo.result_key` of each of `hrus`) for an input file.
+
+    An hru is skipped if the key of its last upload in `memo_index` matches
+    and is confirmed by the metadata of its uploaded results. The bucket is
+    only listed if the index has matches. With the gridcell layout, which
+    writes all hrus to one object, either all are skipped or none.
+    """
+    model, gridcell = parse_input_file(input_file)
+    version = client.input_version(input_file)
+    keys = {hru: memo.result_key(version, hru, options) for hru in hrus}
+
+    recorded = memo_index.keys(model, gridcell)
+    done = [hru for hru in hrus if recorded.get(hru) == keys[hru]]
+    if done:
+        uploaded = uploaded_keys(client, model, gridcell, layout)
+        done = [hru for hru in done if keys[hru] in uploaded.get(hru, ())]
+    if layout == Layout.gridcell and len(done) < len(hrus):
+        done = []
+    return [hru for hru in hrus if hru not in done], keys
+
+
+def attach_keys(serialized: list[SerializedResults], keys: dict[str, str]):
+    """set the keys of the hrus each unit uploaded successfully."""
+    for unit in serialized:
+        unit["keys"] = {hru: keys[hru] for hru, ok in unit["hrus"].items() if ok}
 
 
 def send_results_for_one_inputfile(
@@ -159,17 +849,40 @@ def send_results_for_one_inputfile(
     return input_file, elapsed, completed
 
 
+def parse_input_file(input_file: str) -> tuple[str, str]:
+    """
+    (model, gridcell) for an input file path like 'model/inputs/rc-input.json',
+    or a gridcell of a shard like 'model/inputs/name-shard.parquet#rc'.
+    """
+    name, gridcell = inputs.split_address(input_file)
+    model, _, input_file_name = name.split("/")
+    return model, gridcell or inputs.gridcell_of(input_file_name)
+
+
+def parse_error_file(error_file: str) -> tuple[str, str, str | None]:
+    """
+    (model, gridcell, hru) for an error marker. hru is None for markers of
+    the gridcell layout, which cover every hru of the input file.
+    """
+    model, _, name = error_file.split("/")
+    gridcell, _, hru = name.removesuffix(".error").partition("-")
+    return model, gridcell, hru or None
+
+
 def get_data_and_siminfo(input_file: str, client: ClimateTSBucket | None = None):
     if client is None:  # pragma: no cover
         client = get_client()
-    data = client.get_json(input_file)
+    data = client.get_input(input_file)
+    model, gridcell = parse_input_file(input_file)
+
+    return data, get_siminfo(data, model, gridcell)
+
+
+def get_siminfo(data: dict, model: str, gridcell: str) -> SimInfo:
+    """hourly siminfo spanning every day of an input document."""
     start_time = pandas.to_datetime(data["start_time"])
     end_time = pandas.to_datetime(data["end_time"]) + pandas.Timedelta("23h")
-    model, _, input_file_name = input_file.split("/")
-    gridcell = input_file_name.split("-")[0]
-    siminfo = get_TNC_siminfo(start_time, end_time, model, gridcell)
-
-    return data, siminfo
+    return get_TNC_siminfo(start_time, end_time, model, gridcell)
 
 
 def run_and_send_results_for_one_inputfile(
@@ -179,11 +892,7 @@ def run_and_send_results_for_one_inputfile(
     hrus: list[str] | None = None,
     client_factory: ClientFactory | None = None,
 ):
-    start = perf_counter()
-    if client_factory is None:  # pragma: no cover
-        client_factory = get_client
-
-    client = client_factory()
+    client = get_worker_client(client_factory, max_workers)
 
     data, siminfo = get_data_and_siminfo(input_file, client=client)
 
@@ -203,30 +912,395 @@ def run_and_send_results_for_one_inputfile(
     return input_file, run_time, send_time, completed
 
 
-def gather_args(
-    model: str | list[str] | None = None,
-    gridcell: str | list[str] | None = None,
-    client: ClimateTSBucket | None = None,
-) -> list[dict[str, str]]:
-    if client is None:  # pragma: no cover
-        client = get_client()
-    if model is None:
-        model = client.models
-    if isinstance(model, str):
-        model = [model]
+def discard(serialized: Iterable[SerializedResults]) -> None:
+    """remove the spooled parquets of serialized units that won't be sent."""
+    for s in serialized:
+        if isinstance(s["parquet"], Path):
+            s["parquet"].unlink(missing_ok=True)
 
-    valid_models = {m for m in client.models for substr in model if substr in m}
-    if not valid_models:
-        return []
 
-    args: list[dict[str, str]] = [
-        {"input_file": input_file}
-        for input_file in sorted(
-            client.get_precip_files(model=list(valid_models), gridcell=gridcell)
+def _upload_stage(
+    queue: Queue,
+    client: ClimateTSBucket,
+    max_workers: int | None,
+    finished: list[tuple[str, float, float, list[tuple[str, str]]]],
+    failures: list[BaseException],
+    manifest: RunManifest | None = None,
+    claims: Heartbeat | None = None,
+    memo_index: memo.MemoIndex | None = None,
+):
+    """consume serialized input files from `queue` until the `None` sentinel."""
+    with ThreadPoolExecutor(max_workers) as executor:
+        while (item := queue.get()) is not None:
+            input_file, run_time, serialized = item
+            if failures or not _still_held(claims, input_file):
+                # keep draining so the producer never blocks on a dead consumer
+                discard(serialized)
+                continue
+            start = perf_counter()
+            try:
+                completed = list(
+                    executor.map(lambda s: send_serialized(s, client), serialized)
+                )
+            except BaseException as e:
+                # units not yet sent when one failed are cancelled
+                failures.append(e)
+                discard(serialized)
+                continue
+            send_time = perf_counter() - start
+            finished.append((input_file, run_time, send_time, completed))
+
+            outcomes = [ok for s in serialized for ok in s["hrus"].values()]
+            metrics.emit(
+                {
+                    "event": "file",
+                    "input_file": input_file,
+                    "hrus": len(outcomes),
+                    "failed": outcomes.count(False),
+                    "run_seconds": run_time,
+                    "send_seconds": send_time,
+                }
+            )
+            metrics.flush()
+
+            if claims is not None:
+                claims.complete(input_file)
+
+            model, gridcell = parse_input_file(input_file)
+            if manifest is not None:
+                manifest.record(
+                    (model, gridcell, hru, ok)
+                    for s in serialized
+                    for hru, ok in s["hrus"].items()
+                )
+            if memo_index is not None:
+                memo_index.record(
+                    (model, gridcell, hru, key)
+                    for s in serialized
+                    for hru, key in (s["keys"] or {}).items()
+                )
+
+
+def _still_held(claims: Heartbeat | None, input_file: str) -> bool:
+    """whether the lease on `input_file`, if any, renews; abandons it if not."""
+    if claims is None or claims.renew(input_file):
+        return True
+    metrics.emit(metrics.skipped_file(input_file, "lease_lost"))
+    claims.abandon(input_file)
+    return False
+
+
+def _compute_file(
+    client: ClimateTSBucket,
+    input_file: str,
+    claims: Heartbeat | None,
+    memo_index: memo.MemoIndex | None,
+    options: str,
+    *,
+    hrus: list[str] | None,
+    layout: Layout,
+    incremental: bool,
+    **kwargs,
+) -> tuple[float, list[SerializedResults]] | None:
+    """
+    download, simulate, and serialize the `hrus` of `input_file` that are
+    not memoized, as `run_and_serialize` with `kwargs`; `(run_time,
+    serialized)`, or None if its lease was lost before the simulation.
+    """
+    if hrus is None and (incremental or memo_index is not None):
+        hrus = list(wwhm.wwhm_hru_params().keys())  # pragma: no cover
+    keys = None
+    if memo_index is not None:
+        hrus, keys = plan_memo(client, memo_index, input_file, hrus, layout, options)
+        if not hrus:
+            return 0.0, []
+    data, siminfo = get_data_and_siminfo(input_file, client=client)
+    saved = None
+    if incremental:
+        saved = load_saved_meta(client, siminfo, hrus, layout)
+    if not _still_held(claims, input_file):
+        return None
+
+    with governor.compute_slot():
+        start = perf_counter()
+        serialized = run_and_serialize(
+            data, siminfo, hrus=hrus, layout=layout, saved=saved, **kwargs
         )
-    ]
+        del data
+        run_time = perf_counter() - start
+    if keys is not None:
+        attach_keys(serialized, keys)
+    return run_time, serialized
+
+
+def run_and_send_results_for_inputfiles(
+    *,
+    input_files: list[str],
+    max_workers=None,
+    hrus: list[str] | None = None,
+    client_factory: ClientFactory | None = None,
+    queue_size: int = 2,
+    layout: Layout = Layout.hru,
+    hrus_by_file: dict[str, list[str]] | None = None,
+    manifest_path: str | Path | None = None,
+    work_queue: str | None = None,
+    chunk_years: int | None = None,
+    incremental: bool = False,
+    summaries: bool = False,
+    memo_path: str | Path | None = None,
+) -> list[tuple[str, float, float, list[tuple[str, str]]]]:
+    """
+    Streaming version of `run_and_send_results_for_one_inputfile` for many files.
+
+    The calling thread downloads, simulates, and serializes each input file and
+    hands the result to a dedicated upload thread through a queue of at most
+    `queue_size` files, so the next file is computed while earlier results are
+    uploading. The producer blocks while the queue is full, which bounds memory
+    to roughly `queue_size + 2` files worth of results.
+
+    Returns `(input_file, run_time, send_time, completed)` for each file, where
+    run_time covers simulation and serialization, and send_time the uploads.
+    With `layout=Layout.gridcell` each file is written as one consolidated
+    parquet and meta document rather than one of each per hru.
+
+    hrus_by_file: overrides `hrus` for the listed input files, e.g., to resume
+        only the hrus that have not completed yet.
+    manifest_path: records every uploaded (model, gridcell, hru) and whether
+        it succeeded in the `RunManifest` at this path.
+    client_factory: called once per process; see `bucket.get_worker_client`.
+    work_queue: spec of a `workqueue.open_queue` shared with other nodes. Input
+        files another node has claimed or completed are skipped. The leases
+        on claimed files are renewed in the background, checked before each
+        file is computed and uploaded, and completed once its results are;
+        a file whose lease is lost is abandoned to the node that took it.
+    chunk_years: simulate each file in chunks of this many calendar years,
+        carrying each hru's states across, and spool the results to disk;
+        bounds memory for long series. See `serialize_chunks`.
+    incremental: simulate only the steps after those of the previous run of
+        each input file, from the states it saved in its meta documents, and
+        upload them as new parts; see `extend_and_serialize`. Input files
+        whose hrus can't be extended are run in full.
+    summaries: upload daily, monthly, and annual totals and flow-duration
+        percentiles of the runoff with each parquet, computed from the
+        results in memory; see `summary`.
+    memo_path: skip the hrus of each input file whose results were uploaded
+        with the same `memo.result_key`, as recorded in the `memo.MemoIndex`
+        at this path and in the results' object metadata; see `plan_memo`.
+        Input files with nothing left are not downloaded.
+    """
+    client = get_worker_client(client_factory, max_workers)
+
+    hrus_by_file = hrus_by_file or {}
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    claims = Heartbeat(open_queue(work_queue, client)) if work_queue else None
+    memo_index = memo.MemoIndex(memo_path) if memo_path else None
+    options = memo_options(layout, chunk_years, summaries)
+
+    queue: Queue = Queue(maxsize=max(queue_size, 1))
+    finished: list[tuple[str, float, float, list[tuple[str, str]]]] = []
+    failures: list[BaseException] = []
+    uploader = Thread(
+        target=_upload_stage,
+        args=(
+            queue,
+            client,
+            max_workers,
+            finished,
+            failures,
+            manifest,
+            claims,
+            memo_index,
+        ),
+        daemon=True,
+    )
+    uploader.start()
+    if claims is not None:
+        claims.start()
+
+    try:
+        for input_file in input_files:
+            if failures:  # pragma: no cover
+                break
+            if claims is not None and not claims.claim(input_file):
+                metrics.emit(metrics.skipped_file(input_file, "claimed"))
+                continue
+            computed = _compute_file(
+                client,
+                input_file,
+                claims,
+                memo_index,
+                options,
+                hrus=hrus_by_file.get(input_file, hrus),
+                layout=layout,
+                chunk_years=chunk_years,
+                incremental=incremental,
+                summaries=summaries,
+            )
+            if computed is not None:
+                queue.put((input_file, *computed))
+    finally:
+        queue.put(None)
+        uploader.join()
+        if claims is not None:
+            claims.stop()
+        metrics.flush()
+
+    if failures:  # pragma: no cover
+        raise failures[0]
+
+    return finished
+
+
+def init_worker(
+    shared_tables: shared.SharedTables | None = None,
+    prime: bool = False,
+    metrics_queue=None,
+    slots: governor.Slots | None = None,
+):
+    """
+    Process pool initializer. Maps the static tables published by the parent
+    with `shared.publish_tables` instead of re-reading them in every worker,
+    and with `prime`, loads the numba kernels before the worker takes a job.
+    With `metrics_queue`, the worker sends its `metrics` events there, and
+    with `slots`, it shares the run's compute and io budgets; see `governor`.
+    """
+    governor.install(slots)
+    if shared_tables:
+        shared.attach_tables(shared_tables)
+        # drop any copies inherited from a forked parent
+        pet.load_evap.cache_clear()
+        wwhm.get_wwhm_params_per.cache_clear()
+        wwhm.get_wwhm_params_imp.cache_clear()
+        wwhm.wwhm_hru_params.cache_clear()
+    if prime:
+        warmup.warmup()
+    # after priming, so its kernel calls are not counted as the run's
+    if metrics_queue is not None:
+        metrics.set_sink(metrics_queue.put)
+
+
+def input_sizes(
+    input_files: list[str], client, index: ListingIndex | None = None
+) -> dict[str, float]:
+    """
+    Blob bytes of each input file, a proxy for the length of its series. Each
+    gridcell of a shard is charged an equal share of the shard. Answered from
+    the `ListingIndex` if one is passed or configured, else with one listing
+    per model.
+    """
+    if index is None:
+        index = ListingIndex.from_settings()
+    blob_names = {f: inputs.split_address(f)[0] for f in input_files}
+    shares = Counter(blob_names.values())
+    models = sorted({parse_input_file(f)[0] for f in input_files})
+
+    if index is not None:
+        blobs = [(name, size) for name, _, size in index.query(models)]
+    else:
+        blobs = [
+            (b.name, b.size)
+            for m in models
+            for b in client.bucket.list_blobs(prefix=f"{m}/inputs/")
+        ]
+    sizes = {name: size or 0 for name, size in blobs if name in shares}
+
+    return {f: sizes.get(name, 0) / shares[name] for f, name in blob_names.items()}
+
+
+def longest_first(
+    input_files: list[str],
+    sizes: dict[str, float],
+    hrus: list[str],
+    hrus_by_file: dict[str, list[str]] | None = None,
+    rotate: bool = False,
+) -> list[str]:
+    """
+    input files by estimated cost, series length times hrus, largest first,
+    so the longest jobs don't start last and hold up the end of the run.
+    Ties keep their order.
+
+    With `rotate`, each run of files whose costs fall within the same power
+    of two starts at a random file instead, so nodes ordering the same files
+    for a shared work queue rarely contend for claims, yet still start with
+    the longest.
+    """
+    hrus_by_file = hrus_by_file or {}
+    cost = {f: sizes.get(f, 0) * len(hrus_by_file.get(f, hrus)) for f in input_files}
+    ordered = sorted(input_files, key=cost.__getitem__, reverse=True)
+    if not rotate:
+        return ordered
 
-    return args
+    rotated: list[str] = []
+    for _, bucket in groupby(ordered, key=lambda f: math.frexp(cost[f])[1]):
+        files = list(bucket)
+        start = random.randrange(len(files))
+        rotated += files[start:] + files[:start]
+    return rotated
+
+
+def plan_resume(
+    input_files: list[str], hrus: list[str], completed: set[Unit]
+) -> dict[str, list[str]]:
+    """the hrus of each input file that are not yet in `completed`."""
+    plan = {}
+    for input_file in input_files:
+        model, gridcell = parse_input_file(input_file)
+        remaining = [h for h in hrus if (model, gridcell, h) not in completed]
+        if remaining:
+            plan[input_file] = remaining
+    return plan
+
+
+def plan_retry(
+    input_files: list[str], hrus: list[str], error_files: list[str]
+) -> dict[str, list[str]]:
+    """the hrus of each input file that left an .error marker."""
+    failed: dict[tuple[str, str], set[str]] = {}
+    for error_file in error_files:
+        model, gridcell, hru = parse_error_file(error_file)
+        failed.setdefault((model, gridcell), set()).update(
+            hrus if hru is None else [hru]
+        )
+
+    plan = {}
+    for input_file in input_files:
+        retry = failed.get(parse_input_file(input_file), set())
+        remaining = [h for h in hrus if h in retry]
+        if remaining:
+            plan[input_file] = remaining
+    return plan
+
+
+def plan_run(
+    input_files: list[str],
+    hrus: list[str],
+    *,
+    error_files: list[str] | None = None,
+    completed: set[Unit] | None = None,
+    layout: Layout = Layout.hru,
+) -> dict[str, list[str]]:
+    """
+    Narrow a run to the hrus of each input file that still need work: only
+    those with .error markers if `error_files` is given, and without those
+    already `completed` if given. Input files with nothing left are omitted.
+
+    The gridcell layout writes every hru of an input file to one object, so
+    any input file with work left reruns all of `hrus`; running a subset
+    would replace the object with only that subset.
+    """
+    plan = {f: list(hrus) for f in input_files}
+    if error_files is not None:
+        plan = plan_retry(input_files, hrus, error_files)
+    if completed is not None:
+        resumed = plan_resume(input_files, hrus, completed)
+        plan = {
+            f: [h for h in plan[f] if h in resumed.get(f, [])]
+            for f in plan
+            if f in resumed
+        }
+    if layout == Layout.gridcell:
+        return {f: list(hrus) for f, v in plan.items() if v}
+    return {f: v for f, v in plan.items() if v}
 
 
 def run(
@@ -245,6 +1319,8 @@ def run(
 
     >>> tnc run -m HIS -g R17C42 -h hru250
     """
+    from tqdm import tqdm
+
     args = gather_args(model, gridcell)
     if hrus is None:
         hrus = list(wwhm.wwhm_hru_params().keys())
@@ -254,7 +1330,6 @@ def run(
     start = perf_counter()
 
     print(f"processing {len(args)} input files...")
-
     for kwargs in tqdm(args):
         _, seconds, send_time, completed = run_and_send_results_for_one_inputfile(
             **kwargs,
@@ -0,0 +1,58 @@
+import sqlite3
+import time
+from collections.abc import Iterable
+from contextlib import closing
+from pathlib import Path
+
+Unit = tuple[str, str, str]  # (model, gridcell, hru)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    model TEXT NOT NULL,
+    gridcell TEXT NOT NULL,
+    hru TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    written_at REAL NOT NULL,
+    PRIMARY KEY (model, gridcell, hru)
+)
+"""
+
+
+class RunManifest:
+    """
+    Local record of which (model, gridcell, hru) results were written, and
+    whether they succeeded or left an .error marker.
+
+    Backed by sqlite so that every worker process can record its own units as
+    they finish uploading and a restarted run can look them up without
+    listing the bucket.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as con, con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def record(self, units: Iterable[tuple[str, str, str, bool]]) -> None:
+        now = time.time()
+        rows = [(m, g, h, int(ok), now) for m, g, h, ok in units]
+        with closing(self._connect()) as con, con:
+            con.executemany("INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?, ?)", rows)
+
+    def units(self, ok: bool | None = None) -> set[Unit]:
+        query, params = "SELECT model, gridcell, hru FROM units", ()
+        if ok is not None:
+            query, params = query + " WHERE ok = ?", (int(ok),)
+        with closing(self._connect()) as con:
+            return set(con.execute(query, params).fetchall())
+
+    def completed(self) -> set[Unit]:
+        return self.units(ok=True)
+
+    def failed(self) -> set[Unit]:
+        return self.units(ok=False)
@@ -0,0 +1,132 @@
+import hashlib
+import importlib.metadata
+import sqlite3
+import time
+from collections.abc import Iterable
+from contextlib import closing
+from functools import cache
+from pathlib import Path
+
+import orjson
+
+from . import __version__, bundle, wwhm
+from .config import settings
+
+# object metadata holding the key of each hru's results in a parquet
+METADATA_PREFIX = "tnc-key-"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS keys (
+    model TEXT NOT NULL,
+    gridcell TEXT NOT NULL,
+    hru TEXT NOT NULL,
+    key TEXT NOT NULL,
+    written_at REAL NOT NULL,
+    PRIMARY KEY (model, gridcell, hru)
+)
+"""
+
+
+@cache
+def engine_version() -> str:
+    """versions of this package and of the HSP2 kernels it runs."""
+    try:
+        hsp2 = importlib.metadata.version("hsp2")
+    except importlib.metadata.PackageNotFoundError:  # pragma: no cover
+        hsp2 = "unknown"
+    return f"tnc-{__version__}/hsp2-{hsp2}"
+
+
+@cache
+def param_hash(hru: str) -> str:
+    """digest of the hru's WWHM parameter row."""
+    params = orjson.dumps(wwhm.wwhm_hru_params()[hru], option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(params).hexdigest()
+
+
+@cache
+def _pet_hash(path: Path, is_bundle: bool, mtime_ns: int, size: int) -> str:
+    if is_bundle:
+        arrays = bundle.read_manifest(path)["arrays"]
+        if "evap" in arrays:
+            return f"bundle:{arrays['evap']['sha256']}"
+        return ""
+    return f"csv:{hashlib.sha256(path.read_bytes()).hexdigest()}"
+
+
+def _stat_key(path: Path, is_bundle: bool) -> tuple:
+    stat = (path / bundle.MANIFEST if is_bundle else path).stat()
+    return path, is_bundle, stat.st_mtime_ns, stat.st_size
+
+
+def pet_hash() -> str:
+    """
+    digest of the PET climatology `pet.load_evap` reads: the evap array of
+    the static bundle, if it has one, or else the PET_MM_DAILY csv; empty when
+    there is neither and the inputs carry their own PET.
+    """
+    if settings.STATIC_BUNDLE is not None:
+        digest = _pet_hash(*_stat_key(Path(settings.STATIC_BUNDLE), True))
+        if digest:
+            return digest
+    path = Path(settings.PET_MM_DAILY)
+    return _pet_hash(*_stat_key(path, False)) if path.exists() else ""
+
+
+def result_key(input_version: str, hru: str, options: str = "") -> str:
+    """
+    Content address of an hru's results: a digest of the input blob's version
+    (see `ClimateTSBucket.input_version`), the hru's parameters, the PET
+    climatology, the engine version, and the run `options` that change what
+    is written.
+    """
+    parts = [input_version, param_hash(hru), pet_hash(), engine_version(), options]
+    return hashlib.sha256(orjson.dumps(parts)).hexdigest()
+
+
+def object_metadata(keys: dict[str, str]) -> dict[str, str]:
+    """the object metadata recording the `keys` of the hrus in a parquet."""
+    return {METADATA_PREFIX + hru: key for hru, key in keys.items()}
+
+
+def keys_from_metadata(metadata: dict[str, str] | None) -> dict[str, str]:
+    """the hru keys recorded in an object's metadata by `object_metadata`."""
+    return {
+        name.removeprefix(METADATA_PREFIX): key
+        for name, key in (metadata or {}).items()
+        if name.startswith(METADATA_PREFIX)
+    }
+
+
+class MemoIndex:
+    """
+    Local record of the `result_key` of the last results uploaded for each
+    (model, gridcell, hru), so a run can tell which hrus are unchanged
+    without reading the bucket. Backed by sqlite like `RunManifest`.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as con, con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def record(self, keys: Iterable[tuple[str, str, str, str]]) -> None:
+        """record (model, gridcell, hru, key) rows."""
+        now = time.time()
+        rows = [(m, g, h, k, now) for m, g, h, k in keys]
+        with closing(self._connect()) as con, con:
+            con.executemany("INSERT OR REPLACE INTO keys VALUES (?, ?, ?, ?, ?)", rows)
+
+    def keys(self, model: str, gridcell: str) -> dict[str, str]:
+        """the recorded key of each hru of a gridcell."""
+        with closing(self._connect()) as con:
+            rows = con.execute(
+                "SELECT hru, key FROM keys WHERE model = ? AND gridcell = ?",
+                (model, gridcell),
+            ).fetchall()
+        return dict(rows)
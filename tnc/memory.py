@@ -0,0 +1,92 @@
+import os
+import re
+import resource
+from pathlib import Path
+
+# Measured on 1 and 4 year runs of all 30 hrus (`benchmarks/bench.py` inputs)
+# and rounded up: a primed worker's resident size before its first job, then
+# the growth per hourly step of the inputs and per step of each hru.
+WORKER_BASE_BYTES = 384 * 2**20  # interpreter, numpy/pandas/pyarrow, kernels
+INPUT_BYTES_PER_STEP = 64  # raw and decoded input, hourly PREC and PETINP
+BYTES_PER_HRU_STEP = 32  # kernel outputs, float32 results, arrow buffers
+SERIALIZED_BYTES_PER_HRU_STEP = 8  # parquet bytes waiting to upload
+
+_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$", re.IGNORECASE)
+
+
+def parse_size(size: str) -> int:
+    """bytes of a size like '512M', '16G', or '1.5GiB'."""
+    match = _SIZE.match(size)
+    if match is None:
+        raise ValueError(f"expected a size like '16G', got {size!r}")
+    return int(float(match[1]) * _UNITS[match[2].upper()])
+
+
+def format_size(nbytes: float) -> str:
+    return f"{nbytes / 2**30:.1f} GiB"
+
+
+def _status_kib(path: Path, field: str) -> int | None:
+    try:
+        with path.open() as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        pass
+    return None
+
+
+def available_memory() -> int:
+    """bytes the system can give to new allocations without swapping."""
+    kib = _status_kib(Path("/proc/meminfo"), "MemAvailable")
+    if kib is not None:
+        return kib * 1024
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def rss(pid: int | None = None) -> int:
+    """resident bytes of a process, 0 if it has exited."""
+    kib = _status_kib(Path(f"/proc/{'self' if pid is None else pid}/status"), "VmRSS")
+    if kib is None and pid is None:  # pragma: no cover
+        # no procfs; ru_maxrss is the peak in KiB on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return (kib or 0) * 1024
+
+
+def tree_rss(pids: list[int]) -> int:
+    """resident bytes of this process plus those of `pids`, e.g., its workers."""
+    return rss() + sum(rss(pid) for pid in pids)
+
+
+def estimate_job_bytes(
+    steps: int, nhrus: int, queue_size: int = 2, chunk_steps: int | None = None
+) -> int:
+    """
+    Peak bytes a worker adds while streaming input files of `steps` hours and
+    `nhrus` hrus through `main.run_and_send_results_for_inputfiles`: one file
+    being computed plus up to `queue_size + 1` serialized files waiting for or
+    in upload. When run in chunks of at most `chunk_steps`, only one chunk of
+    results is held and serialized files are spooled to disk.
+    """
+    if chunk_steps is not None:
+        return steps * INPUT_BYTES_PER_STEP + chunk_steps * nhrus * BYTES_PER_HRU_STEP
+    compute = steps * (INPUT_BYTES_PER_STEP + nhrus * BYTES_PER_HRU_STEP)
+    queued = (queue_size + 1) * steps * nhrus * SERIALIZED_BYTES_PER_HRU_STEP
+    return compute + queued
+
+
+def max_workers(budget: int, job_bytes: int) -> int:
+    """the most primed workers, each running one job, that fit in `budget`."""
+    return max(budget // (WORKER_BASE_BYTES + job_bytes), 1)
+
+
+def memory_budget(max_memory: int | None = None) -> int:
+    """
+    Bytes the run may keep resident, counting this process: `max_memory` if
+    given, else what this process holds now plus 90% of available memory.
+    """
+    if max_memory is not None:
+        return max_memory
+    return rss() + int(0.9 * available_memory())
@@ -0,0 +1,290 @@
+import math
+import os
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from queue import Queue
+from time import perf_counter
+from typing import IO, Any
+
+import orjson
+
+# in pipeline order; see `timer` for where each is measured
+STAGES = (
+    "download",
+    "decode",
+    "pet",
+    "hspf",
+    "table",
+    "serialize",
+    "summary",
+    "upload",
+    "rm_blob",
+    "compute_wait",
+    "io_wait",
+)
+
+# upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+Event = dict[str, Any]
+Sink = Callable[[list[Event]], Any]
+
+# where this process sends its events; none are kept until a sink is set
+_sink: Sink | None = None
+_pending: list[Event] = []
+_lock = threading.Lock()
+
+
+def set_sink(sink: Sink | None) -> None:
+    """
+    send this process's events to `sink` in batches, e.g., the `put` of a
+    multiprocessing queue read by a `Collector` in the parent.
+    """
+    global _sink
+    with _lock:
+        _sink = sink
+        _pending.clear()
+
+
+def emit(event: Event) -> None:
+    if _sink is None:
+        return
+    event.setdefault("pid", os.getpid())
+    event.setdefault("time", time.time())
+    with _lock:
+        _pending.append(event)
+
+
+def flush() -> None:
+    """hand the events emitted since the last flush to the sink."""
+    with _lock:
+        events = _pending[:]
+        _pending.clear()
+        sink = _sink
+    if events and sink is not None:
+        sink(events)
+
+
+@contextmanager
+def timer(stage: str, count: int = 1, **fields) -> Iterator[dict[str, Any]]:
+    """
+    emit a `stage` event with the seconds taken by the block. `count` is the
+    number of units (e.g., hrus of one batched kernel call) the block handled.
+    Extra fields, e.g., `bytes`, may also be added to the yielded dict.
+    """
+    start = perf_counter()
+    try:
+        yield fields
+    finally:
+        if _sink is not None:
+            emit(
+                {
+                    "event": "stage",
+                    "stage": stage,
+                    "seconds": perf_counter() - start,
+                    "count": count,
+                    **fields,
+                }
+            )
+
+
+def transfer(stage: str, nbytes: int, skipped: bool = False) -> Event:
+    """
+    a `transfer` event of `nbytes` moved by `stage`, or not moved because the
+    destination already held them.
+    """
+    return {"event": "transfer", "stage": stage, "bytes": nbytes, "skipped": skipped}
+
+
+def skipped_file(input_file: str, reason: str) -> Event:
+    """
+    a `file` event for an input file this process gave up without results,
+    e.g., one `claimed` by another node, so progress still counts it.
+    """
+    return {
+        "event": "file",
+        "input_file": input_file,
+        "hrus": 0,
+        "failed": 0,
+        "skipped": reason,
+    }
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, weight: int = 1) -> None:
+        i = next((i for i, b in enumerate(self.buckets) if value <= b), -1)
+        self.counts[i] += weight
+        self.sum += value * weight
+        self.count += weight
+
+    def cumulative(self) -> Iterator[tuple[float, int]]:
+        total = 0
+        for bound, n in zip((*self.buckets, math.inf), self.counts, strict=True):
+            total += n
+            yield bound, total
+
+
+class Registry:
+    """
+    Run totals aggregated from events: a latency histogram per stage, with one
+    observation per unit of `count` at its mean duration, plus counters of
+    files run or skipped, hrus, failed hrus, and bytes moved or skipped by
+    each stage.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages: dict[str, Histogram] = {}
+        self.bytes: dict[str, int] = {}
+        self.skipped_bytes: dict[str, int] = {}
+        self.files = 0
+        self.skipped_files = 0
+        self.hrus = 0
+        self.failed_hrus = 0
+        self._lock = threading.Lock()
+
+    def observe(self, event: Event) -> None:
+        with self._lock:
+            if event["event"] == "stage":
+                count = max(event.get("count", 1), 1)
+                hist = self.stages.setdefault(event["stage"], Histogram())
+                hist.observe(event["seconds"] / count, count)
+                if "bytes" in event:
+                    stage = event["stage"]
+                    self.bytes[stage] = self.bytes.get(stage, 0) + event["bytes"]
+            elif event["event"] == "transfer":
+                counts = self.skipped_bytes if event["skipped"] else self.bytes
+                stage = event["stage"]
+                counts[stage] = counts.get(stage, 0) + event["bytes"]
+            elif event["event"] == "file" and event.get("skipped"):
+                self.skipped_files += 1
+            elif event["event"] == "file":
+                self.files += 1
+                self.hrus += event["hrus"]
+                self.failed_hrus += event["failed"]
+
+    def throughput(self) -> float:
+        """hrus per second (wall) since the registry was created."""
+        return self.hrus / max(time.time() - self.started, 1e-9)
+
+    def summary(self) -> list[tuple[str, int, float]]:
+        """(stage, units, total seconds) in pipeline order."""
+        order = {s: i for i, s in enumerate(STAGES)}
+        with self._lock:
+            return [
+                (stage, hist.count, hist.sum)
+                for stage, hist in sorted(
+                    self.stages.items(), key=lambda kv: order.get(kv[0], len(order))
+                )
+            ]
+
+    def to_prometheus(self) -> str:
+        """the registry in the Prometheus text exposition format."""
+        lines = [
+            "# HELP tnc_stage_seconds time per unit of work in each pipeline stage.",
+            "# TYPE tnc_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, hist in self.stages.items():
+                for bound, total in hist.cumulative():
+                    le = "+Inf" if bound == math.inf else repr(float(bound))
+                    lines.append(
+                        f'tnc_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {total}'
+                    )
+                lines.append(f'tnc_stage_seconds_sum{{stage="{stage}"}} {hist.sum!r}')
+                lines.append(f'tnc_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+
+            for name, counts in (
+                ("bytes", self.bytes),
+                ("skipped_bytes", self.skipped_bytes),
+            ):
+                lines += [f"# TYPE tnc_stage_{name}_total counter"]
+                lines += [
+                    f'tnc_stage_{name}_total{{stage="{stage}"}} {n}'
+                    for stage, n in counts.items()
+                ]
+            for name, value in (
+                ("files", self.files),
+                ("skipped_files", self.skipped_files),
+                ("hrus", self.hrus),
+                ("failed_hrus", self.failed_hrus),
+            ):
+                lines += [
+                    f"# TYPE tnc_{name}_total counter",
+                    f"tnc_{name}_total {value}",
+                ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str | Path) -> None:
+        """replace `path` atomically, e.g., for node_exporter's textfile collector."""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(self.to_prometheus())
+        os.replace(tmp, path)
+
+
+class Collector:
+    """
+    Parent side of the worker event queue: a thread that aggregates every
+    batch into `registry`, appends each event to a JSONL file, calls
+    `on_file` for each finished or skipped input file, and rewrites the Prometheus
+    snapshot at most every `interval` seconds and once more when stopped.
+    """
+
+    def __init__(
+        self,
+        queue: Queue,
+        registry: Registry,
+        *,
+        jsonl: str | Path | None = None,
+        prometheus: str | Path | None = None,
+        on_file: Callable[[Event], Any] | None = None,
+        interval: float = 10,
+    ):
+        self.queue = queue
+        self.registry = registry
+        self.jsonl = jsonl
+        self.prometheus = prometheus
+        self.on_file = on_file
+        self.interval = interval
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "Collector":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.queue.put(None)
+        self._thread.join()
+
+    def _handle(self, events: Iterable[Event], out: IO[bytes] | None) -> None:
+        for event in events:
+            self.registry.observe(event)
+            if out is not None:
+                out.write(orjson.dumps(event) + b"\n")
+            if event["event"] == "file" and self.on_file is not None:
+                self.on_file(event)
+
+    def _run(self) -> None:
+        out = open(self.jsonl, "ab") if self.jsonl else None
+        last = perf_counter()
+        try:
+            while (events := self.queue.get()) is not None:
+                self._handle(events, out)
+                if self.prometheus and perf_counter() - last >= self.interval:
+                    self.registry.write_prometheus(self.prometheus)
+                    last = perf_counter()
+        finally:
+            if out is not None:
+                out.close()
+            if self.prometheus:
+                self.registry.write_prometheus(self.prometheus)
@@ -1,37 +1,98 @@
 from functools import lru_cache
 
+import numpy
 import pandas
 
-from . import convert
+from . import bundle, convert, shared
 from .config import settings
-from .hspf_runner import SimInfo
+from .schema import SimInfo
+
+_NS_PER_HOUR = 3_600_000_000_000
+_NS_PER_DAY = 24 * _NS_PER_HOUR
+
+
+def month_day_key(month, day):
+    """integer day-of-year key that is stable across leap and non-leap years."""
+    return month * 32 + day
 
 
 @lru_cache
-def load_evap():
-    evap = (
-        pandas.read_csv(settings.PET_MM_DAILY, parse_dates=["date_arb_year"])
-        .iloc[:, 1:]
-        .assign(month=lambda df: df.date_arb_year.dt.month.astype(str))
-        .assign(day=lambda df: df.date_arb_year.dt.day.astype(str))
-        .drop(columns=["date_arb_year"])
+def load_evap() -> pandas.DataFrame:
+    """
+    Daily PET climatology (mm/day) with one column per gridcell, indexed by
+    `month_day_key` and covering every possible key. Days missing from the
+    climatology, e.g., Feb 29th, are NaN.
+    """
+    if (table := shared.get_table("evap")) is not None:
+        return table
+    if (table := bundle.get_table("evap")) is not None:
+        return table
+    return read_evap(settings.PET_MM_DAILY)
+
+
+def read_evap(path) -> pandas.DataFrame:
+    """the PET climatology csv as a `load_evap` table."""
+    evap = pandas.read_csv(path, parse_dates=["date_arb_year"]).iloc[:, 1:]
+    dates = evap.pop("date_arb_year")
+    keys = month_day_key(dates.dt.month.to_numpy(), dates.dt.day.to_numpy())
+
+    return (
+        evap.astype(numpy.float64)
+        .set_axis(keys, axis=0)
+        .reindex(numpy.arange(month_day_key(12, 31) + 1))
+    )
+
+
+def _day_numbers(start, stop) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    days since the epoch of every day touched by an hourly range from start to
+    stop, and the offset of each hourly step into those days.
+    """
+    start_ns, stop_ns = pandas.Timestamp(start).value, pandas.Timestamp(stop).value
+    nsteps = (stop_ns - start_ns) // _NS_PER_HOUR + 1
+    hour_ns = start_ns + numpy.arange(nsteps, dtype=numpy.int64) * _NS_PER_HOUR
+    first_day = start_ns // _NS_PER_DAY
+    days = numpy.arange(first_day, hour_ns[-1] // _NS_PER_DAY + 1, dtype=numpy.int64)
+
+    return days, hour_ns // _NS_PER_DAY - first_day
+
+
+@lru_cache(maxsize=16)
+def _evap_array(gridcell: str, start: pandas.Timestamp, stop: pandas.Timestamp):
+    table = load_evap()[gridcell].to_numpy()
+
+    days, step_day = _day_numbers(start, stop)
+    dates = days.astype("datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    month = months.astype(numpy.int64) % 12 + 1
+    day = (dates - months.astype("datetime64[D]")).astype(numpy.int64) + 1
+
+    # bundled climatologies are float32; compute the series in double
+    daily = (
+        table[month_day_key(month, day)].astype(numpy.float64) / 24 * convert.MM_TO_INCH
     )
 
-    return evap
-
-
-def build_evap_ts(siminfo: SimInfo):
-    evap = load_evap()[["month", "day", siminfo["gridcell"]]]
-    evap_ts = (
-        pandas.date_range(siminfo["start"], siminfo["stop"], freq="h")
-        .to_frame(name="datetime")
-        .assign(month=lambda df: df.datetime.dt.month.astype(str))
-        .assign(day=lambda df: df.datetime.dt.day.astype(str))
-        .merge(evap, how="left", on=["month", "day"])
-        .set_index("datetime")
-        .loc[:, siminfo["gridcell"]]
-        .div(24)
-        .mul(convert.MM_TO_INCH)
+    return daily[step_day]
+
+
+def build_evap_array(siminfo: SimInfo) -> numpy.ndarray:
+    """
+    Hourly PET (in/hr) for the gridcell from start to stop, inclusive.
+
+    Arrays are cached per gridcell and period so every hru and model sharing
+    them reuses one copy; callers must not modify the result in place.
+    """
+    return _evap_array(
+        siminfo["gridcell"],
+        pandas.Timestamp(siminfo["start"]),
+        pandas.Timestamp(siminfo["stop"]),
     )
 
-    return evap_ts
+
+def build_evap_ts(siminfo: SimInfo) -> pandas.Series:
+    index = pandas.date_range(
+        siminfo["start"], siminfo["stop"], freq="h", name="datetime"
+    )
+    return pandas.Series(
+        build_evap_array(siminfo), index=index, name=siminfo["gridcell"]
+    )
@@ -0,0 +1,24 @@
+"""
+Types shared by the cli and the workers, kept free of heavy imports so
+modules that only pass them around don't load numba, HSP2, or pandas.
+"""
+
+from datetime import datetime
+from enum import Enum
+
+from typing_extensions import TypedDict
+
+
+class SimInfo(TypedDict):
+    start: datetime
+    stop: datetime
+    delt: int
+    steps: int
+    units: int
+    model: str
+    gridcell: str
+
+
+class Layout(str, Enum):
+    hru = "hru"
+    gridcell = "gridcell"
@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import NamedTuple
+
+import numpy
+import pandas
+
+
+class SharedTable(NamedTuple):
+    """picklable description of a 2-D float table held in shared memory."""
+
+    name: str
+    shape: tuple[int, int]
+    dtype: str
+    index: list
+    columns: list[str]
+
+
+SharedTables = dict[str, SharedTable]
+
+# tables attached in this process, by key. The SharedMemory objects are held
+# here so that the numpy views onto their buffers stay valid.
+_attached: dict[str, tuple[SharedMemory, pandas.DataFrame]] = {}
+
+
+def get_table(key: str) -> pandas.DataFrame | None:
+    """the shared table published under `key`, if this process attached one."""
+    attached = _attached.get(key)
+    return None if attached is None else attached[1]
+
+
+def _share_frame(df: pandas.DataFrame) -> tuple[SharedMemory, SharedTable]:
+    values = numpy.ascontiguousarray(df.to_numpy(dtype=numpy.float64))
+    shm = SharedMemory(create=True, size=max(values.nbytes, 1))
+    numpy.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+    table = SharedTable(
+        name=shm.name,
+        shape=values.shape,
+        dtype=values.dtype.str,
+        index=df.index.tolist(),
+        columns=[str(c) for c in df.columns],
+    )
+    return shm, table
+
+
+def _view(shm: SharedMemory, table: SharedTable) -> pandas.DataFrame:
+    values = numpy.ndarray(table.shape, dtype=table.dtype, buffer=shm.buf)
+    values.flags.writeable = False
+    # a single float block, so pandas wraps the buffer rather than copying it
+    return pandas.DataFrame(
+        values, index=table.index, columns=table.columns, copy=False
+    )
+
+
+def load_static_tables() -> dict[str, pandas.DataFrame]:
+    """
+    the static per-worker tables: PET climatology and WWHM hru parameters.
+    Empty if they come from a `bundle`, which each worker maps itself.
+    """
+    from . import pet, wwhm
+    from .config import settings
+
+    if settings.STATIC_BUNDLE is not None:
+        return {}
+    tables = {
+        "perlnd": wwhm.get_wwhm_params_per(),
+        "implnd": wwhm.get_wwhm_params_imp(),
+    }
+    if settings.PET_MM_DAILY.exists():  # pragma: no branch
+        tables["evap"] = pet.load_evap()
+    return tables
+
+
+@contextmanager
+def publish_tables(tables: dict[str, pandas.DataFrame] | None = None):
+    """
+    Copy tables into shared memory once and yield their picklable handles.
+
+    Pass the handles to `attach_tables`, e.g., as a process pool initializer,
+    so workers map the parent's copy instead of parsing their own. Blocks
+    are unlinked when the context exits.
+    """
+    if tables is None:
+        tables = load_static_tables()
+
+    blocks: list[SharedMemory] = []
+    handles: SharedTables = {}
+    try:
+        for key, df in tables.items():
+            shm, handles[key] = _share_frame(df)
+            blocks.append(shm)
+        yield handles
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def attach_tables(handles: SharedTables) -> None:
+    """map published tables into this process, read-only and without copying."""
+    for key, table in handles.items():
+        if key in _attached:
+            continue
+        shm = SharedMemory(name=table.name)
+        _attached[key] = shm, _view(shm, table)
@@ -0,0 +1,102 @@
+import numpy
+import orjson
+import pyarrow
+import pyarrow.parquet as pq
+
+from .hspf_runner import OUTPUTS
+
+# periods of the runoff totals and their numpy datetime units
+PERIODS = {"day": "D", "month": "M", "year": "Y"}
+
+# percent of the hours each flow-duration value is equaled or exceeded
+EXCEEDANCE = (0.1, 1.0, 5.0, 10.0, 25.0, 50.0, 75.0, 90.0, 95.0, 99.0)
+
+SCHEMA = pyarrow.schema(
+    [
+        ("stat", pyarrow.string()),
+        ("ix", pyarrow.uint32()),
+        ("exceedance", pyarrow.float32()),
+        *((k, pyarrow.float32()) for k in OUTPUTS),
+    ]
+)
+
+
+def _table(stat: str, ix, exceedance, values: numpy.ndarray) -> pyarrow.Table:
+    n = values.shape[1]
+    return pyarrow.table(
+        {
+            "stat": pyarrow.array([stat] * n, pyarrow.string()),
+            "ix": pyarrow.nulls(n, pyarrow.uint32()) if ix is None else ix,
+            "exceedance": pyarrow.nulls(n, pyarrow.float32())
+            if exceedance is None
+            else exceedance,
+            **{k: values[i].astype(numpy.float32) for i, k in enumerate(OUTPUTS)},
+        },
+        schema=SCHEMA,
+    )
+
+
+def _values(table: pyarrow.Table) -> numpy.ndarray:
+    return numpy.stack(
+        [table.column(k).to_numpy().astype(numpy.float64) for k in OUTPUTS]
+    )
+
+
+def period_totals(table: pyarrow.Table) -> pyarrow.Table:
+    """
+    Daily, monthly, and annual totals of the runoff (mm) of a results table,
+    one row per period with its `stat` and the `ix` of its first step.
+
+    Periods are cut where the hour index crosses a calendar boundary, so the
+    totals of consecutive chunks of a series split on those boundaries, e.g.,
+    the chunks of `hspf_runner.run_hrus_chunked`, concatenate.
+    """
+    if table.num_rows == 0:
+        return SCHEMA.empty_table()
+    ix = table.column("ix").to_numpy()
+    hours = ix.astype("datetime64[h]")
+    values = _values(table)
+
+    totals = []
+    for stat, unit in PERIODS.items():
+        period = hours.astype(f"datetime64[{unit}]")
+        starts = numpy.flatnonzero(numpy.diff(period.astype(numpy.int64), prepend=-1))
+        sums = numpy.add.reduceat(values, starts, axis=1)
+        totals.append(_table(stat, ix[starts], None, sums))
+    return pyarrow.concat_tables(totals)
+
+
+def concat_totals(tables: list[pyarrow.Table]) -> pyarrow.Table:
+    """`period_totals` of consecutive chunks of a series, ordered as for the whole."""
+    if not tables:
+        return SCHEMA.empty_table()
+    table = pyarrow.concat_tables(tables)
+    rank = {stat: i for i, stat in enumerate(PERIODS)}
+    stats = numpy.array([rank[s] for s in table.column("stat").to_pylist()])
+    return table.take(numpy.lexsort((table.column("ix").to_numpy(), stats)))
+
+
+def flow_duration(table: pyarrow.Table) -> pyarrow.Table:
+    """
+    the hourly runoff (mm) equaled or exceeded for each percent of the hours in
+    `EXCEEDANCE`, one row per percent with `stat` 'fdc'.
+    """
+    if table.num_rows == 0:
+        return SCHEMA.empty_table()
+    exceedance = numpy.asarray(EXCEEDANCE, dtype=numpy.float32)
+    quantiles = numpy.quantile(_values(table), 1 - exceedance / 100, axis=1)
+    return _table("fdc", None, exceedance, quantiles.T)
+
+
+def summarize(table: pyarrow.Table) -> pyarrow.Table:
+    """`period_totals` and `flow_duration` of a results table."""
+    return pyarrow.concat_tables([period_totals(table), flow_duration(table)])
+
+
+def to_parquet(table: pyarrow.Table, metadata: dict | None = None) -> bytes:
+    """a summary table as parquet bytes with `tnc` metadata like its results."""
+    if metadata is not None:
+        table = table.replace_schema_metadata({"tnc": orjson.dumps(metadata)})
+    b = pyarrow.BufferOutputStream()
+    pq.write_table(table, b)
+    return b.getvalue().to_pybytes()
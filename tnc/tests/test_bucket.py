@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+from google.api_core.exceptions import PreconditionFailed
+from google.auth.credentials import AnonymousCredentials
+
+from .. import metrics
+from ..bucket import ClimateTSBucket, crc32c, get_worker_client, md5, same_content
+
+
+def anonymous_client():
+    return ClimateTSBucket(project="test", credentials=AnonymousCredentials())
+
+
+def test_bucket_handle_is_reused():
+    client = anonymous_client()
+    assert client.bucket is client.bucket
+    assert client.bucket.name == "climate_ts"
+
+
+def test_set_pool_size():
+    client = anonymous_client()
+    client.set_pool_size(24)
+    assert (
+        client._http.get_adapter("https://storage.googleapis.com")._pool_maxsize == 24
+    )
+
+
+def test_get_worker_client():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return anonymous_client()
+
+    client = get_worker_client(factory, concurrency=7)
+    assert get_worker_client(factory) is client
+    assert len(calls) == 1
+    assert client._http.get_adapter("https://storage.googleapis.com")._pool_maxsize == 7
+
+    assert get_worker_client(anonymous_client) is not client
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket, self.name = bucket, name
+        self.metadata = None
+
+    def upload_from_string(self, data, content_type, if_generation_match):
+        self.bucket.write(self, data, if_generation_match)
+
+    def upload_from_filename(self, path, content_type, if_generation_match):
+        self.bucket.write(self, path.read_bytes(), if_generation_match)
+
+    def patch(self, if_generation_match):
+        self.bucket.patches += 1
+
+
+class FakeBucket:
+    """objects with the size, checksums, and generation the store reports."""
+
+    def __init__(self):
+        self.objects: dict[str, FakeBlob] = {}
+        self.writes = 0
+        self.patches = 0
+        self.race = False
+
+    def get_blob(self, name):
+        return self.objects.get(name)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def write(self, blob, data, if_generation_match):
+        current = self.objects.get(blob.name)
+        if self.race:
+            # another writer replaces the object after it was compared
+            self.race = False
+            self.write(FakeBlob(self, blob.name), b"theirs", None)
+            current = self.objects[blob.name]
+        if if_generation_match is not None and if_generation_match != (
+            current.generation if current else 0
+        ):
+            raise PreconditionFailed("generation mismatch")
+        blob.size, blob.crc32c, blob.md5_hash = len(data), crc32c(data), None
+        blob.generation = (current.generation if current else 0) + 1
+        self.objects[blob.name] = blob
+        self.writes += 1
+
+
+def test_checksums(tmp_path):
+    data = b"hsp2" * 100_000
+    path = tmp_path / "data.parquet"
+    path.write_bytes(data)
+
+    assert crc32c(path) == crc32c(data) != crc32c(data + b"!")
+    assert md5(path) == md5(data)
+
+    stored = SimpleNamespace(size=len(data), crc32c=crc32c(data), md5_hash=None)
+    assert same_content(stored, path, len(data))
+    assert not same_content(stored, data[:-1], len(data) - 1)
+    assert not same_content(None, data, len(data))
+    composite = SimpleNamespace(size=len(data), crc32c=None, md5_hash=md5(data))
+    assert same_content(composite, data, len(data))
+
+
+def test_upload_skips_unchanged_objects(tmp_path):
+    client = anonymous_client()
+    bucket = client.__dict__["bucket"] = FakeBucket()
+    events = []
+    metrics.set_sink(events.extend)
+    try:
+        assert client.upload("m/results/a.parquet", b"abc", "x")
+        assert not client.upload("m/results/a.parquet", b"abc", "x")
+        assert not client.upload("m/results/a.parquet", b"abc", "x", {"k": "v"})
+        assert bucket.patches == 1
+
+        path = tmp_path / "a.parquet"
+        path.write_bytes(b"abcd")
+        assert client.upload("m/results/a.parquet", path, "x")
+        assert bucket.objects["m/results/a.parquet"].generation == 2
+
+        # a concurrent overwrite fails the precondition and is compared again
+        bucket.race = True
+        assert client.upload("m/results/a.parquet", b"mine", "x")
+        assert bucket.objects["m/results/a.parquet"].size == 4
+        assert bucket.objects["m/results/a.parquet"].generation == 4
+        metrics.flush()
+    finally:
+        metrics.set_sink(None)
+
+    registry = metrics.Registry()
+    for event in events:
+        registry.observe(event)
+    assert registry.bytes == {"upload": 3 + 4 + 4}
+    assert registry.skipped_bytes == {"upload": 6}
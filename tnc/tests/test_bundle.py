@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import numpy
+import orjson
+import pandas
+import pytest
+from typer.testing import CliRunner
+
+from .. import bundle, pet, wwhm
+from ..cli import create_app
+from ..config import settings
+from ..hspf_runner import get_TNC_siminfo
+from .test_pet import evap_csv  # noqa: F401
+
+
+def _clear_caches():
+    bundle.load.cache_clear()
+    pet.load_evap.cache_clear()
+    pet._evap_array.cache_clear()
+    wwhm.get_wwhm_params_per.cache_clear()
+    wwhm.get_wwhm_params_imp.cache_clear()
+    wwhm.wwhm_hru_params.cache_clear()
+
+
+def _is_mapped(values) -> bool:
+    while values is not None:
+        if isinstance(values, numpy.memmap):
+            return True
+        values = getattr(values, "base", None)
+    return False
+
+
+@pytest.fixture
+def built(tmp_path, evap_csv, monkeypatch):  # noqa: F811
+    path = tmp_path / "bundle"
+    result = CliRunner().invoke(
+        create_app(lambda: None), ["bundle", "build", str(path), "--pet-csv", evap_csv]
+    )
+    assert result.exit_code == 0, result.stdout
+
+    expected = bundle.read_sources(evap=evap_csv)
+    params = wwhm.wwhm_hru_params()
+    siminfo = get_TNC_siminfo(
+        datetime(1980, 1, 1), datetime(1981, 3, 2), model="m", gridcell="R18C42"
+    )
+    evap = pet.build_evap_array(siminfo).copy()
+
+    monkeypatch.setattr(settings, "STATIC_BUNDLE", path)
+    _clear_caches()
+    yield path, expected, params, (siminfo, evap)
+    _clear_caches()
+
+
+def test_bundle_matches_sources(built):
+    path, expected, params, evap = built
+    tables = bundle.load(path)
+
+    assert set(tables) == {"perlnd", "implnd", "evap"}
+    for key in ("perlnd", "implnd"):
+        pandas.testing.assert_frame_equal(
+            tables[key], expected[key].astype(numpy.float64)
+        )
+    pandas.testing.assert_frame_equal(
+        tables["evap"], expected["evap"].astype(numpy.float32)
+    )
+    assert _is_mapped(tables["evap"].to_numpy())
+    assert not tables["evap"].to_numpy().flags.writeable
+
+    # the loaders read the bundle once STATIC_BUNDLE is set
+    assert wwhm.get_wwhm_params_per() is tables["perlnd"]
+    assert wwhm.wwhm_hru_params() == params
+    siminfo, evap = evap
+    numpy.testing.assert_allclose(pet.build_evap_array(siminfo), evap, rtol=1e-6)
+
+
+def test_bundle_version_is_checked(built):
+    path, *_ = built
+    manifest = orjson.loads((path / bundle.MANIFEST).read_bytes())
+    manifest["version"] = bundle.VERSION + 1
+    (path / bundle.MANIFEST).write_bytes(orjson.dumps(manifest))
+
+    with pytest.raises(ValueError, match="rebuild"):
+        bundle.load(path)
+
+
+def test_validate():
+    tables = bundle.read_sources()
+    bundle.validate(tables)
+
+    perlnd = tables["perlnd"].astype(numpy.float64)
+    perlnd.iloc[0, 0] = numpy.nan
+    with pytest.raises(ValueError, match="finite"):
+        bundle.validate({**tables, "perlnd": perlnd})
+
+    implnd = tables["implnd"].rename(index={"hru250": "hru200"})
+    with pytest.raises(ValueError, match="pervious"):
+        bundle.validate({**tables, "implnd": implnd})
+
+    evap = pandas.DataFrame({"R1C1": numpy.ones(300)})
+    with pytest.raises(ValueError, match="R1C1"):
+        bundle.validate({**tables, "evap": evap})
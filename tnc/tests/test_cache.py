@@ -0,0 +1,73 @@
+import os
+
+import numpy
+import pytest
+
+from ..cache import DiskCache, join_arrays, split_arrays
+
+
+@pytest.fixture
+def doc():
+    return {
+        "start_time": "1980-01-01",
+        "end_time": "1980-12-31",
+        "prec": {"units": "mm", "data": [0.0, 1.5, 2, 0.25]},
+    }
+
+
+def test_split_join_arrays(doc):
+    skeleton, arrays = split_arrays(doc)
+    assert list(arrays) == ["prec/data"]
+    assert "data" not in skeleton["prec"]
+
+    joined = join_arrays(skeleton, arrays)
+    numpy.testing.assert_array_equal(joined["prec"]["data"], doc["prec"]["data"])
+    assert joined["prec"]["units"] == "mm"
+
+
+def test_split_join_arrays_escapes_keys(tmp_path, doc):
+    doc["bands"] = {"a/b": [1.0, 2.0], "~1": {"c/~d": [3.0]}}
+    skeleton, arrays = split_arrays(doc)
+    assert sorted(arrays) == ["bands/a~1b", "bands/~01/c~1~0d", "prec/data"]
+
+    cache = DiskCache(tmp_path, max_bytes=1024**2)
+    cache.put("f.json", 1, doc)
+    hit = cache.get("f.json", 1)
+    assert list(hit["bands"]["a/b"]) == [1.0, 2.0]
+    assert list(hit["bands"]["~1"]["c/~d"]) == [3.0]
+
+
+def test_disk_cache_roundtrip(tmp_path, doc):
+    cache = DiskCache(tmp_path, max_bytes=1024**2)
+
+    assert cache.get("m/inputs/R1C1-input.json", 1) is None
+    stored = cache.put("m/inputs/R1C1-input.json", 1, doc)
+    hit = cache.get("m/inputs/R1C1-input.json", 1)
+
+    assert hit is not None
+    assert hit["start_time"] == doc["start_time"]
+    assert isinstance(hit["prec"]["data"], numpy.ndarray)
+    numpy.testing.assert_array_equal(hit["prec"]["data"], stored["prec"]["data"])
+
+    # a new generation of the same blob is a miss
+    assert cache.get("m/inputs/R1C1-input.json", 2) is None
+
+
+def test_disk_cache_lru_eviction(tmp_path, doc):
+    cache = DiskCache(tmp_path, max_bytes=1024**2)
+    for i in range(3):
+        cache.put(f"f{i}.json", 1, doc)
+        # force distinct, increasing mtimes
+        os.utime(cache.path(f"f{i}.json", 1), (i, i))
+
+    # touch the oldest so that f1 becomes least recently used
+    assert cache.get("f0.json", 1) is not None
+
+    entry_size = cache.path("f0.json", 1).stat().st_size
+    cache.max_bytes = entry_size * 2
+    removed = cache.evict()
+
+    assert removed == [cache.path("f1.json", 1)]
+    assert cache.get("f0.json", 1) is not None
+    assert cache.get("f2.json", 1) is not None
+    assert cache.size() <= cache.max_bytes
@@ -1,3 +1,6 @@
+import numpy
+import orjson
+import pandas
 import pytest
 from typer.testing import CliRunner
 
@@ -41,3 +44,46 @@ def test_app_run_failed(app):
     result = runner.invoke(app, ["run", "-m", "HIS", "-g", "R18C41", "-h", "200"])
     assert result.exit_code == 1, result.stdout
     print(result.stdout)
+
+
+def test_app_warmup(app):
+    result = runner.invoke(app, ["warmup"])
+    assert result.exit_code == 0, result.stdout
+    assert "pwater ready in" in result.stdout
+    assert "iwater ready in" in result.stdout
+
+
+def test_app_ensemble(app, tmp_path):
+    ndays = 20
+    rng = numpy.random.default_rng(3)
+    doc = {
+        "start_time": "1980-01-01",
+        "end_time": f"1980-01-{ndays:02d}",
+        "prec": {"data": rng.gamma(0.3, 2.0, ndays * 24).round(2).tolist()},
+        "petinp": {"data": [2.5] * ndays},
+    }
+    input_file = tmp_path / "R1C1-input.json"
+    input_file.write_bytes(orjson.dumps(doc))
+    pandas.DataFrame({"LZSN": [4.0, 5.0]}).to_csv(tmp_path / "samples.csv", index=False)
+
+    result = runner.invoke(
+        app,
+        [
+            "ensemble",
+            str(tmp_path / "samples.csv"),
+            "-i",
+            str(input_file),
+            "-h",
+            "hru010",
+            "-n",
+            "1",
+            "-o",
+            str(tmp_path / "metrics.csv"),
+            "--daily",
+            str(tmp_path / "daily.parquet"),
+        ],
+    )
+    assert result.exit_code == 0, result.stdout
+    assert len(pandas.read_csv(tmp_path / "metrics.csv")) == 2
+    # siminfo steps cover whole days from start_time up to end_time
+    assert pandas.read_parquet(tmp_path / "daily.parquet").shape == (2, ndays - 1)
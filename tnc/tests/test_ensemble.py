@@ -0,0 +1,104 @@
+import numpy
+import pandas
+import pytest
+
+from .. import convert, ensemble, wwhm
+from ..hspf_runner import run_hrus
+
+
+@pytest.fixture(scope="module")
+def samples():
+    base = wwhm.wwhm_hru_params()["hru010"]
+    return pandas.DataFrame(
+        {"LZSN": [base["LZSN"], 4.0, 6.0], "INFILT": [base["INFILT"], 0.05, 0.3]},
+        index=pandas.Index(["base", "a", "b"], name="sample"),
+    )
+
+
+def test_sample_matrix(samples):
+    columns, params = ensemble.sample_matrix(samples, "hru010")
+    assert params.shape == (3, len(columns))
+    numpy.testing.assert_array_equal(
+        params[:, columns.index("INFILT")], samples["INFILT"]
+    )
+
+    with pytest.raises(ValueError, match="not PERLND parameters"):
+        ensemble.sample_matrix(samples.assign(RETSC=1.0), "hru010")
+
+
+def test_run_ensemble(regression_input_ts, regression_siminfo, samples):
+    metrics, daily = ensemble.run_ensemble(
+        regression_input_ts, regression_siminfo, samples, "hru010", chunk_size=2
+    )
+    assert list(metrics.index) == list(samples.index)
+    assert metrics["exception"].isna().all()
+    assert daily.shape == (3, 366)
+
+    # the first sample repeats hru010's own parameters
+    base = run_hrus(regression_input_ts, regression_siminfo, ["hru010"])["hru010"]
+    expected = sum(
+        base["results"][k].sum(dtype=numpy.float64) for k in ["SURO", "AGWO", "IFWO"]
+    )
+    assert metrics.loc["base", "runoff_mm"] == pytest.approx(
+        expected * convert.INCH_TO_MM
+    )
+    assert daily.loc["base"].sum() == pytest.approx(expected * convert.INCH_TO_MM)
+    assert metrics["runoff_mm"].nunique() == 3
+
+
+def test_failed_samples_are_nan(regression_input_ts, regression_siminfo, samples):
+    # a zero lower zone nominal storage fails in the kernel
+    failing = pandas.concat(
+        [samples, pandas.DataFrame({"LZSN": [0.0], "INFILT": [0.1]}, index=["bad"])]
+    )
+    metrics, daily = ensemble.run_ensemble(
+        regression_input_ts, regression_siminfo, failing, "hru010", chunk_size=2
+    )
+
+    assert metrics["exception"].notna().tolist() == [False, False, False, True]
+    numeric = metrics.drop(columns="exception")
+    assert numeric.loc["bad"].isna().all()
+    assert daily.loc["bad"].isna().all()
+    assert numeric.drop(index="bad").notna().all().all()
+    assert metrics["runoff_mm"].mean() == pytest.approx(
+        metrics.loc[["base", "a", "b"], "runoff_mm"].mean()
+    )
+
+
+def test_run_ensemble_parallel_and_observed(
+    regression_input_ts, regression_siminfo, samples
+):
+    serial, daily = ensemble.run_ensemble(
+        regression_input_ts, regression_siminfo, samples, "hru010"
+    )
+    observed = pandas.Series(
+        daily.loc["base"].to_numpy(dtype=numpy.float64),
+        index=pandas.to_datetime(daily.columns),
+    )
+
+    parallel, _ = ensemble.run_ensemble(
+        regression_input_ts,
+        regression_siminfo,
+        samples,
+        "hru010",
+        observed=observed,
+        ncores=2,
+        chunk_size=2,
+    )
+    pandas.testing.assert_frame_equal(parallel[serial.columns], serial)
+    assert parallel.loc["base", "nse"] == pytest.approx(1)
+    assert parallel.loc["base", "kge"] == pytest.approx(1)
+    assert parallel.loc["a", "nse"] < 1
+
+
+def test_shared_inputs_copied_once(monkeypatch):
+    table = pandas.DataFrame({"PREC": [0.1, 0.0], "PETINP": [0.0, 0.2]})
+    monkeypatch.setattr(ensemble.shared, "get_table", lambda key: table)
+    monkeypatch.setattr(ensemble, "_writable", {})
+
+    input_ts = ensemble._writable_inputs("inputs")
+    assert input_ts["PREC"].flags.writeable
+    assert ensemble._writable_inputs("inputs") is input_ts
+
+    table = table * 2
+    assert ensemble._writable_inputs("inputs")["PREC"][0] == pytest.approx(0.2)
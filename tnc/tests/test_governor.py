@@ -0,0 +1,129 @@
+import multiprocessing
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from .. import governor, main, metrics
+from ..listing import ListingIndex
+from ..main import input_sizes, longest_first
+
+
+@pytest.fixture
+def slots():
+    slots = governor.create_slots(compute=1, io=1)
+    governor.install(slots)
+    yield slots
+    governor.install(None)
+
+
+def test_no_slots_is_unlimited():
+    with governor.io_slot(), governor.io_slot(), governor.compute_slot():
+        pass
+
+
+def test_slots_are_held_for_the_block(slots):
+    events: list[metrics.Event] = []
+    metrics.set_sink(events.extend)
+    try:
+        with governor.io_slot():
+            assert not slots.io.acquire(block=False)
+            with governor.compute_slot():
+                assert not slots.compute.acquire(block=False)
+        metrics.flush()
+    finally:
+        metrics.set_sink(None)
+
+    assert slots.io.acquire(block=False)
+    assert {e["stage"] for e in events} == {"io_wait", "compute_wait"}
+
+
+def _hold_io(slots, intervals):
+    governor.install(slots)
+    with governor.io_slot():
+        start = time.monotonic()
+        time.sleep(0.2)
+        intervals.append((start, time.monotonic()))
+
+
+def test_io_slots_are_shared_across_processes():
+    slots = governor.create_slots(compute=1, io=1)
+    with multiprocessing.Manager() as manager:
+        intervals = manager.list()
+        procs = [
+            multiprocessing.Process(target=_hold_io, args=(slots, intervals))
+            for _ in range(3)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        held = sorted(intervals)
+
+    assert len(held) == 3
+    assert all(
+        end <= start for (_, end), (start, _) in zip(held, held[1:], strict=False)
+    )
+
+
+def test_threads_per_worker():
+    assert governor.default_io_slots(4) == 16
+    assert governor.default_io_slots(32) == 64
+    assert governor.threads_per_worker(16, 4) == 8
+    assert governor.threads_per_worker(4, 8) == 2
+
+
+def test_input_sizes_and_longest_first(tmp_path):
+    listed = [
+        SimpleNamespace(name="m/inputs/R1C1-input.json", size=100),
+        SimpleNamespace(name="m/inputs/R1C2-input.json", size=300),
+        SimpleNamespace(name="m/inputs/R1C3-input.json", size=100),
+        SimpleNamespace(name="m/inputs/a-shard.parquet", size=1000),
+    ]
+    client = SimpleNamespace(
+        bucket=SimpleNamespace(list_blobs=lambda prefix: iter(listed))
+    )
+    input_files = [
+        "m/inputs/R1C1-input.json",
+        "m/inputs/R1C2-input.json",
+        "m/inputs/R1C3-input.json",
+        "m/inputs/a-shard.parquet#R2C1",
+        "m/inputs/a-shard.parquet#R2C2",
+    ]
+
+    sizes = input_sizes(input_files, client)
+    assert sizes["m/inputs/R1C2-input.json"] == 300
+    assert sizes["m/inputs/a-shard.parquet#R2C1"] == 500
+
+    index = ListingIndex(tmp_path / "index.sqlite")
+    index.update_model("m", [(b.name, 1, b.size) for b in listed])
+    assert input_sizes(input_files, None, index=index) == sizes
+
+    hrus = ["hru010", "hru250"]
+    assert longest_first(input_files, sizes, hrus) == [
+        "m/inputs/a-shard.parquet#R2C1",
+        "m/inputs/a-shard.parquet#R2C2",
+        "m/inputs/R1C2-input.json",
+        "m/inputs/R1C1-input.json",
+        "m/inputs/R1C3-input.json",
+    ]
+    # fewer hrus left to run make a file cheaper
+    ordered = longest_first(
+        input_files, sizes, hrus, {"m/inputs/R1C1-input.json": ["hru010"]}
+    )
+    assert ordered[-1] == "m/inputs/R1C1-input.json"
+
+
+def test_longest_first_rotates_within_sizes(monkeypatch):
+    input_files = [f"m/inputs/R{i}C1-input.json" for i in range(6)]
+    sizes = dict(zip(input_files, [100, 300, 110, 120, 290, 50], strict=True))
+
+    monkeypatch.setattr(main.random, "randrange", lambda n: n - 1)
+    assert longest_first(input_files, sizes, ["hru010"], rotate=True) == [
+        "m/inputs/R4C1-input.json",
+        "m/inputs/R1C1-input.json",
+        "m/inputs/R0C1-input.json",
+        "m/inputs/R3C1-input.json",
+        "m/inputs/R2C1-input.json",
+        "m/inputs/R5C1-input.json",
+    ]
@@ -1,4 +1,20 @@
-from ..hspf_runner import build_numba_ts, run_hrus
+from datetime import datetime
+
+import numpy
+import pytest
+
+from ..hspf_runner import (
+    OUTPUTS,
+    build_numba_ts,
+    chunk_bounds,
+    chunk_siminfo,
+    get_TNC_siminfo,
+    round_into,
+    run_hrus,
+    run_hrus_batched,
+    run_hrus_chunked,
+    run_hrus_extension,
+)
 
 
 def test_run_hrus(regression_input_ts, regression_siminfo):
@@ -10,3 +26,122 @@ def test_run_hrus(regression_input_ts, regression_siminfo):
         assert data["exception"] is None, data["exception"]
         suro_result = data["results"]["SURO"]
         assert suro_result.sum() > 0.0, hru
+
+
+def test_run_hrus_batched(regression_input_ts, regression_siminfo):
+    hrus = ["hru010", "hru250", "hru222"]
+    ts = build_numba_ts(regression_input_ts)
+    expected = run_hrus(ts, regression_siminfo, hrus)
+    res = run_hrus_batched(regression_input_ts, regression_siminfo, hrus)
+
+    assert len(res) == 1
+    assert list(res[0]) == hrus
+
+    for hru, data in res[0].items():
+        assert data["exception"] is None, data["exception"]
+        numpy.testing.assert_array_equal(data["errors"], expected[hru]["errors"])
+        assert data["messages"] == expected[hru]["messages"]
+        for k, v in expected[hru]["results"].items():
+            numpy.testing.assert_array_equal(data["results"][k], v, err_msg=hru)
+
+
+def test_run_hrus_batched_stacked_gridcells(regression_input_ts, regression_siminfo):
+    stacked = {
+        "PREC": numpy.stack([regression_input_ts["PREC"]] * 2),
+        "PETINP": numpy.stack(
+            [regression_input_ts["PETINP"], regression_input_ts["PETINP"] * 0.5]
+        ),
+    }
+    hrus = ["hru010", "hru251"]
+    res = run_hrus_batched(stacked, regression_siminfo, hrus)
+
+    assert len(res) == 2
+    for g, r in enumerate(res):
+        ts = build_numba_ts({k: v[g] for k, v in stacked.items()})
+        expected = run_hrus(ts, regression_siminfo, hrus)
+        for hru in hrus:
+            for k, v in expected[hru]["results"].items():
+                numpy.testing.assert_array_equal(r[hru]["results"][k], v)
+
+
+def test_round_into():
+    src = numpy.random.default_rng(1).gamma(0.3, 0.01, 10_000)
+    out = numpy.empty(len(src) - 1, dtype=numpy.float32)
+    round_into(src, 4, out)
+    numpy.testing.assert_array_equal(out, src[:-1].round(4).astype(numpy.float32))
+
+
+def test_chunk_bounds():
+    siminfo = get_TNC_siminfo(datetime(1980, 6, 1), datetime(1983, 3, 1), "m", "g")
+    # 1981-01-01 is 214 days in, then the full 1981 and 1982 calendar years
+    assert chunk_bounds(siminfo) == [
+        (0, 214 * 24),
+        (214 * 24, 579 * 24),
+        (579 * 24, 944 * 24),
+        (944 * 24, siminfo["steps"]),
+    ]
+    assert chunk_bounds(siminfo, years=2) == [
+        (0, 579 * 24),
+        (579 * 24, siminfo["steps"]),
+    ]
+    assert chunk_bounds(siminfo, years=10) == [(0, siminfo["steps"])]
+    with pytest.raises(ValueError):
+        chunk_bounds(siminfo, years=0)
+
+
+def test_run_hrus_chunked(regression_input_ts):
+    siminfo = get_TNC_siminfo(datetime(1980, 6, 1), datetime(1983, 3, 1), "m", "g")
+    input_ts = {
+        k: numpy.resize(v, siminfo["steps"]) for k, v in regression_input_ts.items()
+    }
+    hrus = ["hru010", "hru250"]
+    full = run_hrus_batched(input_ts, siminfo, hrus)[0]
+
+    chunks = list(run_hrus_chunked(input_ts, siminfo, hrus))
+    assert [c["steps"] for c, _ in chunks] == [
+        stop - start for start, stop in chunk_bounds(siminfo)
+    ]
+
+    for hru in hrus:
+        expected = full[hru]["results"]
+        parts = [res[0][hru]["results"] for _, res in chunks]
+        numpy.testing.assert_array_equal(
+            numpy.concatenate([p["ix"] for p in parts]), expected["ix"]
+        )
+        for k in OUTPUTS:
+            chunked = numpy.concatenate([p[k] for p in parts])
+            # storages carry over exactly; the kernels' internal rate factors
+            # restart at each boundary, which shifts baseflow by a rounding step
+            numpy.testing.assert_allclose(chunked, expected[k], atol=1e-3)
+            numpy.testing.assert_allclose(chunked.sum(), expected[k].sum(), rtol=5e-3)
+
+
+def test_run_hrus_extension(regression_input_ts, regression_siminfo):
+    hrus = ["hru010", "hru250"]
+    full = run_hrus_batched(regression_input_ts, regression_siminfo, hrus)[0]
+
+    first = 182 * 24  # 1980-07-01 00:00
+    earlier = chunk_siminfo(regression_siminfo, 0, first)
+    inputs = {k: v[:first] for k, v in regression_input_ts.items()}
+    saved = {
+        h: r["state"] for h, r in run_hrus_batched(inputs, earlier, hrus)[0].items()
+    }
+    # pwater resumes at midnight, iwater at 1 am of the last day
+    assert saved["hru010"]["time"] == "1980-07-01T00:00:00"
+    assert saved["hru250"]["time"] == "1980-06-30T01:00:00"
+    assert saved["hru250"]["end_time"] == "1980-06-30T23:00:00"
+
+    extension, results = run_hrus_extension(
+        regression_input_ts, regression_siminfo, hrus, saved, first
+    )
+    assert extension["steps"] == regression_siminfo["steps"] - first
+
+    for hru in hrus:
+        expected = full[hru]["results"]
+        res = results[hru]["results"]
+        numpy.testing.assert_array_equal(res["ix"], expected["ix"][first:])
+        for k in OUTPUTS:
+            numpy.testing.assert_allclose(res[k], expected[k][first:], atol=1e-3)
+            numpy.testing.assert_allclose(
+                res[k].sum(), expected[k][first:].sum(), rtol=5e-3
+            )
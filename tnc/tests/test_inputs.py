@@ -0,0 +1,151 @@
+import io
+from types import SimpleNamespace
+
+import numpy
+import orjson
+import pytest
+
+from .. import inputs
+from ..listing import ListingIndex
+from ..main import build_ts, expand_shards, get_data_and_siminfo, parse_input_file
+from .test_bucket import anonymous_client
+
+
+@pytest.fixture
+def doc():
+    rng = numpy.random.default_rng(0)
+    return {
+        "start_time": "1980-01-01",
+        "end_time": "1980-01-03",
+        "units": {"prec": "mm"},
+        "version": 3,
+        "prec": {"data": rng.gamma(0.3, 2.0, 72).round(3).tolist() + [1e-05, 2]},
+        "petinp": {"data": [2.5, 2.25, 3]},
+    }
+
+
+def test_loads_json(doc):
+    decoded = inputs.loads_json(orjson.dumps(doc, option=orjson.OPT_INDENT_2))
+
+    assert decoded["units"] == doc["units"]
+    assert decoded["version"] == 3
+    for k in ["prec", "petinp"]:
+        assert isinstance(decoded[k]["data"], numpy.ndarray)
+        numpy.testing.assert_array_equal(decoded[k]["data"], doc[k]["data"])
+
+
+def test_loads_json_leaves_strings_alone(doc):
+    doc["note"] = 'bounds [1, 2], "data": [3]'
+    doc["units"] = {"prec": ["mm", "hr"], "shape": [1, 2]}
+    decoded = inputs.loads_json(orjson.dumps(doc))
+
+    assert decoded["note"] == doc["note"]
+    assert decoded["units"] == doc["units"]
+    numpy.testing.assert_array_equal(decoded["prec"]["data"], doc["prec"]["data"])
+
+
+def test_npz_roundtrip(doc):
+    decoded = inputs.loads("m/inputs/R1C1-input.npz", inputs.dumps_npz(doc))
+    assert list(decoded) == ["R1C1"]
+    assert decoded["R1C1"]["start_time"] == doc["start_time"]
+    assert decoded["R1C1"]["prec"]["data"].dtype == numpy.float32
+    numpy.testing.assert_allclose(
+        decoded["R1C1"]["prec"]["data"], doc["prec"]["data"], rtol=1e-6
+    )
+
+
+def test_parquet_shard_roundtrip(doc):
+    without_pet = {k: v for k, v in doc.items() if k != "petinp"}
+    raw = inputs.dumps_parquet({"R1C1": doc, "R1C2": without_pet})
+
+    assert inputs.shard_gridcells(raw) == ["R1C1", "R1C2"]
+
+    decoded = inputs.loads("m/inputs/a-shard.parquet", raw)
+    numpy.testing.assert_allclose(
+        decoded["R1C1"]["petinp"]["data"], doc["petinp"]["data"]
+    )
+    assert "petinp" not in decoded["R1C2"]
+    assert inputs.select(decoded, "R1C2")["end_time"] == doc["end_time"]
+
+    with pytest.raises(ValueError, match="address one"):
+        inputs.select(decoded, None)
+    with pytest.raises(ValueError, match="no input"):
+        inputs.select(decoded, "R9C9")
+
+
+def test_loads_unsupported():
+    with pytest.raises(ValueError, match="unsupported"):
+        inputs.loads("m/inputs/R1C1-input.csv", b"")
+
+
+def test_parse_input_file():
+    assert parse_input_file("m/inputs/R1C1-input.npz") == ("m", "R1C1")
+    assert parse_input_file("m/inputs/a-shard.parquet#R2C3") == ("m", "R2C3")
+
+
+def test_build_ts_from_each_format(doc):
+    shard = inputs.loads_parquet(inputs.dumps_parquet({"R1C1": doc}))["R1C1"]
+    client = SimpleNamespace(get_input=lambda _: shard)
+    data, siminfo = get_data_and_siminfo("m/inputs/a-shard.parquet#R1C1", client)
+    assert siminfo["gridcell"] == "R1C1"
+
+    from_json = build_ts(inputs.loads_json(orjson.dumps(doc)), siminfo)
+    from_shard = build_ts(data, siminfo)
+    assert from_shard["PREC"].dtype == numpy.float64
+    numpy.testing.assert_allclose(from_shard["PREC"], from_json["PREC"], rtol=1e-6)
+
+
+class FakeBucket:
+    def __init__(self, blobs):
+        self.blobs = blobs
+        self.downloads = 0
+
+    def get_blob(self, path):
+        def download_as_bytes():
+            self.downloads += 1
+            return self.blobs[path]
+
+        return SimpleNamespace(generation=1, download_as_bytes=download_as_bytes)
+
+
+def test_get_input_decodes_shards_once(doc):
+    bucket = FakeBucket(
+        {
+            "m/inputs/a-shard.parquet": inputs.dumps_parquet(
+                {"R1C1": doc, "R1C2": doc}
+            ),
+            "m/inputs/b-shard.parquet": inputs.dumps_parquet({"R1C1": doc}),
+            "m/inputs/R1C3-input.json": orjson.dumps(doc),
+        }
+    )
+    client = anonymous_client()
+    client.__dict__["bucket"] = bucket
+    client.__dict__["cache"] = None
+
+    for g in ["R1C1", "R1C2"]:
+        assert client.get_input(f"m/inputs/a-shard.parquet#{g}")["prec"]["data"].size
+    assert bucket.downloads == 1
+
+    # interleaving another shard keeps both in memory
+    for name in ["b", "a", "b", "a"]:
+        assert client.get_input(f"m/inputs/{name}-shard.parquet#R1C1")
+    assert bucket.downloads == 2
+
+    assert client.get_json("m/inputs/R1C3-input.json")["version"] == 3
+
+
+def test_expand_shards(doc, tmp_path):
+    raw = inputs.dumps_parquet({"R1C1": doc, "R2C1": doc})
+    client = SimpleNamespace(open_blob=lambda _: io.BytesIO(raw))
+    input_files = ["m/inputs/R1C5-input.json", "m/inputs/a-shard.parquet"]
+
+    assert expand_shards(input_files, "R1", client) == [
+        "m/inputs/R1C5-input.json",
+        "m/inputs/a-shard.parquet#R1C1",
+    ]
+
+    index = ListingIndex(tmp_path / "index.sqlite")
+    index.update_model("m", [(f, 1, 1) for f in input_files])
+    assert [name for name, *_ in index.query(["m"], gridcell="R2")] == [
+        "m/inputs/a-shard.parquet"
+    ]
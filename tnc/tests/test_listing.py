@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+from ..listing import ListingIndex
+from ..main import gather_args
+
+
+def blobs(*names, generation=1):
+    return [(name, generation, 100) for name in names]
+
+
+def test_update_model_writes_only_changes(tmp_path):
+    index = ListingIndex(tmp_path / "index.sqlite")
+    stats = index.update_model(
+        "m",
+        blobs("m/inputs/R1C1-input.json", "m/inputs/R1C2-input.json", "m/meta/x.meta"),
+    )
+    assert stats == {"changed": 2, "removed": 0, "total": 2}
+
+    stats = index.update_model(
+        "m",
+        blobs("m/inputs/R1C1-input.json")
+        + blobs("m/inputs/R1C3-input.json", generation=2),
+    )
+    assert stats == {"changed": 1, "removed": 1, "total": 2}
+    assert [name for name, *_ in index.query(["m"])] == [
+        "m/inputs/R1C1-input.json",
+        "m/inputs/R1C3-input.json",
+    ]
+
+
+def test_is_stale(tmp_path):
+    index = ListingIndex(tmp_path / "index.sqlite", ttl=60)
+    assert index.is_stale("m")
+    index.update_model("m", [])
+    refreshed_at = index.refreshed_at("m")
+    assert not index.is_stale("m", now=refreshed_at + 30)
+    assert index.is_stale("m", now=refreshed_at + 61)
+
+
+def test_query(tmp_path):
+    index = ListingIndex(tmp_path / "index.sqlite")
+    index.update_model("m1", blobs("m1/inputs/R1C1-input.json"))
+    index.update_model(
+        "m2", blobs("m2/inputs/R1C1-input.json", "m2/inputs/R2C10-input.json")
+    )
+
+    assert len(index.query()) == 3
+    assert len(index.query(["m2"])) == 2
+    assert [n for n, *_ in index.query(gridcell=["R2C", "R3"])] == [
+        "m2/inputs/R2C10-input.json"
+    ]
+    assert len(index.query(["m1", "m2"], gridcell="R1C1")) == 2
+
+
+def test_gather_args_from_index(tmp_path):
+    listed = [
+        SimpleNamespace(name=n, generation=1, size=100)
+        for n in ["m/inputs/R1C1-input.json", "m/inputs/R1C2-input.json"]
+    ]
+    calls = []
+
+    def list_blobs(prefix):
+        calls.append(prefix)
+        return listed
+
+    client = SimpleNamespace(
+        models=["m"], bucket=SimpleNamespace(list_blobs=list_blobs)
+    )
+    index = ListingIndex(tmp_path / "index.sqlite")
+
+    args = gather_args(gridcell="R1C2", client=client, index=index)
+    assert args == [{"input_file": "m/inputs/R1C2-input.json"}]
+
+    # answered locally until the ttl expires
+    assert len(gather_args(client=client, index=index)) == 2
+    assert calls == ["m/inputs/"]
@@ -0,0 +1,46 @@
+from ..main import Layout, parse_error_file, plan_run
+from ..manifest import RunManifest
+
+input_files = ["m/inputs/R1C1-input.json", "m/inputs/R1C2-input.json"]
+hrus = ["hru000", "hru010", "hru250"]
+
+
+def test_run_manifest(tmp_path):
+    manifest = RunManifest(tmp_path / "run.sqlite")
+    manifest.record([("m", "R1C1", "hru000", True), ("m", "R1C1", "hru010", False)])
+    assert manifest.completed() == {("m", "R1C1", "hru000")}
+    assert manifest.failed() == {("m", "R1C1", "hru010")}
+
+    # a later success replaces the failure
+    RunManifest(tmp_path / "run.sqlite").record([("m", "R1C1", "hru010", True)])
+    assert manifest.failed() == set()
+    assert len(manifest.completed()) == 2
+
+
+def test_parse_error_file():
+    assert parse_error_file("m/meta/R1C1-hru010.error") == ("m", "R1C1", "hru010")
+    assert parse_error_file("m/meta/R1C1.error") == ("m", "R1C1", None)
+
+
+def test_plan_run_resume():
+    completed = {("m", "R1C1", h) for h in hrus} | {("m", "R1C2", "hru000")}
+    assert plan_run(input_files, hrus, completed=completed) == {
+        "m/inputs/R1C2-input.json": ["hru010", "hru250"]
+    }
+    # one object per gridcell: rerun every hru of an incomplete gridcell
+    assert plan_run(input_files, hrus, completed=completed, layout=Layout.gridcell) == {
+        "m/inputs/R1C2-input.json": hrus
+    }
+
+
+def test_plan_run_retry_failed():
+    error_files = ["m/meta/R1C1-hru250.error", "m/meta/R1C2.error"]
+    assert plan_run(input_files, hrus, error_files=error_files) == {
+        "m/inputs/R1C1-input.json": ["hru250"],
+        "m/inputs/R1C2-input.json": hrus,
+    }
+
+    # retry only what has not since been completed
+    completed = {("m", "R1C2", "hru000")}
+    plan = plan_run(input_files, hrus, error_files=error_files, completed=completed)
+    assert plan["m/inputs/R1C2-input.json"] == ["hru010", "hru250"]
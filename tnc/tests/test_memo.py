@@ -0,0 +1,48 @@
+from .. import memo
+from ..config import settings
+
+
+def test_result_key():
+    key = memo.result_key("m/inputs/R1C0-input.json@abc", "hru010")
+    assert key == memo.result_key("m/inputs/R1C0-input.json@abc", "hru010")
+    assert key != memo.result_key("m/inputs/R1C0-input.json@abd", "hru010")
+    assert key != memo.result_key("m/inputs/R1C0-input.json@abc", "hru250")
+    assert key != memo.result_key("m/inputs/R1C0-input.json@abc", "hru010", "x")
+    assert memo.engine_version().startswith("tnc-")
+
+
+def test_result_key_follows_pet_source(tmp_path, monkeypatch):
+    csv = tmp_path / "pet.csv"
+    csv.write_text("date_arb_year,R1C0\n2001-01-01,1.5\n")
+    monkeypatch.setattr(settings, "PET_MM_DAILY", csv)
+    key = memo.result_key("m/inputs/R1C0-input.json@abc", "hru010")
+    assert memo.result_key("m/inputs/R1C0-input.json@abc", "hru010") == key
+
+    csv.write_text("date_arb_year,R1C0\n2001-01-01,12.5\n")
+    changed = memo.result_key("m/inputs/R1C0-input.json@abc", "hru010")
+    assert changed != key
+
+    bundle = tmp_path / "bundle"
+    bundle.mkdir()
+    manifest = '{"version": %d, "arrays": {"evap": {"sha256": "%s"}}}'
+    (bundle / memo.bundle.MANIFEST).write_text(manifest % (memo.bundle.VERSION, "a"))
+    monkeypatch.setattr(settings, "STATIC_BUNDLE", bundle)
+    from_bundle = memo.result_key("m/inputs/R1C0-input.json@abc", "hru010")
+    assert from_bundle not in (key, changed)
+
+
+def test_object_metadata_round_trip():
+    keys = {"hru010": "a", "hru250": "b"}
+    metadata = memo.object_metadata(keys)
+    assert memo.keys_from_metadata({**metadata, "other": "c"}) == keys
+    assert memo.keys_from_metadata(None) == {}
+
+
+def test_memo_index(tmp_path):
+    index = memo.MemoIndex(tmp_path / "memo.sqlite")
+    index.record([("m", "R1C0", "hru010", "a"), ("m", "R1C1", "hru010", "b")])
+    index.record([("m", "R1C0", "hru010", "c")])
+
+    assert index.keys("m", "R1C0") == {"hru010": "c"}
+    assert index.keys("m", "R1C1") == {"hru010": "b"}
+    assert index.keys("n", "R1C0") == {}
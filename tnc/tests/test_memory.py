@@ -0,0 +1,73 @@
+import pytest
+
+from .. import memory
+from ..cli import admit, run_jobs, size_pool
+from .test_pipeline import InMemoryClient
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [("512", 512), ("512M", 512 * 2**20), ("16G", 16 * 2**30), ("1.5GiB", 3 * 2**29)],
+)
+def test_parse_size(size, expected):
+    assert memory.parse_size(size) == expected
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        memory.parse_size("lots")
+
+
+def test_estimates():
+    one_year = memory.estimate_job_bytes(8784, 30)
+    assert memory.estimate_job_bytes(4 * 8784, 30) == 4 * one_year
+    assert memory.estimate_job_bytes(8784, 1) < one_year
+    ten_years = memory.estimate_job_bytes(10 * 8784, 30)
+    assert memory.estimate_job_bytes(10 * 8784, 30, chunk_steps=8784) < one_year
+    assert memory.estimate_job_bytes(10 * 8784, 30, chunk_steps=8784) < ten_years
+
+    per_worker = memory.WORKER_BASE_BYTES + one_year
+    assert memory.max_workers(4 * per_worker, one_year) == 4
+    assert memory.max_workers(0, one_year) == 1
+
+
+def test_process_memory():
+    assert memory.rss() > 0
+    assert memory.rss(2**31 - 1) == 0  # no such process
+    assert memory.tree_rss([2**31 - 1]) > 0
+    assert memory.available_memory() > 0
+    assert memory.memory_budget(2**30) == 2**30
+    assert memory.memory_budget() > memory.rss()
+
+
+def test_admit():
+    assert admit(3, None, 2**40)
+    assert admit(0, 1, 2**40)  # nothing running: always make progress
+    assert not admit(1, 1, 0)
+    assert admit(1, 2**50, 0)
+
+
+def test_size_pool_caps_workers():
+    client = InMemoryClient()
+    steps = 9 * 24  # the last input day is not simulated
+
+    ncores, limit, job_bytes = size_pool(client, "m/inputs/R1C0-input.json", 2, 8)
+    assert ncores <= 8
+    assert job_bytes == memory.estimate_job_bytes(steps, 2)
+
+    assert size_pool(client, "m/inputs/R1C0-input.json", 2, 8, 1)[:2] == (1, 1)
+
+
+def test_run_jobs_over_budget_runs_one_job_at_a_time():
+    input_files = [f"m/inputs/R1C{i}-input.json" for i in range(2)]
+
+    timings = run_jobs(
+        [input_files[:1], input_files[1:]],
+        ncores=2,
+        hrus=["hru250"],
+        client_factory=InMemoryClient,
+        memory_limit=1,
+        job_bytes=1,
+    )
+
+    assert len(timings) == len(input_files)
@@ -0,0 +1,120 @@
+import queue
+
+import orjson
+import pytest
+
+from .. import metrics
+from ..cli import run_jobs
+from ..main import Layout, run_and_send_results_for_inputfiles
+from .test_pipeline import InMemoryClient
+
+
+@pytest.fixture
+def events():
+    collected: list[metrics.Event] = []
+    metrics.set_sink(collected.extend)
+    yield collected
+    metrics.set_sink(None)
+
+
+def test_timer_without_sink_emits_nothing():
+    with metrics.timer("hspf"):
+        pass
+    metrics.flush()  # no sink, nothing to deliver
+
+
+def test_timer_emits_on_flush(events):
+    with metrics.timer("upload", bytes=10):
+        pass
+    assert events == []
+
+    metrics.flush()
+    (event,) = events
+    assert event["event"] == "stage"
+    assert event["stage"] == "upload"
+    assert event["bytes"] == 10
+    assert event["seconds"] >= 0
+
+
+def test_registry_prometheus():
+    registry = metrics.Registry()
+    registry.observe({"event": "stage", "stage": "hspf", "seconds": 0.3, "count": 3})
+    registry.observe(
+        {"event": "stage", "stage": "upload", "seconds": 2.0, "bytes": 512}
+    )
+    registry.observe({"event": "file", "hrus": 3, "failed": 1})
+    registry.observe(metrics.transfer("upload", 100))
+    registry.observe(metrics.transfer("upload", 2048, skipped=True))
+    registry.observe(metrics.skipped_file("m/inputs/R1C1-input.json", "claimed"))
+
+    assert registry.summary() == [("hspf", 3, pytest.approx(0.3)), ("upload", 1, 2.0)]
+
+    text = registry.to_prometheus()
+    assert 'tnc_stage_seconds_bucket{stage="hspf",le="0.1"} 3' in text
+    assert 'tnc_stage_seconds_bucket{stage="upload",le="1.0"} 0' in text
+    assert 'tnc_stage_seconds_bucket{stage="upload",le="+Inf"} 1' in text
+    assert 'tnc_stage_seconds_count{stage="hspf"} 3' in text
+    assert 'tnc_stage_bytes_total{stage="upload"} 612' in text
+    assert 'tnc_stage_skipped_bytes_total{stage="upload"} 2048' in text
+    assert "tnc_files_total 1" in text
+    assert "tnc_skipped_files_total 1" in text
+    assert "tnc_hrus_total 3" in text
+    assert "tnc_failed_hrus_total 1" in text
+
+
+def test_collector(tmp_path):
+    events: queue.Queue = queue.Queue()
+    registry = metrics.Registry()
+    finished = []
+    with metrics.Collector(
+        events,
+        registry,
+        jsonl=tmp_path / "events.jsonl",
+        prometheus=tmp_path / "tnc.prom",
+        on_file=finished.append,
+    ):
+        events.put([{"event": "stage", "stage": "pet", "seconds": 0.01}])
+        events.put([{"event": "file", "input_file": "f", "hrus": 2, "failed": 0}])
+
+    lines = (tmp_path / "events.jsonl").read_bytes().splitlines()
+    assert [orjson.loads(line)["event"] for line in lines] == ["stage", "file"]
+    assert [e["input_file"] for e in finished] == ["f"]
+    assert "tnc_files_total 1" in (tmp_path / "tnc.prom").read_text()
+
+
+@pytest.mark.parametrize("layout", list(Layout))
+def test_pipeline_stages(events, layout):
+    client = InMemoryClient()
+    hrus = ["hru010", "hru250"]
+    run_and_send_results_for_inputfiles(
+        input_files=["m/inputs/R1C0-input.json"],
+        hrus=hrus,
+        client_factory=lambda: client,
+        layout=layout,
+    )
+
+    stages = {e["stage"] for e in events if e["event"] == "stage"}
+    assert {"pet", "hspf", "table", "serialize", "upload"} <= stages
+    (file_event,) = [e for e in events if e["event"] == "file"]
+    assert file_event["hrus"] == len(hrus)
+    assert file_event["failed"] == 0
+
+
+def test_run_jobs_collects_worker_metrics(tmp_path):
+    registry = metrics.Registry()
+    input_files = [f"m/inputs/R1C{i}-input.json" for i in range(3)]
+
+    timings = run_jobs(
+        [input_files[:2], input_files[2:]],
+        ncores=2,
+        hrus=["hru250"],
+        client_factory=InMemoryClient,
+        registry=registry,
+        metrics_prom=tmp_path / "tnc.prom",
+    )
+
+    assert len(timings) == len(input_files)
+    assert registry.files == len(input_files)
+    assert registry.hrus == len(input_files)
+    assert {s: n for s, n, _ in registry.summary()}["hspf"] == len(input_files)
+    assert "tnc_files_total 3" in (tmp_path / "tnc.prom").read_text()
@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import numpy
+import pandas
+import pytest
+
+from .. import convert, pet
+from ..config import settings
+from ..hspf_runner import get_TNC_siminfo
+from ..main import build_petinp
+
+
+def legacy_build_evap_ts(evap_csv, siminfo):
+    evap = (
+        pandas.read_csv(evap_csv, parse_dates=["date_arb_year"])
+        .iloc[:, 1:]
+        .assign(month=lambda df: df.date_arb_year.dt.month.astype(str))
+        .assign(day=lambda df: df.date_arb_year.dt.day.astype(str))
+        .drop(columns=["date_arb_year"])
+    )[["month", "day", siminfo["gridcell"]]]
+
+    return (
+        pandas.date_range(siminfo["start"], siminfo["stop"], freq="h")
+        .to_frame(name="datetime")
+        .assign(month=lambda df: df.datetime.dt.month.astype(str))
+        .assign(day=lambda df: df.datetime.dt.day.astype(str))
+        .merge(evap, how="left", on=["month", "day"])
+        .set_index("datetime")
+        .loc[:, siminfo["gridcell"]]
+        .div(24)
+        .mul(convert.MM_TO_INCH)
+    )
+
+
+def legacy_build_petinp(siminfo, data):
+    start, end = siminfo["start"], siminfo["stop"]
+    daterange = pandas.date_range(start=start, end=end, freq="1D")
+    return (
+        pandas.DataFrame({"petinp": data["petinp"].get("data", [])[: len(daterange)]})
+        .assign(datetime=daterange)
+        .set_index("datetime")
+        .reindex(pandas.date_range(start=start, end=end, freq="1h"), method="ffill")
+        .div(24)
+        .to_numpy()
+        .flatten()
+        * convert.MM_TO_INCH
+    )
+
+
+@pytest.fixture
+def evap_csv(tmp_path, monkeypatch):
+    # an arbitrary non-leap year, so Feb 29th is missing from the climatology
+    dates = pandas.date_range("2001-01-01", "2001-12-31", freq="D")
+    rng = numpy.random.default_rng(0)
+    path = tmp_path / "pet_mm_daily.csv"
+    pandas.DataFrame(
+        {
+            "date_arb_year": dates,
+            "R18C42": rng.uniform(0, 6, len(dates)),
+            "R17C42": rng.uniform(0, 6, len(dates)),
+        }
+    ).to_csv(path)
+
+    monkeypatch.setattr(settings, "PET_MM_DAILY", path)
+    pet.load_evap.cache_clear()
+    pet._evap_array.cache_clear()
+    yield path
+    pet.load_evap.cache_clear()
+    pet._evap_array.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        (datetime(1980, 1, 1), datetime(1981, 1, 1)),
+        (datetime(1999, 10, 1), datetime(2001, 3, 2, 23)),
+        (datetime(1950, 2, 27, 5), datetime(1950, 3, 1, 23)),
+    ],
+)
+@pytest.mark.parametrize("gridcell", ["R18C42", "R17C42"])
+def test_build_evap_ts_matches_legacy(evap_csv, start, end, gridcell):
+    siminfo = get_TNC_siminfo(start, end, model="m", gridcell=gridcell)
+    expected = legacy_build_evap_ts(evap_csv, siminfo)
+    result = pet.build_evap_ts(siminfo)
+
+    pandas.testing.assert_series_equal(result, expected, check_freq=False)
+    numpy.testing.assert_array_equal(pet.build_evap_array(siminfo), expected)
+
+
+def test_build_evap_array_is_cached(evap_csv):
+    siminfo = get_TNC_siminfo(
+        datetime(1980, 1, 1), datetime(1980, 2, 1), model="m", gridcell="R18C42"
+    )
+    other_model = dict(siminfo, model="other")
+    assert pet.build_evap_array(siminfo) is pet.build_evap_array(other_model)
+
+
+def test_build_petinp_matches_legacy():
+    start, end = datetime(1980, 1, 1), datetime(1980, 3, 31, 23)
+    siminfo = get_TNC_siminfo(start, end, model="m", gridcell="R18C42")
+    ndays = len(pandas.date_range(start, end, freq="1D"))
+    data = {"petinp": {"data": numpy.linspace(0, 5, ndays + 3).tolist()}}
+
+    numpy.testing.assert_array_equal(
+        build_petinp(siminfo, data), legacy_build_petinp(siminfo, data)
+    )
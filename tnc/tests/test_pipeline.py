@@ -0,0 +1,400 @@
+import tempfile
+import threading
+from copy import deepcopy
+
+import numpy
+import orjson
+import pyarrow
+import pyarrow.parquet as pq
+import pytest
+
+from .. import convert, memo
+from ..cli import select_work
+from ..hspf_runner import run_hrus_batched
+from ..main import (
+    Layout,
+    read_hru_results,
+    read_results_metadata,
+    run_and_send_results_for_inputfiles,
+    serialize_results,
+)
+from ..manifest import RunManifest
+
+
+class InMemoryClient:
+    """serves synthetic inputs and records uploads instead of using the network."""
+
+    def __init__(self, ndays=10):
+        rng = numpy.random.default_rng(42)
+        self.doc = {
+            "start_time": "1980-01-01",
+            "end_time": f"1980-01-{ndays:02d}",
+            "prec": {"data": rng.gamma(0.3, 2.0, ndays * 24).round(2).tolist()},
+            "petinp": {"data": [2.5] * ndays},
+        }
+        self.sent: list[str] = []
+        self.meta: dict[str, bytes] = {}
+        self.lock = threading.Lock()
+
+    def get_input(self, input_file):
+        return self.doc
+
+    def rm_blob(self, path):
+        return None
+
+    def _send(self, destination_filename, data):
+        with self.lock:
+            self.sent.append(destination_filename)
+        return destination_filename
+
+    def send_json(self, destination_filename, data):
+        self.meta[destination_filename] = orjson.dumps(
+            data, option=orjson.OPT_SERIALIZE_NUMPY
+        )
+        return self._send(destination_filename, data)
+
+    def get_meta(self, path):
+        return orjson.loads(self.meta[path]) if path in self.meta else None
+
+    send_parquet = _send
+
+
+@pytest.mark.parametrize("queue_size", [1, 3])
+def test_run_and_send_results_for_inputfiles(queue_size, tmp_path):
+    client = InMemoryClient()
+    input_files = [f"m/inputs/R1C{i}-input.json" for i in range(4)]
+    hrus = ["hru010", "hru250"]
+
+    finished = run_and_send_results_for_inputfiles(
+        input_files=input_files,
+        hrus=hrus,
+        client_factory=lambda: client,
+        queue_size=queue_size,
+        manifest_path=tmp_path / "run.sqlite",
+    )
+
+    assert [f for f, *_ in finished] == input_files
+    for _, run_time, send_time, completed in finished:
+        assert run_time > 0 and send_time >= 0
+        assert len(completed) == len(hrus)
+
+    # one parquet and one meta document per hru per input file
+    assert len(client.sent) == 2 * len(hrus) * len(input_files)
+    assert "m/results/R1C3/hru250.parquet" in client.sent
+    assert "m/meta/R1C0-hru010.meta" in client.sent
+
+    completed = RunManifest(tmp_path / "run.sqlite").completed()
+    assert len(completed) == len(hrus) * len(input_files)
+    assert ("m", "R1C3", "hru250") in completed
+
+
+def test_run_and_send_results_for_inputfiles_hrus_by_file():
+    client = InMemoryClient()
+    input_files = ["m/inputs/R1C0-input.json", "m/inputs/R1C1-input.json"]
+
+    run_and_send_results_for_inputfiles(
+        input_files=input_files,
+        hrus=["hru010", "hru250"],
+        hrus_by_file={"m/inputs/R1C1-input.json": ["hru250"]},
+        client_factory=lambda: client,
+    )
+
+    assert sorted(client.sent) == sorted(
+        [
+            "m/results/R1C0/hru010.parquet",
+            "m/meta/R1C0-hru010.meta",
+            "m/results/R1C0/hru250.parquet",
+            "m/meta/R1C0-hru250.meta",
+            "m/results/R1C1/hru250.parquet",
+            "m/meta/R1C1-hru250.meta",
+        ]
+    )
+
+
+def test_gridcell_layout_roundtrip(regression_input_ts, regression_siminfo):
+    hrus = ["hru010", "hru250"]
+    results = run_hrus_batched(regression_input_ts, regression_siminfo, hrus)[0]
+
+    (serialized,) = serialize_results(
+        results=deepcopy(results), siminfo=regression_siminfo, layout=Layout.gridcell
+    )
+    assert serialized["parquet_path"] == "m/results/R18C42.parquet"
+    assert serialized["meta_path"] == "m/meta/R18C42.meta"
+    assert set(serialized["meta"]) == set(hrus)
+
+    pfile = pq.ParquetFile(pyarrow.BufferReader(serialized["parquet"]))
+    assert pfile.num_row_groups == len(hrus)
+    assert pyarrow.types.is_dictionary(pfile.schema_arrow.field("hru").type)
+
+    for hru in hrus:
+        table = read_hru_results(serialized["parquet"], hru)
+        assert table.num_rows == regression_siminfo["steps"]
+        assert set(table.column("hru").to_pylist()) == {hru}
+        numpy.testing.assert_allclose(
+            table.column("SURO").to_numpy(),
+            results[hru]["results"]["SURO"] * convert.INCH_TO_MM,
+            rtol=1e-6,
+        )
+
+    with pytest.raises(KeyError):
+        read_hru_results(serialized["parquet"], "hru999")
+
+
+def test_hru_layout_arrow_results(regression_input_ts, regression_siminfo):
+    results = run_hrus_batched(regression_input_ts, regression_siminfo, ["hru010"])[0]
+    suro = results["hru010"]["results"]["SURO"]
+
+    (serialized,) = serialize_results(
+        results=deepcopy(results), siminfo=regression_siminfo, layout=Layout.hru
+    )
+    table = pq.read_table(pyarrow.BufferReader(serialized["parquet"]))
+
+    assert table.column_names == ["ix", "SURO", "AGWO", "IFWO"]
+    assert table.schema.field("SURO").type == pyarrow.float32()
+    numpy.testing.assert_array_equal(
+        table.column("SURO").to_numpy(), suro * numpy.float32(convert.INCH_TO_MM)
+    )
+
+    metadata = read_results_metadata(serialized["parquet"])
+    assert metadata["id"] == "m/results/R18C42/hru010"
+    assert metadata["hru"] == "hru010"
+    assert metadata["start_time"] == regression_siminfo["start"].isoformat()
+    assert metadata["runoff_units"] == "depth (mm)"
+
+
+@pytest.mark.parametrize("layout", list(Layout))
+def test_chunked_run_spools_a_row_group_per_chunk(layout, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    client = InMemoryClient()
+    # 12 days before and 10 days into 1981: two one-year chunks
+    client.doc |= {
+        "start_time": "1980-12-20",
+        "end_time": "1981-01-10",
+        "prec": {"data": (client.doc["prec"]["data"] * 3)[: 22 * 24]},
+        "petinp": {"data": [2.5] * 22},
+    }
+    uploaded = {}
+
+    def send_parquet(name, data):
+        uploaded[name] = data.read_bytes()
+        return name
+
+    client.send_parquet = send_parquet
+    hrus = ["hru010", "hru250"]
+
+    run_and_send_results_for_inputfiles(
+        input_files=["m/inputs/R1C0-input.json"],
+        hrus=hrus,
+        client_factory=lambda: client,
+        layout=layout,
+        chunk_years=1,
+    )
+
+    assert list(tmp_path.iterdir()) == []  # spooled files removed after upload
+    for hru in hrus:
+        if layout == Layout.gridcell:
+            parquet = uploaded["m/results/R1C0.parquet"]
+            table = read_hru_results(parquet, hru)
+        else:
+            parquet = uploaded[f"m/results/R1C0/{hru}.parquet"]
+            table = pq.read_table(pyarrow.BufferReader(parquet))
+            assert read_results_metadata(parquet)["steps"] == str(21 * 24)
+        ix = table.column("ix").to_numpy()
+        assert len(ix) == 21 * 24
+        assert (numpy.diff(ix) > 0).all()
+
+    pfile = pq.ParquetFile(pyarrow.BufferReader(parquet))
+    assert pfile.num_row_groups == 2 * (len(hrus) if layout == Layout.gridcell else 1)
+
+
+def test_failed_upload_removes_spooled_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    client = InMemoryClient()
+
+    def send_parquet(name, data):
+        raise ConnectionError(name)
+
+    client.send_parquet = send_parquet
+
+    with pytest.raises(ConnectionError):
+        run_and_send_results_for_inputfiles(
+            input_files=[f"m/inputs/R1C{i}-input.json" for i in range(3)],
+            hrus=["hru010", "hru250", "hru251"],
+            client_factory=lambda: client,
+            max_workers=1,
+            queue_size=3,
+            chunk_years=1,
+        )
+
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("layout", list(Layout))
+def test_incremental_run_uploads_only_new_steps(layout):
+    hrus = ["hru010", "hru250"]
+    client = InMemoryClient()
+    run_and_send_results_for_inputfiles(
+        input_files=["m/inputs/R1C0-input.json"],
+        hrus=hrus,
+        client_factory=lambda: client,
+        layout=layout,
+    )
+
+    # the same series, ten days longer
+    extended = InMemoryClient(ndays=20)
+    extended.meta = dict(client.meta)
+    uploaded = {}
+
+    def send_parquet(name, data):
+        uploaded[name] = data
+        return name
+
+    extended.send_parquet = send_parquet
+    run_and_send_results_for_inputfiles(
+        input_files=["m/inputs/R1C0-input.json"],
+        hrus=hrus,
+        client_factory=lambda: extended,
+        layout=layout,
+        incremental=True,
+    )
+
+    part = (
+        "m/results/R1C0.1980011000.parquet"
+        if layout == Layout.gridcell
+        else "m/results/R1C0/hru010.1980011000.parquet"
+    )
+    assert part in uploaded
+    metadata = read_results_metadata(uploaded[part])
+    assert metadata["start_time"] == "1980-01-10T00:00:00"
+    assert metadata["steps"] == str(10 * 24)
+
+    meta_path = (
+        "m/meta/R1C0.meta" if layout == Layout.gridcell else "m/meta/R1C0-hru010.meta"
+    )
+    meta = extended.get_meta(meta_path)
+    if layout == Layout.gridcell:
+        meta = meta["hru010"]
+    assert meta["parts"] == [part]
+    assert meta["state"]["end_time"] == "1980-01-19T23:00:00"
+
+    # nothing new to run
+    extended.sent.clear()
+    run_and_send_results_for_inputfiles(
+        input_files=["m/inputs/R1C0-input.json"],
+        hrus=hrus,
+        client_factory=lambda: extended,
+        layout=layout,
+        incremental=True,
+    )
+    assert extended.sent == []
+
+
+class MemoClient(InMemoryClient):
+    """records the object metadata of uploads and versions inputs."""
+
+    def __init__(self, ndays=10):
+        super().__init__(ndays)
+        self.version = "1"
+        self.metadata: dict[str, dict[str, str]] = {}
+
+    def input_version(self, input_file):
+        return f"{input_file}@{self.version}"
+
+    def object_metadata(self, prefix):
+        return {k: v for k, v in self.metadata.items() if k.startswith(prefix)}
+
+    def send_parquet(self, destination_filename, data, metadata=None):
+        if metadata is not None:
+            self.metadata[destination_filename] = metadata
+        return self._send(destination_filename, data)
+
+
+@pytest.mark.parametrize("layout", list(Layout))
+def test_memo_skips_unchanged_results(layout, tmp_path):
+    hrus = ["hru010", "hru250"]
+    client = MemoClient()
+
+    def run():
+        client.sent.clear()
+        return run_and_send_results_for_inputfiles(
+            input_files=["m/inputs/R1C0-input.json"],
+            hrus=hrus,
+            client_factory=lambda: client,
+            layout=layout,
+            memo_path=tmp_path / "memo.sqlite",
+        )
+
+    run()
+    assert len(client.sent) == (2 if layout == Layout.gridcell else 4)
+    keys = memo.MemoIndex(tmp_path / "memo.sqlite").keys("m", "R1C0")
+    assert set(keys) == set(hrus)
+
+    finished = run()
+    assert client.sent == []
+    assert [f for f, *_ in finished] == ["m/inputs/R1C0-input.json"]
+
+    # results missing from the bucket are rerun
+    parquet = (
+        "m/results/R1C0.parquet"
+        if layout == Layout.gridcell
+        else "m/results/R1C0/hru250.parquet"
+    )
+    del client.metadata[parquet]
+    run()
+    if layout == Layout.gridcell:
+        assert "m/results/R1C0.parquet" in client.sent
+    else:
+        assert client.sent == [
+            "m/results/R1C0/hru250.parquet",
+            "m/meta/R1C0-hru250.meta",
+        ]
+
+    # a new input version reruns everything
+    client.version = "2"
+    run()
+    assert len(client.sent) == (2 if layout == Layout.gridcell else 4)
+
+
+def test_resume_gridcell_layout_keeps_every_hru(tmp_path):
+    hrus = ["hru010", "hru250"]
+    input_files = ["m/inputs/R1C0-input.json"]
+    manifest = tmp_path / "run.sqlite"
+    client = InMemoryClient()
+    run_and_send_results_for_inputfiles(
+        input_files=input_files,
+        hrus=hrus,
+        client_factory=lambda: client,
+        layout=Layout.gridcell,
+        manifest_path=manifest,
+    )
+    # hru250 failed in that run
+    RunManifest(manifest).record([("m", "R1C0", "hru250", False)])
+
+    hrus_by_file = select_work(
+        client,
+        input_files,
+        hrus,
+        manifest=manifest,
+        resume=True,
+        layout=Layout.gridcell,
+    )
+    assert hrus_by_file == {"m/inputs/R1C0-input.json": hrus}
+
+    uploaded = {}
+
+    def send_parquet(name, data):
+        uploaded[name] = data
+        return name
+
+    client.send_parquet = send_parquet
+    run_and_send_results_for_inputfiles(
+        input_files=list(hrus_by_file),
+        hrus=hrus,
+        hrus_by_file=hrus_by_file,
+        client_factory=lambda: client,
+        layout=Layout.gridcell,
+        manifest_path=manifest,
+    )
+    for hru in hrus:
+        assert read_hru_results(uploaded["m/results/R1C0.parquet"], hru).num_rows
+    assert RunManifest(manifest).failed() == set()
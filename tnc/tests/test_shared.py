@@ -0,0 +1,48 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pandas
+
+from .. import shared, wwhm
+from ..main import init_worker
+
+
+def _read_in_worker(key):
+    table = shared.get_table(key)
+    return (
+        table is not None,
+        table.to_numpy().sum(),
+        wwhm.get_wwhm_params_per() is table,
+    )
+
+
+def test_publish_and_attach_tables():
+    df = pandas.DataFrame(
+        numpy.arange(12, dtype=float).reshape(4, 3),
+        index=["hru000", "hru001", "hru002", "hru010"],
+        columns=["LZSN", "INFILT", "AGWRC"],
+    )
+
+    with shared.publish_tables({"perlnd": df}) as tables:
+        assert tables["perlnd"].shape == (4, 3)
+        assert tables["perlnd"].index == df.index.tolist()
+
+        with ProcessPoolExecutor(2, initializer=init_worker, initargs=(tables,)) as exe:
+            results = list(exe.map(_read_in_worker, ["perlnd"] * 2))
+
+    for attached, total, used_by_wwhm in results:
+        assert attached
+        assert total == df.to_numpy().sum()
+        assert used_by_wwhm
+
+
+def test_published_view_is_read_only():
+    df = pandas.DataFrame({"a": [1.0, 2.0]}, index=["x", "y"])
+    with shared.publish_tables({"t": df}) as tables:
+        try:
+            shared.attach_tables(tables)
+            view = shared.get_table("t")
+            pandas.testing.assert_frame_equal(view, df)
+            assert not view.to_numpy().flags.writeable
+        finally:
+            shared._attached.pop("t", None)
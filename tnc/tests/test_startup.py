@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+import orjson
+
+# seconds to import the cli, i.e., before `find` or `--help` do anything
+CLI_IMPORT_BUDGET = 0.6
+
+# imported only by the commands that run hrus or read the bucket
+HEAVY = (
+    "numba",
+    "HSP2",
+    "pandas",
+    "pyarrow",
+    "google.cloud.storage",
+    "pydantic_settings",
+    "tqdm",
+    "tnc.main",
+)
+
+
+def _import(module: str) -> tuple[float, list[str]]:
+    code = (
+        "import sys, time, orjson; start = time.perf_counter(); "
+        f"import {module}; seconds = time.perf_counter() - start; "
+        "print(orjson.dumps([seconds, sorted(sys.modules)]).decode())"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    seconds, modules = orjson.loads(out)
+    return seconds, modules
+
+
+def test_cli_imports_no_heavy_modules():
+    seconds, modules = _import("tnc.cli")
+    assert [m for m in HEAVY if m in modules] == []
+    assert seconds < CLI_IMPORT_BUDGET
+
+
+def test_light_modules():
+    _, modules = _import("tnc.schema")
+    assert [m for m in HEAVY if m in modules] == []
@@ -0,0 +1,101 @@
+import numpy
+import pyarrow
+import pyarrow.parquet as pq
+import pytest
+
+from .. import summary
+from ..hspf_runner import OUTPUTS
+from ..main import Layout, run_and_send_results_for_inputfiles
+from .test_pipeline import InMemoryClient
+
+# 1980-12-31 00:00 in hours since the epoch
+DEC31 = (numpy.datetime64("1980-12-31T00") - numpy.datetime64("1970-01-01T00")).astype(
+    int
+)
+
+
+def results_table(steps, values=None):
+    values = numpy.ones(steps) if values is None else values
+    return pyarrow.table(
+        {
+            "ix": numpy.arange(DEC31, DEC31 + steps, dtype=numpy.uint32),
+            **{k: values.astype(numpy.float32) for k in OUTPUTS},
+        }
+    )
+
+
+def test_period_totals():
+    totals = summary.period_totals(results_table(3 * 24)).to_pydict()
+
+    def stat(name):
+        rows = [i for i, s in enumerate(totals["stat"]) if s == name]
+        return [totals["ix"][i] for i in rows], [totals["SURO"][i] for i in rows]
+
+    assert stat("day") == ([DEC31, DEC31 + 24, DEC31 + 48], [24, 24, 24])
+    assert stat("month") == ([DEC31, DEC31 + 24], [24, 48])
+    assert stat("year") == ([DEC31, DEC31 + 24], [24, 48])
+    assert set(totals["exceedance"]) == {None}
+
+
+def test_flow_duration():
+    values = numpy.arange(1001, dtype=numpy.float64)
+    fdc = summary.flow_duration(results_table(len(values), values)).to_pydict()
+
+    assert fdc["stat"] == ["fdc"] * len(summary.EXCEEDANCE)
+    assert fdc["exceedance"] == pytest.approx(summary.EXCEEDANCE)
+    assert fdc["AGWO"][summary.EXCEEDANCE.index(50.0)] == 500
+    assert fdc["AGWO"][summary.EXCEEDANCE.index(10.0)] == 900
+    assert numpy.all(numpy.diff(fdc["AGWO"]) <= 0)
+
+
+def test_empty_results():
+    assert summary.summarize(results_table(0)).num_rows == 0
+
+
+def _run(layout, chunk_years=None):
+    client = InMemoryClient()
+    # 12 days before and 10 days into 1981
+    client.doc |= {
+        "start_time": "1980-12-20",
+        "end_time": "1981-01-10",
+        "prec": {"data": (client.doc["prec"]["data"] * 3)[: 22 * 24]},
+        "petinp": {"data": [2.5] * 22},
+    }
+    uploaded = {}
+
+    def send_parquet(name, data):
+        uploaded[name] = data.read_bytes() if hasattr(data, "read_bytes") else data
+        return name
+
+    client.send_parquet = send_parquet
+    run_and_send_results_for_inputfiles(
+        input_files=["m/inputs/R1C0-input.json"],
+        hrus=["hru010", "hru250"],
+        client_factory=lambda: client,
+        layout=layout,
+        chunk_years=chunk_years,
+        summaries=True,
+    )
+    return uploaded
+
+
+@pytest.mark.parametrize("layout", list(Layout))
+def test_pipeline_summaries(layout):
+    uploaded = _run(layout)
+    chunked = _run(layout, chunk_years=1)
+
+    path = (
+        "m/summaries/R1C0.parquet"
+        if layout == Layout.gridcell
+        else "m/summaries/R1C0/hru250.parquet"
+    )
+    table = pq.read_table(pyarrow.BufferReader(uploaded[path])).to_pandas()
+    days = table[table["stat"] == "day"]
+    assert len(days) == 21 * (2 if layout == Layout.gridcell else 1)
+    assert set(table["stat"]) == {"day", "month", "year", "fdc"}
+
+    # chunks are split on january 1, so only the flow durations differ
+    chunked_table = pq.read_table(pyarrow.BufferReader(chunked[path])).to_pandas()
+    numpy.testing.assert_allclose(
+        chunked_table["SURO"].to_numpy(), table["SURO"].to_numpy(), atol=1e-3
+    )
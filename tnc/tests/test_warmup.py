@@ -0,0 +1,31 @@
+import subprocess
+import sys
+
+from .. import warmup
+from ..main import init_worker
+
+
+def test_synthetic_inputs():
+    input_ts, siminfo = warmup.synthetic_inputs(days=3)
+    assert siminfo["steps"] == 72
+    assert all(len(v) == siminfo["steps"] for v in input_ts.values())
+    assert input_ts["PREC"].sum() > 0
+
+
+def test_warmup():
+    timings = warmup.warmup()
+    assert set(timings) == {"pwater", "iwater"}
+    assert all(seconds > 0 for seconds in timings.values())
+
+
+def test_warmup_compiles_the_batched_kernels():
+    # in a fresh interpreter, so nothing else has compiled them yet
+    check = (
+        "from tnc import hspf_runner, warmup; warmup.warmup(); "
+        "assert hspf_runner._run_cores.signatures"
+    )
+    subprocess.run([sys.executable, "-c", check], check=True)
+
+
+def test_init_worker_primes():
+    init_worker(prime=True)
@@ -0,0 +1,250 @@
+import multiprocessing
+import time
+
+import pytest
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from .. import main
+from ..main import run_and_send_results_for_inputfiles
+from ..workqueue import (
+    BucketQueue,
+    DirectoryQueue,
+    Heartbeat,
+    parse_shard,
+    select_shard,
+    shard_of,
+)
+from .test_pipeline import InMemoryClient
+
+items = [f"m/inputs/R{r}C{c}-input.json" for r in range(10) for c in range(10)]
+
+
+def test_shards_partition_items():
+    shards = [select_shard(items, i, 4) for i in range(4)]
+    assert sorted(sum(shards, [])) == sorted(items)
+    assert all(shards)
+    assert shard_of(items[0], 4) == shard_of(items[0], 4)
+
+
+@pytest.mark.parametrize("spec", ["4/4", "-1/4", "1", "a/b"])
+def test_parse_shard_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_shard(spec)
+
+
+def test_claim_and_complete(tmp_path):
+    a = DirectoryQueue(tmp_path, owner="a")
+    b = DirectoryQueue(tmp_path, owner="b")
+
+    lease = a.claim(items[0])
+    assert lease is not None and lease.owner == "a"
+    assert b.claim(items[0]) is None
+    assert a.renew(lease) is not None
+
+    a.complete(lease)
+    assert b.is_complete(items[0])
+    assert b.claim(items[0]) is None
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    a = DirectoryQueue(tmp_path, lease_seconds=0.05, owner="a")
+    b = DirectoryQueue(tmp_path, owner="b")
+
+    lease = a.claim(items[0])
+    time.sleep(0.1)
+    taken = b.claim(items[0])
+    assert taken is not None and taken.owner == "b"
+
+    # the expired holder has lost its claim
+    assert a.renew(lease) is None
+    assert a.claim(items[0]) is None
+
+
+def test_stale_complete_keeps_the_new_claim(tmp_path):
+    a = DirectoryQueue(tmp_path, lease_seconds=0.05, owner="a")
+    b = DirectoryQueue(tmp_path, owner="b")
+
+    lease = a.claim(items[0])
+    time.sleep(0.1)
+    taken = b.claim(items[0])
+    a.complete(lease)
+
+    assert b.renew(taken) is not None
+    assert not list(tmp_path.rglob("*.done"))
+
+
+def test_heartbeat_renews_and_detects_lost_leases(tmp_path):
+    a = DirectoryQueue(tmp_path, lease_seconds=0.2, owner="a")
+    b = DirectoryQueue(tmp_path, lease_seconds=0.2, owner="b")
+
+    with Heartbeat(a, interval=0.02) as heartbeat:
+        assert heartbeat.claim(items[0]) and heartbeat.claim(items[1])
+        time.sleep(0.4)
+        assert b.claim(items[0]) is None
+        assert heartbeat.renew(items[0])
+
+        # the lease lapses once it is no longer renewed
+        heartbeat.abandon(items[1])
+        time.sleep(0.3)
+        assert b.claim(items[1]) is not None
+        assert heartbeat.complete(items[0])
+    assert a.is_complete(items[0])
+    assert not heartbeat.complete(items[1])
+    assert not a.is_complete(items[1])
+
+
+def _claim_all(path, owner, results):
+    queue = DirectoryQueue(path, owner=owner)
+    results.extend([(item, owner) for item in items if queue.claim(item)])
+
+
+def test_claims_are_exclusive_across_processes(tmp_path):
+    with multiprocessing.Manager() as manager:
+        results = manager.list()
+        procs = [
+            multiprocessing.Process(
+                target=_claim_all, args=(tmp_path, f"p{i}", results)
+            )
+            for i in range(4)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        claimed = list(results)
+
+    assert sorted(item for item, _ in claimed) == sorted(items)
+
+
+def test_pipeline_skips_claimed_and_completed(tmp_path, monkeypatch):
+    events = []
+    monkeypatch.setattr(main.metrics, "emit", events.append)
+    input_files = items[:3]
+    other = DirectoryQueue(tmp_path / "queue", owner="other")
+    assert other.claim(input_files[0]) is not None
+
+    client = InMemoryClient()
+    kwargs = {
+        "input_files": input_files,
+        "hrus": ["hru250"],
+        "client_factory": lambda: client,
+        "work_queue": str(tmp_path / "queue"),
+    }
+    finished = run_and_send_results_for_inputfiles(**kwargs)
+    assert [f for f, *_ in finished] == input_files[1:]
+    assert all(other.is_complete(f) for f in input_files[1:])
+    # every file is reported, so progress reaches the total
+    assert sorted(e["input_file"] for e in events if e["event"] == "file") == sorted(
+        input_files
+    )
+    (skipped,) = [e for e in events if e.get("skipped")]
+    assert skipped["input_file"] == input_files[0]
+    assert skipped["skipped"] == "claimed"
+
+    assert run_and_send_results_for_inputfiles(**kwargs) == []
+
+
+def test_pipeline_abandons_lost_leases(tmp_path, monkeypatch):
+    class LosingQueue(DirectoryQueue):
+        def renew(self, lease):
+            return None
+
+    queue = LosingQueue(tmp_path / "queue", owner="a")
+    monkeypatch.setattr(main, "open_queue", lambda spec, client: queue)
+    events = []
+    monkeypatch.setattr(main.metrics, "emit", events.append)
+
+    client = InMemoryClient()
+    finished = run_and_send_results_for_inputfiles(
+        input_files=items[:2],
+        hrus=["hru250"],
+        client_factory=lambda: client,
+        work_queue=str(tmp_path / "queue"),
+    )
+    assert finished == []
+    assert not any(queue.is_complete(f) for f in items[:2])
+    lost = [e["input_file"] for e in events if e.get("skipped") == "lease_lost"]
+    assert lost == items[:2]
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, generation=None):
+        self.bucket, self.name, self.generation = bucket, name, generation
+
+    def _check(self, if_generation_match):
+        _, current = self.bucket.objects.get(self.name, (None, 0))
+        if if_generation_match is None or if_generation_match == current:
+            return
+        raise PreconditionFailed(self.name) if current else NotFound(self.name)
+
+    def exists(self):
+        return self.name in self.bucket.objects
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        self._check(if_generation_match)
+        self.bucket.generation += 1
+        self.generation = self.bucket.generation
+        self.bucket.objects[self.name] = (data, self.generation)
+
+    def download_as_bytes(self, if_generation_match=None):
+        self._check(if_generation_match)
+        if not self.exists():
+            raise NotFound(self.name)
+        return self.bucket.objects[self.name][0]
+
+    def delete(self, if_generation_match=None):
+        self._check(if_generation_match)
+        del self.bucket.objects[self.name]
+
+
+class FakeBucket:
+    """objects by name with generations, and a hook run after `get_blob`."""
+
+    def __init__(self, after_get=None):
+        self.objects: dict[str, tuple[bytes, int]] = {}
+        self.generation = 0
+        self.after_get = after_get
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        if name not in self.objects:
+            return None
+        blob = FakeBlob(self, name, self.objects[name][1])
+        if self.after_get is not None:
+            self.after_get(self, name)
+        return blob
+
+
+def test_bucket_queue_claims():
+    bucket = FakeBucket()
+    a = BucketQueue(bucket, "q", lease_seconds=0.05, owner="a")
+    b = BucketQueue(bucket, "q", owner="b")
+
+    lease = a.claim(items[0])
+    assert lease is not None and b.claim(items[0]) is None
+    time.sleep(0.1)
+    taken = b.claim(items[0])
+    assert taken is not None and taken.owner == "b"
+    assert a.renew(lease) is None
+
+    b.complete(taken)
+    assert a.is_complete(items[0]) and a.claim(items[0]) is None
+
+
+def _completed(bucket, name):
+    del bucket.objects[name]
+
+
+def _reclaimed(bucket, name):
+    FakeBlob(bucket, name).upload_from_string(b"{}")
+
+
+@pytest.mark.parametrize("race", [_completed, _reclaimed])
+def test_bucket_queue_claim_loses_race_to_read(race):
+    bucket = FakeBucket()
+    assert BucketQueue(bucket, "q", owner="a").claim(items[0]) is not None
+
+    bucket.after_get = race
+    assert BucketQueue(bucket, "q", owner="b").claim(items[0]) is None
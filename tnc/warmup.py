@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import numpy
+
+from .hspf_runner import InputTS, SimInfo, get_TNC_siminfo, run_hrus_batched
+
+# one hru per kernel; any hru of the same kind compiles the same signatures
+PRIMING_HRUS = {"pwater": "hru000", "iwater": "hru252"}
+
+
+def synthetic_inputs(days: int = 2) -> tuple[InputTS, SimInfo]:
+    """a short hourly storm with constant PET, shaped like `main.build_ts`."""
+    siminfo = get_TNC_siminfo(
+        datetime(2000, 1, 1), datetime(2000, 1, 1 + days), "warmup", "R0C0"
+    )
+    steps = siminfo["steps"]
+    precip = numpy.zeros(steps)
+    precip[steps // 4 : steps // 2] = 0.05
+    petinp = numpy.full(steps, 0.004)
+
+    return {"PREC": precip, "PETINP": petinp}, siminfo
+
+
+def warmup() -> dict[str, float]:
+    """
+    Compile (or load from numba's on-disk cache) the pwater and iwater kernels
+    in this process, through the batched njit loop that runs use. Returns the
+    seconds taken by the first call of each.
+    """
+    input_ts, siminfo = synthetic_inputs()
+    timings = {}
+    for kernel, hru in PRIMING_HRUS.items():
+        start = perf_counter()
+        (results,) = run_hrus_batched(input_ts, siminfo, [hru])
+        timings[kernel] = perf_counter() - start
+        if results[hru]["exception"]:  # pragma: no cover
+            raise RuntimeError(results[hru]["exception"])
+    return timings
+
+
+def warmup_cache_dir(cache_dir: str | Path) -> dict[str, float]:
+    """
+    Populate a numba cache directory from a fresh interpreter.
+
+    NUMBA_CACHE_DIR is only read when numba is imported, so this runs
+    `warmup` in a subprocess. Workers started with NUMBA_CACHE_DIR pointing
+    at a copy of the directory load the compiled kernels instead of
+    compiling them, provided the installed hsp2 sources are the same files,
+    e.g., when the directory is baked into the image that installed them.
+    """
+    cache_dir = Path(cache_dir).resolve()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    proc = subprocess.run(
+        [sys.executable, "-m", "tnc.warmup"],
+        env={**os.environ, "NUMBA_CACHE_DIR": str(cache_dir)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":  # pragma: no cover
+    print(json.dumps(warmup()))
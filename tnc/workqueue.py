@@ -0,0 +1,352 @@
+import hashlib
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import NamedTuple, Protocol
+
+import orjson
+
+from .config import settings
+
+
+def shard_of(item: str, count: int) -> int:
+    """stable shard number of `item` in [0, count), the same on every host."""
+    return zlib.crc32(item.encode()) % count
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """(index, count) from 'i/N' with 0 <= i < N"""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"expected a shard like '0/4', got {spec!r}") from None
+    if not 0 <= index < count:
+        raise ValueError(f"shard index must be in [0, {count}), got {index}")
+    return index, count
+
+
+def select_shard(items: list[str], index: int, count: int) -> list[str]:
+    return [item for item in items if shard_of(item, count) == index]
+
+
+class Lease(NamedTuple):
+    item: str
+    owner: str
+    expires: float
+    token: int | str | None = None  # backend detail, e.g., a blob generation
+
+
+class WorkQueue(Protocol):
+    """
+    Claims of work items shared by every node of a run.
+
+    `claim` returns a lease if no other node holds an unexpired lease on the
+    item and it is not already complete. `complete` marks the item done so no
+    node claims it again. A node that dies simply stops renewing, and its
+    items become claimable once their leases expire.
+    """
+
+    def claim(self, item: str) -> Lease | None: ...
+
+    def renew(self, lease: Lease) -> Lease | None: ...
+
+    def complete(self, lease: Lease) -> None: ...
+
+    def is_complete(self, item: str) -> bool: ...
+
+
+def _key(item: str) -> str:
+    return hashlib.sha1(item.encode()).hexdigest()
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class DirectoryQueue:
+    """
+    Work queue in a directory shared by every node, e.g., an NFS mount.
+
+    Claims are files created with O_EXCL. Taking over an expired claim first
+    needs an O_EXCL marker for that exact claim, so only one node can win it.
+    Nodes' clocks must agree to well within the lease length.
+    """
+
+    def __init__(
+        self, path: str | Path, lease_seconds: float = 900, owner: str | None = None
+    ):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.owner = owner or default_owner()
+        (self.path / "claims").mkdir(parents=True, exist_ok=True)
+        (self.path / "done").mkdir(parents=True, exist_ok=True)
+
+    def _claim_path(self, item: str) -> Path:
+        return self.path / "claims" / _key(item)
+
+    def _done_path(self, item: str) -> Path:
+        return self.path / "done" / _key(item)
+
+    def is_complete(self, item: str) -> bool:
+        return self._done_path(item).exists()
+
+    def _read(self, path: Path) -> dict | None:
+        try:
+            return orjson.loads(path.read_bytes())
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            return None
+
+    def _create(self, item: str) -> Lease | None:
+        lease = Lease(item, self.owner, time.time() + self.lease_seconds)
+        try:
+            fd = os.open(self._claim_path(item), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(lease._asdict()))
+        return lease
+
+    def _write(self, path: Path, lease: Lease) -> None:
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(lease._asdict()))
+        os.replace(tmp, path)
+
+    def _is_expired(self, path: Path, held: dict | None) -> bool:
+        if held is not None:
+            return held["expires"] <= time.time()
+        # unreadable: being written right now, or its writer died mid-write
+        try:
+            return path.stat().st_mtime + self.lease_seconds <= time.time()
+        except FileNotFoundError:
+            return False
+
+    def claim(self, item: str) -> Lease | None:
+        if self.is_complete(item):
+            return None
+        if (lease := self._create(item)) is not None:
+            return lease
+
+        path = self._claim_path(item)
+        held = self._read(path)
+        if not self._is_expired(path, held):
+            return None
+
+        # Only the node that creates the marker for this particular expired
+        # claim may replace it, and only if the claim is still the one it read.
+        marker = path.with_name(f"{path.name}.{_key(repr(held))}.takeover")
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            # a node that died mid-takeover must not block the item forever
+            if self._is_expired(marker, None):
+                marker.unlink(missing_ok=True)
+            return None
+        try:
+            if self._read(path) != held:
+                return None
+            lease = Lease(item, self.owner, time.time() + self.lease_seconds)
+            self._write(path, lease)
+            return lease
+        finally:
+            marker.unlink(missing_ok=True)
+
+    def renew(self, lease: Lease) -> Lease | None:
+        """extend a lease that has not expired yet; None if it was lost."""
+        path = self._claim_path(lease.item)
+        held = self._read(path)
+        if held != lease._asdict() or lease.expires <= time.time():
+            return None
+        renewed = lease._replace(expires=time.time() + self.lease_seconds)
+        self._write(path, renewed)
+        return renewed
+
+    def complete(self, lease: Lease) -> None:
+        """mark the item done, and drop its claim if it is still this lease."""
+        self._done_path(lease.item).write_bytes(orjson.dumps(lease._asdict()))
+        # move the claim aside atomically before checking its owner, so a
+        # claim another node took over is put back rather than deleted
+        path = self._claim_path(lease.item)
+        aside = path.with_name(f"{path.name}.{uuid.uuid4().hex}.done")
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return
+        if self._read(aside) != lease._asdict():
+            try:
+                os.link(aside, path)
+            except FileExistsError:
+                pass  # claimed again meanwhile
+        aside.unlink(missing_ok=True)
+
+
+class BucketQueue:  # pragma: no cover
+    """
+    Work queue under an object prefix, for nodes that share only the bucket.
+
+    Claims are created with `if_generation_match=0`, and expired ones are
+    deleted with a generation precondition before being recreated, so as
+    with `DirectoryQueue` only one node can win each claim.
+    """
+
+    def __init__(
+        self, bucket, prefix: str, lease_seconds: float = 900, owner: str | None = None
+    ):
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+
+        self._lost = (NotFound, PreconditionFailed)
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/")
+        self.lease_seconds = lease_seconds
+        self.owner = owner or default_owner()
+
+    def _blob(self, kind: str, item: str):
+        return self.bucket.blob(f"{self.prefix}/{kind}/{_key(item)}")
+
+    def is_complete(self, item: str) -> bool:
+        return self._blob("done", item).exists()
+
+    def _write(self, lease: Lease, generation: int) -> Lease | None:
+        blob = self._blob("claims", lease.item)
+        try:
+            blob.upload_from_string(
+                orjson.dumps(lease._replace(token=None)._asdict()),
+                content_type="application/json",
+                if_generation_match=generation,
+            )
+        except self._lost:
+            return None
+        return lease._replace(token=blob.generation)
+
+    def claim(self, item: str) -> Lease | None:
+        if self.is_complete(item):
+            return None
+        lease = Lease(item, self.owner, time.time() + self.lease_seconds)
+        if (claimed := self._write(lease, 0)) is not None:
+            return claimed
+
+        blob = self.bucket.get_blob(self._blob("claims", item).name)
+        if blob is None:
+            return self._write(lease, 0)
+        try:
+            raw = blob.download_as_bytes(if_generation_match=blob.generation)
+        except self._lost:
+            return None  # completed or claimed again meanwhile
+        held = orjson.loads(raw)
+        if held["expires"] > time.time():
+            return None
+        try:
+            blob.delete(if_generation_match=blob.generation)
+        except self._lost:
+            return None
+        return self._write(lease, 0)
+
+    def renew(self, lease: Lease) -> Lease | None:
+        renewed = lease._replace(expires=time.time() + self.lease_seconds)
+        return self._write(renewed, lease.token)
+
+    def complete(self, lease: Lease) -> None:
+        self._blob("done", lease.item).upload_from_string(
+            orjson.dumps(lease._replace(token=None)._asdict()),
+            content_type="application/json",
+        )
+        try:
+            self._blob("claims", lease.item).delete(if_generation_match=lease.token)
+        except self._lost:
+            pass
+
+
+class Heartbeat:
+    """
+    Keeps the leases of a node's in-flight items alive: a thread renews each
+    every `interval` seconds (a third of the lease by default), and `renew`
+    checks one on demand, e.g., before a long step. A lease that fails to
+    renew is lost, since another node may now hold the item, and its work
+    should be abandoned rather than uploaded or completed.
+    """
+
+    def __init__(self, queue: WorkQueue, interval: float | None = None):
+        self.queue = queue
+        if interval is None:
+            interval = getattr(queue, "lease_seconds", 900) / 3
+        self.interval = interval
+        # None marks a lost lease until the item is released
+        self._leases: dict[str, Lease | None] = {}
+        # held while renewing, so a lease is never renewed after completion
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self) -> "Heartbeat":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def claim(self, item: str) -> bool:
+        """claim `item` and keep its lease alive; whether it was claimed."""
+        lease = self.queue.claim(item)
+        if lease is not None:
+            with self._lock:
+                self._leases[item] = lease
+        return lease is not None
+
+    def _renew(self, item: str) -> bool:
+        lease = self._leases.get(item)
+        if lease is not None:
+            lease = self._leases[item] = self.queue.renew(lease)
+        return lease is not None
+
+    def renew(self, item: str) -> bool:
+        """renew the lease on `item` now; whether it is still held."""
+        with self._lock:
+            return self._renew(item)
+
+    def complete(self, item: str) -> bool:
+        """complete and release `item`; False, and not completed, if lost."""
+        with self._lock:
+            if not self._renew(item):
+                self._leases.pop(item, None)
+                return False
+            self.queue.complete(self._leases.pop(item))
+        return True
+
+    def abandon(self, item: str) -> None:
+        """stop renewing `item`; its lease lapses for another node to claim."""
+        with self._lock:
+            self._leases.pop(item, None)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                for item in list(self._leases):
+                    self._renew(item)
+
+
+def open_queue(spec: str, client=None, lease_seconds: float | None = None) -> WorkQueue:
+    """
+    A `BucketQueue` for 'gs://bucket/prefix', otherwise a `DirectoryQueue`.
+    Every node of a run must open the same spec.
+    """
+    if lease_seconds is None:
+        lease_seconds = settings.WORK_QUEUE_LEASE_SECONDS
+    if spec.startswith("gs://"):  # pragma: no cover
+        from google.cloud import storage
+
+        bucket_name, _, prefix = spec.removeprefix("gs://").partition("/")
+        bucket = storage.Bucket(client, name=bucket_name)
+        return BucketQueue(bucket, prefix or "queue", lease_seconds)
+    return DirectoryQueue(spec, lease_seconds)
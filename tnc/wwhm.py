@@ -1,8 +1,9 @@
-from datetime import datetime
 from functools import cache
 
+import numpy
 import pandas
 
+from . import bundle, shared
 from .config import settings
 
 _VALID_SOIL_TYPES = {0: "A/B", 1: "C", 2: "D"}
@@ -12,8 +13,17 @@ _VALID_SLOPE_CLASSES = {0: "flat", 1: "mod", 2: "steep"}
 
 @cache
 def get_wwhm_params_per():
+    if (table := shared.get_table("perlnd")) is not None:
+        return table
+    if (table := bundle.get_table("perlnd")) is not None:
+        return table
+    return read_wwhm_params_per(settings.PERLND)
+
+
+def read_wwhm_params_per(path) -> pandas.DataFrame:
+    """pervious hru parameters from the WWHM csv, indexed by hru code."""
     wwhm_params_per = (
-        pandas.read_csv(settings.PERLND, index_col=0)
+        pandas.read_csv(path, index_col=0)
         .reset_index()
         .assign(index=lambda df: df["index"].str.replace(" ", "").str.strip())
     )
@@ -46,8 +56,17 @@ def get_wwhm_params_per():
 
 @cache
 def get_wwhm_params_imp():
+    if (table := shared.get_table("implnd")) is not None:
+        return table
+    if (table := bundle.get_table("implnd")) is not None:
+        return table
+    return read_wwhm_params_imp(settings.IMPLND)
+
+
+def read_wwhm_params_imp(path) -> pandas.DataFrame:
+    """impervious hru parameters from the WWHM csv, indexed by hru code."""
     wwhm_params_imp = (
-        pandas.read_csv(settings.IMPLND, index_col=0)
+        pandas.read_csv(path, index_col=0)
         .reset_index()
         .assign(index=lambda df: df["index"].str.replace(" ", "").str.strip())
     )
@@ -82,41 +101,54 @@ def wwhm_hru_params() -> dict[str, dict[str, int | float]]:
     hru_params = {}
 
     for df in [wwhm_params_imp, wwhm_params_per]:
-        hrus = df.index
-        for hru in hrus:
-            hru_params[hru] = df.loc[hru].to_dict()
+        columns = list(df.columns)
+        # one float conversion per table rather than a row lookup per hru
+        for hru, row in zip(
+            df.index, df.to_numpy(dtype=numpy.float64).tolist(), strict=False
+        ):
+            hru_params[hru] = dict(zip(columns, row, strict=False))
 
     return hru_params
 
 
-@cache
-def get_temp_evap(start, end):  # pragma: no cover
-    et_factor = 1
+def wwhm_param_matrix(hrus: list[str]) -> tuple[list[str], numpy.ndarray]:
+    """
+    Parameter matrix (hrus x params) for a group of same-kind hrus, i.e.,
+    all pervious or all impervious, along with its column names.
+    """
+    imp = {hru[-2:-1] == "5" for hru in hrus}
+    if len(imp) > 1:
+        raise ValueError("cannot mix pervious and impervious hrus in one matrix.")
+
+    df = get_wwhm_params_imp() if imp.pop() else get_wwhm_params_per()
+    params = df.loc[hrus]
+
+    return list(params.columns), params.to_numpy(dtype=numpy.float64)
 
-    nyears = (end.year + 1) - (start.year - 1) + 1
 
-    _wwhm_evap = (
+@cache
+def load_temp_evap_monthly() -> numpy.ndarray:
+    """mean daily evap (in/day) for each month, indexed 0-11."""
+    monthly = (
         pandas.read_csv(settings.TEMP_EVAP, sep=r"\s+", parse_dates=["Date"])
         .assign(Month=lambda df: df["Date"].dt.month)
-        .groupby("Month")[["1-in"]]
+        .groupby("Month")["1-in"]
         .mean()
+        .reindex(range(1, 13))
     )
+    return monthly.to_numpy()
 
-    wwhm_evap = (
-        pandas.concat([_wwhm_evap] * nyears, ignore_index=True)[["1-in"]]
-        .assign(
-            datetime=pandas.date_range(
-                start=datetime(start.year - 1, 1, 1), periods=12 * (nyears), freq="ME"
-            )
-        )
-        .set_index("datetime")["1-in"]
-        .resample("1D")
-        .bfill()  # Convert from monthly to daily frequency
-        .resample("1h")
-        .ffill()  # Convert from daily to hourly frequency
-        .loc[start:end]
-        .div(24)
-        .mul(et_factor)  # Convert from units of in/day to in/hr and apply et factor
+
+@cache
+def get_temp_evap(start, end):  # pragma: no cover
+    et_factor = 1
+
+    index = pandas.date_range(
+        pandas.Timestamp(start).ceil("h"), end, freq="h", name="datetime"
     )
+    monthly = load_temp_evap_monthly()
+
+    # each hour takes its month's mean; in/day to in/hr and apply et factor
+    values = monthly[index.month.to_numpy() - 1] / 24 * et_factor
 
-    return wwhm_evap
+    return pandas.Series(values, index=index, name="1-in")